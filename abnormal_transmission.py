@@ -1,224 +1,37 @@
 import json
 import time
-import threading
 import logging
-from config import node_num, server_ip, abnormal_scenario, OUTPUT_STORE_PATH, TRANSMISSION_DELAY_MS, DELAY_VARIANCE_MS
-from typing import List
+from typing import Any, Dict
 import os
-import paramiko
 from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
-
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
-
-
-def get_network_interface(node_idx: int) -> str:
-    """
-    获取指定节点的网络接口名称
-    
-    参数:
-        node_idx: 节点索引
-    
-    返回:
-        网络接口名称（如eth0, ens3等）
-    """
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server_ip[node_idx], username="ubuntu", password="Dwf12345")
-        
-        # 获取默认路由的网络接口
-        stdin, stdout, stderr = ssh.exec_command("ip route get 8.8.8.8 | awk '{for(i=1;i<=NF;i++) if($i==\"dev\") print $(i+1)}' | head -1")
-        interface = stdout.read().decode().strip()
-        
-        if not interface:
-            # 备用方案：获取第一个非lo接口
-            stdin, stdout, stderr = ssh.exec_command("ip link show | grep -E '^[0-9]+: [^l][^o]' | head -1 | cut -d: -f2 | tr -d ' '")
-            interface = stdout.read().decode().strip()
-        
-        logging.info(f"节点 {node_idx} 的网络接口: {interface}")
-        return interface
-        
-    except Exception as e:
-        logging.error(f"获取节点 {node_idx} 网络接口失败: {e}")
-        return "eth0"  # 默认接口名
-    finally:
-        if 'ssh' in locals():
-            ssh.close()
-
-
-def apply_transmission_delay(node_idx: int, delay_ms: int, variance_ms: int = 0) -> bool:
-    """
-    在指定节点上应用传输延迟
-    
-    参数:
-        node_idx: 节点索引
-        delay_ms: 延迟时间（毫秒）
-        variance_ms: 延迟变化范围（毫秒）
-    
-    返回:
-        bool: 操作是否成功
-    """
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server_ip[node_idx], username="ubuntu", password="Dwf12345")
-        
-        # 获取网络接口
-        interface = get_network_interface(node_idx)
-        
-        # 构建tc命令
-        if variance_ms > 0:
-            tc_command = f"sudo tc qdisc add dev {interface} root netem delay {delay_ms}ms {variance_ms}ms"
-        else:
-            tc_command = f"sudo tc qdisc add dev {interface} root netem delay {delay_ms}ms"
-        
-        # 执行tc命令添加延迟
-        stdin, stdout, stderr = ssh.exec_command(tc_command)
-        exit_status = stdout.channel.recv_exit_status()
-        
-        if exit_status == 0:
-            logging.info(f"节点 {node_idx} ({server_ip[node_idx]}) 已添加传输延迟: {delay_ms}ms ±{variance_ms}ms")
-            return True
-        else:
-            error_output = stderr.read().decode()
-            logging.error(f"节点 {node_idx} 添加传输延迟失败: {error_output}")
-            return False
-        
-    except Exception as e:
-        logging.error(f"节点 {node_idx} 添加传输延迟时出错: {e}")
-        return False
-    finally:
-        if 'ssh' in locals():
-            ssh.close()
-
-
-def remove_transmission_delay(node_idx: int) -> bool:
-    """
-    移除指定节点的传输延迟
-    
-    参数:
-        node_idx: 节点索引
-    
-    返回:
-        bool: 操作是否成功
-    """
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server_ip[node_idx], username="ubuntu", password="Dwf12345")
-        
-        # 获取网络接口
-        interface = get_network_interface(node_idx)
-        
-        # 删除tc规则
-        tc_command = f"sudo tc qdisc del dev {interface} root"
-        stdin, stdout, stderr = ssh.exec_command(tc_command)
-        exit_status = stdout.channel.recv_exit_status()
-        
-        if exit_status == 0:
-            logging.info(f"节点 {node_idx} ({server_ip[node_idx]}) 的传输延迟已移除")
-            return True
-        else:
-            # 可能没有规则可删除，这通常不是错误
-            logging.info(f"节点 {node_idx} ({server_ip[node_idx]}) 没有需要删除的传输延迟规则")
-            return True
-        
-    except Exception as e:
-        logging.error(f"节点 {node_idx} 移除传输延迟时出错: {e}")
-        return False
-    finally:
-        if 'ssh' in locals():
-            ssh.close()
-
-
-def apply_transmission_delay_to_all_nodes(delay_ms: int, variance_ms: int = 0):
-    """
-    为所有节点应用传输延迟
-    
-    参数:
-        delay_ms: 延迟时间（毫秒）
-        variance_ms: 延迟变化范围（毫秒）
-    """
-    logging.info(f"\n【开始应用传输延迟】延迟: {delay_ms}ms ±{variance_ms}ms")
-    
-    # 并行为所有节点添加延迟
-    threads = []
-    results = [False] * node_num
-    
-    def apply_delay_thread(idx):
-        results[idx] = apply_transmission_delay(idx, delay_ms, variance_ms)
-    
-    for idx in range(node_num):
-        t = threading.Thread(target=apply_delay_thread, args=(idx,))
-        threads.append(t)
-        t.start()
-    
-    # 等待所有操作完成
-    for t in threads:
-        t.join()
-    
-    success_count = sum(results)
-    if success_count == node_num:
-        logging.info(f"【传输延迟应用完成】成功为所有 {node_num} 个节点添加传输延迟")
-    else:
-        logging.warning(f"【传输延迟应用部分完成】成功: {success_count}/{node_num} 个节点")
-
-
-def remove_transmission_delay_from_all_nodes():
-    """
-    移除所有节点的传输延迟
-    """
-    logging.info("\n【开始移除传输延迟】")
-    
-    # 并行移除所有节点的延迟
-    threads = []
-    results = [False] * node_num
-    
-    def remove_delay_thread(idx):
-        results[idx] = remove_transmission_delay(idx)
-    
-    for idx in range(node_num):
-        t = threading.Thread(target=remove_delay_thread, args=(idx,))
-        threads.append(t)
-        t.start()
-    
-    # 等待所有操作完成
-    for t in threads:
-        t.join()
-    
-    success_count = sum(results)
-    if success_count == node_num:
-        logging.info(f"【传输延迟移除完成】成功移除所有 {node_num} 个节点的传输延迟")
-    else:
-        logging.warning(f"【传输延迟移除部分完成】成功: {success_count}/{node_num} 个节点")
+from netem_tools import (expand_impairment_sweep, describe_impairment, apply_scoped_impairment,
+                         remove_impairment_from_nodes)
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
 
 
+@with_run_context
 def abnormal_transmission_scenario(bat_path: str = "test.bat", 
                                  test_result_file_path: str = "test_result.txt",
                                  storing_path: str = "single_run_results") -> None:
     """
-    运行单次传输时间异常场景
+    运行传输异常场景，配置了 NETWORK_IMPAIRMENT_SWEEP 时对每个损伤参数组合各运行一次
     
     参数:
         bat_path: 测试脚本路径
         test_result_file_path: 单次测试结果文件路径
         storing_path: 结果输出路径
+    
+    返回:
+        单个参数组合时返回该次实验结果，扫描多个组合时返回结果列表
     """
     current_time = int(time.time())
-    output_store_path = f"{storing_path}\\result_{abnormal_scenario}_{current_time}\\single_run.json"
+    impairments = expand_impairment_sweep()
     
     logging.info(f"\n{'='*80}")
-    logging.info(f"开始单次传输时间异常场景实验")
-    logging.info(f"传输延迟配置: {TRANSMISSION_DELAY_MS}ms ±{DELAY_VARIANCE_MS}ms")
+    logging.info(f"开始传输异常场景实验，共 {len(impairments)} 组网络损伤参数")
+    for impairment in impairments:
+        logging.info(f"  {describe_impairment(impairment)}")
     logging.info(f"{'='*80}")
     
     # 修改DB_SWITCH配置
@@ -227,37 +40,54 @@ def abnormal_transmission_scenario(bat_path: str = "test.bat",
         logging.error("❌ 修改DB_SWITCH失败，实验终止")
         return None
     
-    # 调用传输时间异常场景函数
-    exp_result = abnormal_transmission_single_run(
-        bat_path=bat_path,
-        test_result_file_path=test_result_file_path,
-        output_store_path=output_store_path
-    )
+    sweep_results = []
+    for point_idx, impairment in enumerate(impairments):
+        if len(impairments) == 1:
+            output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
+        else:
+            output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}_{point_idx}\\single_run.json"
+            logging.info(f"\n【参数扫描 {point_idx + 1}/{len(impairments)}】{describe_impairment(impairment)}")
+        
+        # 调用传输时间异常场景函数
+        exp_result = abnormal_transmission_single_run(
+            bat_path=bat_path,
+            test_result_file_path=test_result_file_path,
+            output_store_path=output_store_path,
+            impairment=impairment
+        )
+        sweep_results.append(exp_result)
+        logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
     
-    logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
-    return exp_result
+    return sweep_results[0] if len(sweep_results) == 1 else sweep_results
 
 
-def abnormal_transmission_single_run(bat_path, test_result_file_path, output_store_path):
+def abnormal_transmission_single_run(bat_path, test_result_file_path, output_store_path,
+                                     impairment: Dict[str, Any] = None):
     """
-    单次传输时间异常场景主函数：清理→启动→等待20分钟→异常测试(期间进行传输延迟)→结果存储→停止系统
+    单次传输时间异常场景主函数：清理→启动→等待20分钟→异常测试(期间施加网络损伤)→结果存储→停止系统
     
     参数：
         bat_path: str - 测试用bat文件的完整路径
         test_result_file_path: str - 单次测试结果文件的完整路径
         output_store_path: str - 最终测试结果集合的存储路径
+        impairment: dict - 网络损伤参数，默认取config配置
     
     返回：
         dict - 异常测试的结果集合（含状态信息）
     """
+    if impairment is None:
+        impairment = expand_impairment_sweep()[0]
+    impairment_desc = describe_impairment(impairment)
+    
     # 初始化测试结果集合
     all_test_results = {
         "scenario_name": "abnormal_transmission_single_run",
         "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
-        "node_count": node_num,
-        "server_ips": server_ip,
-        "transmission_delay_ms": TRANSMISSION_DELAY_MS,
-        "delay_variance_ms": DELAY_VARIANCE_MS,
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "transmission_delay_ms": impairment.get("delay_ms", 0),
+        "delay_variance_ms": impairment.get("jitter_ms", 0),
+        "network_impairment": impairment,
         "test_results": [],
         "end_time": "",
         "status": "running"
@@ -267,23 +97,26 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
         # -------------------------- 1. 清理所有节点 --------------------------
         logging.info("【步骤1/5】清理所有节点...")
         clean_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             clean_threads.append(t)
 
         time.sleep(10)
         logging.info("【步骤1/5】所有节点清理完成")
 
-        # 同时移除所有节点的传输延迟（预防性清理）
-        logging.info("【步骤1/5】预防性移除传输延迟...")
-        remove_transmission_delay_from_all_nodes()
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # 同时移除所有节点的网络损伤（预防性清理）
+        logging.info("【步骤1/5】预防性移除网络损伤...")
+        remove_impairment_from_nodes()
 
         # -------------------------- 2. 启动所有ConfigNode --------------------------
         logging.info("\n【步骤2/5】启动所有ConfigNode...")
         config_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startConfigNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
             t.start()
             config_threads.append(t)
         time.sleep(60)
@@ -292,8 +125,8 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
         # -------------------------- 3. 启动所有DataNode --------------------------
         logging.info("\n【步骤3/5】启动所有DataNode...")
         data_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startDataNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
             t.start()
             data_threads.append(t)
         time.sleep(60)
@@ -304,27 +137,30 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
         start_monitoring_system()
         logging.info("【步骤4/5】节点监控系统启动完成")
 
-        # -------------------------- 5. 异常测试：等待20分钟后开始，期间进行传输延迟 --------------------------
-        logging.info("\n【步骤5/5】等待20分钟后开始异常测试（期间进行传输延迟操作）...")
-        time.sleep(20 * 60)  # 等待20分钟
+        # -------------------------- 5. 异常测试：等待20分钟后开始，期间施加网络损伤 --------------------------
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间进行网络损伤操作）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
         
-        # 创建异步执行传输延迟操作的线程
+        # 记录实际生效的损伤范围（整块网卡或节点间链路）
+        applied_scope = {}
+        
+        # 创建异步执行网络损伤操作的线程
         def transmission_delay_operation():
-            logging.info(f"等待10分钟后应用传输延迟（{TRANSMISSION_DELAY_MS}ms ±{DELAY_VARIANCE_MS}ms）...")
+            logging.info(f"等待10分钟后施加网络损伤（{impairment_desc}）...")
             time.sleep(10 * 60)  # 等待10分钟
             
-            logging.info("开始应用传输延迟...")
-            apply_transmission_delay_to_all_nodes(TRANSMISSION_DELAY_MS, DELAY_VARIANCE_MS)
+            logging.info("开始施加网络损伤...")
+            applied_scope.update(apply_scoped_impairment(list(range(ctx.node_num)), impairment))
             
-            logging.info("等待15分钟后移除传输延迟...")
+            logging.info("等待15分钟后移除网络损伤...")
             time.sleep(15 * 60)  # 等待15分钟
             
-            logging.info("开始移除传输延迟...")
-            remove_transmission_delay_from_all_nodes()
-            logging.info("传输延迟操作完成")
+            logging.info("开始移除网络损伤...")
+            remove_impairment_from_nodes()
+            logging.info("网络损伤操作完成")
         
-        # 启动传输延迟操作线程
-        operation_thread = threading.Thread(target=transmission_delay_operation)
+        # 启动网络损伤操作线程
+        operation_thread = ContextThread(target=transmission_delay_operation)
         operation_thread.start()
         
         # 同时开始异常测试
@@ -334,14 +170,16 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
             result_file_path=test_result_file_path
         )
         abnormal_test["test_phase"] = "abnormal"
-        abnormal_test["phase_description"] = f"传输时间异常测试（异常状态 - 延迟: {TRANSMISSION_DELAY_MS}ms ±{DELAY_VARIANCE_MS}ms）"
-        abnormal_test["transmission_delay_ms"] = TRANSMISSION_DELAY_MS
-        abnormal_test["delay_variance_ms"] = DELAY_VARIANCE_MS
+        abnormal_test["phase_description"] = f"传输异常测试（异常状态 - 网络损伤: {impairment_desc}）"
+        abnormal_test["transmission_delay_ms"] = impairment.get("delay_ms", 0)
+        abnormal_test["delay_variance_ms"] = impairment.get("jitter_ms", 0)
+        abnormal_test["network_impairment"] = impairment
         all_test_results["test_results"].append(abnormal_test)
         
-        # 等待传输延迟操作完成
+        # 等待网络损伤操作完成
         operation_thread.join()
-        logging.info("【步骤5/5】异常测试和传输延迟操作均完成")
+        abnormal_test["impairment_scope"] = applied_scope
+        logging.info("【步骤5/5】异常测试和网络损伤操作均完成")
 
         # -------------------------- 6. 更新场景状态，存储结果 --------------------------
         all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -361,11 +199,11 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
         all_test_results["status"] = "failed"
         all_test_results["error_msg"] = error_msg
         
-        # 异常情况下也要移除传输延迟
+        # 异常情况下也要移除网络损伤
         try:
-            remove_transmission_delay_from_all_nodes()
+            remove_impairment_from_nodes()
         except Exception as restore_error:
-            logging.warning(f"⚠️ 移除传输延迟时出错: {restore_error}")
+            logging.warning(f"⚠️ 移除网络损伤时出错: {restore_error}")
         
         # 存储异常状态下的结果
         os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
@@ -374,17 +212,19 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
         logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
 
     finally:
-        # 最终清理：确保传输延迟移除并停止所有节点
+        # 最终清理：确保网络损伤移除并停止所有节点
         try:
-            logging.info("\n【最终步骤】确保传输延迟移除...")
-            remove_transmission_delay_from_all_nodes()
+            logging.info("\n【最终步骤】确保网络损伤移除...")
+            remove_impairment_from_nodes()
         except Exception as e:
-            logging.warning(f"⚠️ 最终移除传输延迟时出错: {e}")
+            logging.warning(f"⚠️ 最终移除网络损伤时出错: {e}")
         
+        restore_dataset_properties()
+
         logging.info("【最终步骤】停止所有节点...")
         stop_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             stop_threads.append(t)
         time.sleep(10)
@@ -394,4 +234,6 @@ def abnormal_transmission_single_run(bat_path, test_result_file_path, output_sto
 
 
 if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
     abnormal_transmission_scenario()
@@ -1,23 +1,12 @@
 import json
 import time
-import threading
 import logging
-from config import node_num, server_ip, abnormal_scenario, OUTPUT_STORE_PATH
-from typing import List
+from typing import Any, Dict, List
 import os
-import paramiko
 from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
-
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
+from partition_tools import build_block_map, apply_partition_rules, remove_partition_rules, resolve_partition_spec
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
 
 
 def create_asymmetric_network_partition_groups(node_count: int) -> tuple:
@@ -59,123 +48,46 @@ def create_asymmetric_network_partition_groups(node_count: int) -> tuple:
     return group1, group2, bridge_nodes
 
 
-def apply_asymmetric_network_partition(group1: List[int], group2: List[int], bridge_nodes: tuple):
+def apply_asymmetric_network_partition(group1: List[int], group2: List[int], bridge_nodes: tuple,
+                                       spec: Dict[str, Any] = None):
     """
-    应用非对称式网络分区：使用iptables阻断两组节点间的通信，但保持桥接节点间的连接
+    应用非对称式网络分区：阻断两组节点间的通信，但保持桥接节点间的连接
     
     参数:
         group1: 第一组节点索引
         group2: 第二组节点索引  
         bridge_nodes: 桥接节点对 (node1, node2)
+        spec: 分区规则作用范围（方向/协议/端口），默认取config配置
     """
     logging.info("\n【开始应用非对称式网络分区】")
+    logging.info(f"双向阻断 Group1 {group1} 与 Group2 {group2} 之间的通信（保留桥接连接）...")
     
-    def block_communication_except_bridge(from_nodes: List[int], to_nodes: List[int], bridge_pair: tuple):
-        """阻断from_nodes到to_nodes的通信，但保留桥接节点间的连接"""
-        threads = []
-        bridge_node1, bridge_node2 = bridge_pair
-        
+    bridge_node1, bridge_node2 = bridge_nodes
+    blocked_pairs = []
+    for from_nodes, to_nodes in ((group1, group2), (group2, group1)):
         for from_idx in from_nodes:
             for to_idx in to_nodes:
-                if from_idx != to_idx:
-                    # 如果是桥接节点间的通信，跳过不阻断
-                    if (from_idx == bridge_node1 and to_idx == bridge_node2) or \
-                       (from_idx == bridge_node2 and to_idx == bridge_node1):
-                        logging.info(f"保持桥接连接：节点{from_idx} <-> 节点{to_idx}")
-                        continue
-                    
-                    t = threading.Thread(
-                        target=_block_node_communication,
-                        args=(from_idx, server_ip[to_idx])
-                    )
-                    threads.append(t)
-                    t.start()
-        
-        # 等待所有阻断操作完成
-        for t in threads:
-            t.join()
-    
-    # 双向阻断通信（除了桥接连接）
-    logging.info(f"阻断 Group1 {group1} 到 Group2 {group2} 的通信（保留桥接连接）...")
-    block_communication_except_bridge(group1, group2, bridge_nodes)
+                # 如果是桥接节点间的通信，跳过不阻断
+                if {from_idx, to_idx} == {bridge_node1, bridge_node2}:
+                    continue
+                blocked_pairs.append((from_idx, to_idx))
+    logging.info(f"保持桥接连接：节点{bridge_node1} <-> 节点{bridge_node2}")
     
-    logging.info(f"阻断 Group2 {group2} 到 Group1 {group1} 的通信（保留桥接连接）...")
-    block_communication_except_bridge(group2, group1, bridge_nodes)
+    apply_partition_rules(build_block_map(blocked_pairs), spec)
     
     logging.info("【非对称式网络分区应用完成】两组节点间通信已部分阻断，桥接连接保持")
 
 
-def _block_node_communication(node_idx: int, target_ip: str):
-    """
-    在指定节点上阻断到目标IP的通信
-    
-    参数:
-        node_idx: 源节点索引
-        target_ip: 目标节点IP
-    """
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server_ip[node_idx], username="ubuntu", password="Dwf12345")
-        
-        # 使用iptables阻断到目标IP的通信
-        block_command = f"sudo iptables -A OUTPUT -d {target_ip} -j DROP"
-        stdin, stdout, stderr = ssh.exec_command(block_command, get_pty=True)
-        
-        # 等待命令执行完成
-        stdout.channel.recv_exit_status()
-        
-        logging.info(f"节点 {node_idx} ({server_ip[node_idx]}) 已阻断到 {target_ip} 的通信")
-        
-    except Exception as e:
-        logging.error(f"节点 {node_idx} 阻断通信时出错: {e}")
-    finally:
-        if 'ssh' in locals():
-            ssh.close()
-
-
 def restore_network_connectivity():
     """
-    恢复网络连接：清空所有节点的iptables规则
+    恢复网络连接：删除所有节点上由本工具创建的分区专用链
     """
     logging.info("\n【开始恢复网络连接】")
-    
-    def clear_node_iptables(node_idx: int):
-        """清空指定节点的iptables规则"""
-        try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[node_idx], username="ubuntu", password="Dwf12345")
-            
-            # 清空iptables OUTPUT链的规则
-            clear_command = "sudo iptables -F OUTPUT"
-            stdin, stdout, stderr = ssh.exec_command(clear_command, get_pty=True)
-            
-            # 等待命令执行完成
-            stdout.channel.recv_exit_status()
-            
-            logging.info(f"节点 {node_idx} ({server_ip[node_idx]}) 的iptables规则已清空")
-            
-        except Exception as e:
-            logging.error(f"节点 {node_idx} 恢复网络连接时出错: {e}")
-        finally:
-            if 'ssh' in locals():
-                ssh.close()
-    
-    # 并行恢复所有节点的网络连接
-    threads = []
-    for idx in range(node_num):
-        t = threading.Thread(target=clear_node_iptables, args=(idx,))
-        threads.append(t)
-        t.start()
-    
-    # 等待所有恢复操作完成
-    for t in threads:
-        t.join()
-    
-    logging.info("【网络连接恢复完成】所有节点的iptables规则已清空")
+    remove_partition_rules()
+    logging.info("【网络连接恢复完成】所有节点的分区规则已清除")
 
 
+@with_run_context
 def asymmetric_network_partition_scenario(bat_path: str = "test.bat", 
                                         test_result_file_path: str = "test_result.txt",
                                         storing_path: str = "single_run_results") -> None:
@@ -188,7 +100,7 @@ def asymmetric_network_partition_scenario(bat_path: str = "test.bat",
         storing_path: 结果输出路径
     """
     current_time = int(time.time())
-    output_store_path = f"{storing_path}\\result_{abnormal_scenario}_{current_time}\\single_run.json"
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
     
     logging.info(f"\n{'='*80}")
     logging.info(f"开始单次非对称式网络分区场景实验")
@@ -227,8 +139,8 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
     all_test_results = {
         "scenario_name": "asymmetric_network_partition_single_run",
         "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
-        "node_count": node_num,
-        "server_ips": server_ip,
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
         "test_results": [],
         "end_time": "",
         "status": "running"
@@ -236,11 +148,12 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
 
     try:
         # 验证节点数量>=3
-        if node_num < 3:
-            raise ValueError(f"节点数量 {node_num} 小于3，无法进行非对称式网络分区")
+        if ctx.node_num < 3:
+            raise ValueError(f"节点数量 {ctx.node_num} 小于3，无法进行非对称式网络分区")
         
         # 创建节点分组
-        group1, group2, bridge_nodes = create_asymmetric_network_partition_groups(node_num)
+        group1, group2, bridge_nodes = create_asymmetric_network_partition_groups(ctx.node_num)
+        partition_spec = resolve_partition_spec()
         all_test_results["group1"] = group1
         all_test_results["group2"] = group2
         all_test_results["bridge_nodes"] = bridge_nodes
@@ -248,14 +161,17 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         # -------------------------- 1. 清理所有节点 --------------------------
         logging.info("【步骤1/5】清理所有节点...")
         clean_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             clean_threads.append(t)
 
         time.sleep(10)
         logging.info("【步骤1/5】所有节点清理完成")
 
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
         # 同时清空所有节点的iptables规则（预防性清理）
         logging.info("【步骤1/5】预防性清理iptables规则...")
         restore_network_connectivity()
@@ -263,8 +179,8 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         # -------------------------- 2. 启动所有ConfigNode --------------------------
         logging.info("\n【步骤2/5】启动所有ConfigNode...")
         config_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startConfigNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
             t.start()
             config_threads.append(t)
         time.sleep(60)
@@ -273,8 +189,8 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         # -------------------------- 3. 启动所有DataNode --------------------------
         logging.info("\n【步骤3/5】启动所有DataNode...")
         data_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startDataNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
             t.start()
             data_threads.append(t)
         time.sleep(60)
@@ -286,8 +202,8 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         logging.info("【步骤4/5】节点监控系统启动完成")
 
         # -------------------------- 5. 异常测试：等待20分钟后开始，期间进行网络分区操作 --------------------------
-        logging.info("\n【步骤5/5】等待20分钟后开始异常测试（期间进行非对称式网络分区操作）...")
-        time.sleep(20 * 60)  # 等待20分钟
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间进行非对称式网络分区操作）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
         
         # 创建异步执行网络分区操作的线程
         def network_partition_operation():
@@ -295,7 +211,7 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
             time.sleep(10 * 60)  # 等待10分钟
             
             logging.info("开始应用非对称式网络分区...")
-            apply_asymmetric_network_partition(group1, group2, bridge_nodes)
+            apply_asymmetric_network_partition(group1, group2, bridge_nodes, partition_spec)
             
             logging.info("等待15分钟后恢复网络连接...")
             time.sleep(15 * 60)  # 等待15分钟
@@ -305,7 +221,7 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
             logging.info("非对称式网络分区操作完成")
         
         # 启动网络分区操作线程
-        operation_thread = threading.Thread(target=network_partition_operation)
+        operation_thread = ContextThread(target=network_partition_operation)
         operation_thread.start()
         
         # 同时开始异常测试
@@ -318,6 +234,7 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         abnormal_test["phase_description"] = f"非对称式网络分区测试（异常状态 - Group1:{group1} vs Group2:{group2}，桥接:{bridge_nodes}）"
         abnormal_test["partition_groups"] = {"group1": group1, "group2": group2}
         abnormal_test["bridge_nodes"] = bridge_nodes
+        abnormal_test["partition_spec"] = partition_spec
         all_test_results["test_results"].append(abnormal_test)
         
         # 等待网络分区操作完成
@@ -362,10 +279,12 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
         except Exception as e:
             logging.warning(f"⚠️ 最终网络恢复时出错: {e}")
         
+        restore_dataset_properties()
+
         logging.info("【最终步骤】停止所有节点...")
         stop_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             stop_threads.append(t)
         time.sleep(10)
@@ -375,4 +294,6 @@ def asymmetric_network_partition_single_run(bat_path, test_result_file_path, out
 
 
 if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
     asymmetric_network_partition_scenario()
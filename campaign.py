@@ -0,0 +1,328 @@
+import importlib
+import json
+import math
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+from tools import parse_result_matrix, parse_latency_matrix
+from run_manifest import record_event
+from cluster_pool import get_cluster_pool, run_on_cluster
+from harness_trace import span, traced
+from run_context import ctx, ContextThread, RunContext, override_context, install_context_log_filter
+
+# 双侧 t 分布临界值（自由度 1-30），自由度更大时使用正态分布临界值
+_T_CRITICAL = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+           1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+           1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750],
+}
+_Z_CRITICAL = {0.90: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+# 默认跟踪的关键指标：写入吞吐、写入P99延迟、滚动故障中最慢的恢复时间
+DEFAULT_CAMPAIGN_METRICS = ["INGESTION.throughput", "INGESTION.P99", "recovery_seconds"]
+
+
+def t_critical(df: int, confidence: float = 0.95) -> float:
+    """双侧 t 分布临界值，confidence 取 0.90 / 0.95 / 0.99"""
+    if confidence not in _T_CRITICAL:
+        raise ValueError(f"不支持的置信度: {confidence}，可选值: {sorted(_T_CRITICAL)}")
+    if df < 1:
+        return math.inf
+    table = _T_CRITICAL[confidence]
+    return table[df - 1] if df <= len(table) else _Z_CRITICAL[confidence]
+
+
+def confidence_interval(samples: Sequence[float], confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    计算样本均值的 t 置信区间
+
+    返回:
+        dict: n / mean / stdev / half_width / rel_half_width（半宽相对均值），样本数不足2时半宽为None
+    """
+    n = len(samples)
+    if n == 0:
+        return {"n": 0, "mean": None, "stdev": None, "half_width": None, "rel_half_width": None}
+    mean = sum(samples) / n
+    if n < 2:
+        return {"n": n, "mean": round(mean, 3), "stdev": None, "half_width": None, "rel_half_width": None}
+    stdev = math.sqrt(sum((x - mean) ** 2 for x in samples) / (n - 1))
+    half_width = t_critical(n - 1, confidence) * stdev / math.sqrt(n)
+    if mean:
+        rel = half_width / abs(mean)
+    else:
+        rel = 0.0 if half_width == 0 else math.inf
+    return {"n": n, "mean": round(mean, 3), "stdev": round(stdev, 3),
+            "half_width": round(half_width, 3), "rel_half_width": round(rel, 4)}
+
+
+def _pick_test_result(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """取一次场景结果中用于统计的benchmark结果：查询降级取故障阶段，其余取第一个非数据写入阶段"""
+    tests = [t for t in (result.get("test_results") or []) if t]
+    for test in tests:
+        if test.get("test_phase") == "fault":
+            return test
+    for test in tests:
+        if test.get("test_phase") != "preload":
+            return test
+    return None
+
+
+def extract_run_metrics(result: Dict[str, Any], metrics: Sequence[str]) -> Dict[str, float]:
+    """
+    从一次场景结果中提取关键指标
+
+    参数:
+        result: 场景 single_run 返回的结果字典
+        metrics: 指标名列表；"操作.字段" 取 Result/Latency Matrix 中对应操作的字段（如 INGESTION.throughput、
+                 TIME_RANGE.P99），recovery_seconds 取滚动故障各波次中最慢的恢复时间
+
+    返回:
+        dict: {指标名: 数值}，结果中没有的指标不出现
+    """
+    values = {}
+    test = _pick_test_result(result) or {}
+    throughput = parse_result_matrix(test["result_matrix"]) if test.get("result_matrix") else {}
+    latency = parse_latency_matrix(test["latency_matrix"]) if test.get("latency_matrix") else {}
+    for metric in metrics:
+        if metric == "recovery_seconds":
+            recoveries = [w["recovery_seconds"] for w in (result.get("waves") or [])
+                          if w.get("recovery_seconds") is not None]
+            if recoveries:
+                values[metric] = max(recoveries)
+            continue
+        op, _, field = metric.partition(".")
+        source = throughput.get(op, {}) if field in throughput.get(op, {}) else latency.get(op, {})
+        if field in source:
+            values[metric] = source[field]
+    return values
+
+
+def get_campaign_cells() -> List[Dict[str, Any]]:
+    """
+    返回config中的 CAMPAIGN_CELLS，每个单元为 {"name", "scenario", "config": {配置项: 取值}, "metrics": [...]}
+
+    name 默认为场景名加序号，metrics 默认为 CAMPAIGN_METRICS
+    """
+    cells = []
+    for idx, cell in enumerate(ctx.get("CAMPAIGN_CELLS", None) or []):
+        cells.append({
+            "name": cell.get("name") or f"{cell['scenario']}_{idx}",
+            "scenario": cell["scenario"],
+            "config": dict(cell.get("config") or {}),
+            "metrics": list(cell.get("metrics") or ctx.get("CAMPAIGN_METRICS", None)
+                            or DEFAULT_CAMPAIGN_METRICS),
+        })
+    names = [cell["name"] for cell in cells]
+    if len(set(names)) != len(names):
+        raise ValueError(f"CAMPAIGN_CELLS 中存在重复的单元名称: {names}")
+    return cells
+
+
+def get_scenario_function(scenario: str):
+    """按命名约定找到场景入口：模块 {scenario}.py 中的 {scenario}_scenario"""
+    module = importlib.import_module(scenario)
+    return getattr(module, f"{scenario}_scenario")
+
+
+def run_cell_once(cell: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    在当前运行上下文加上单元配置派生的上下文中运行一次实验单元
+
+    返回:
+        dict: 场景结果；扫描类场景返回多组结果时只取第一组
+    """
+    with override_context(cell["config"]), span(cell["scenario"], "scenario", cell=cell["name"]):
+        result = get_scenario_function(cell["scenario"])(ctx.INPUT_BAT_PATH, ctx.INPUT_TEST_RESULT_PATH,
+                                                         ctx.OUTPUT_STORE_PATH)
+    if isinstance(result, list):
+        logging.warning(f"⚠️ 单元 {cell['name']} 返回了 {len(result)} 组扫描结果，只统计第一组；"
+                        f"请在单元配置中把扫描参数固定为一组")
+        result = result[0] if result else None
+    return result or {}
+
+
+@traced("aggregate")
+def summarize_cell(cell_state: Dict[str, Any], confidence: float, target: float) -> Dict[str, Any]:
+    """计算单元各指标的置信区间，并判断是否所有出现过的指标都已收敛"""
+    stats = {}
+    for metric in cell_state["metrics"]:
+        samples = [run["metrics"][metric] for run in cell_state["runs"] if metric in run["metrics"]]
+        if samples:
+            stats[metric] = confidence_interval(samples, confidence)
+    widths = [s["rel_half_width"] for s in stats.values() if s["rel_half_width"] is not None]
+    cell_state["stats"] = stats
+    cell_state["worst_rel_half_width"] = max(widths) if widths else None
+    cell_state["converged"] = bool(widths) and len(widths) == len(stats) and max(widths) <= target
+    return cell_state
+
+
+def choose_next_cell(state: Dict[str, Any], in_flight: Dict[str, int] = None) -> Optional[str]:
+    """
+    选择下一次要运行的单元：先让每个单元达到最少次数，之后选择未收敛且未达上限的单元中置信区间最宽（最嘈杂）的
+
+    参数:
+        state: 活动状态
+        in_flight: {单元名称: 正在其他集群上运行的次数}，计入次数上限；已有运行中的单元排在其他单元之后
+
+    返回:
+        str: 单元名称，全部收敛或达到预算时返回 None
+    """
+    settings = state["settings"]
+    in_flight = in_flight or {}
+
+    def count(c):
+        return len(c["runs"]) + in_flight.get(c["name"], 0)
+
+    if sum(count(c) for c in state["cells"].values()) >= settings["max_total_runs"]:
+        return None
+    pending = [c for c in state["cells"].values() if count(c) < settings["min_reps"]]
+    if pending:
+        return min(pending, key=count)["name"]
+    candidates = [c for c in state["cells"].values()
+                  if not c["converged"] and count(c) < settings["max_reps"]]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (-in_flight.get(c["name"], 0), c["worst_rel_half_width"] is None,
+                                          c["worst_rel_half_width"] or 0, -len(c["runs"])))["name"]
+
+
+@traced("write")
+def _save_state(state: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+
+def run_campaign(state_path: str = None) -> Dict[str, Any]:
+    """
+    自适应重复的实验活动：每个（场景, 参数）单元只重复到关键指标的置信区间足够窄为止
+
+    每次运行后更新状态文件，中断后把 CAMPAIGN_STATE_PATH 指向该文件即可从断点继续；
+    配置了 CLUSTER_POOL 时每个集群一个工作线程，空闲的集群立即领取下一次运行
+
+    参数:
+        state_path: 状态文件路径，默认为 CAMPAIGN_STATE_PATH，未配置时新建 campaign_{时间戳}.json
+
+    返回:
+        dict: 活动状态（各单元的每次运行指标、置信区间与是否收敛），status 在未配置单元
+        或没有任何一次运行完成（本次执行的运行全部失败）时为 failed，否则为 finished
+    """
+    state_path = (state_path or ctx.get("CAMPAIGN_STATE_PATH", None)
+                  or os.path.join(ctx.OUTPUT_STORE_PATH, f"campaign_{int(time.time())}.json"))
+    settings = {
+        "confidence": ctx.get("CAMPAIGN_CONFIDENCE", 0.95),
+        "target_rel_half_width": ctx.get("CAMPAIGN_CI_TARGET", 0.05),
+        "min_reps": ctx.get("CAMPAIGN_MIN_REPS", 3),
+        "max_reps": ctx.get("CAMPAIGN_MAX_REPS", 8),
+        "max_total_runs": ctx.get("CAMPAIGN_MAX_TOTAL_RUNS", 50),
+    }
+    if settings["min_reps"] < 2:
+        raise ValueError("CAMPAIGN_MIN_REPS 至少为2，否则无法估计置信区间")
+
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        state["settings"] = settings
+        logging.info(f"【实验活动】从 {state_path} 继续，已完成 "
+                     f"{sum(len(c['runs']) for c in state['cells'].values())} 次运行")
+    else:
+        state = {"start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                 "settings": settings, "cells": {}}
+    for cell in get_campaign_cells():
+        cell_state = state["cells"].setdefault(cell["name"], {"runs": []})
+        cell_state.update(cell)
+        summarize_cell(cell_state, settings["confidence"], settings["target_rel_half_width"])
+    if not state["cells"]:
+        logging.error("❌ 未配置 CAMPAIGN_CELLS，实验活动终止")
+        state["status"] = "failed"
+        return state
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始实验活动：{len(state['cells'])} 个单元，置信度 {settings['confidence']}，"
+                 f"目标相对半宽 ±{settings['target_rel_half_width']:.1%}，"
+                 f"每单元 {settings['min_reps']}-{settings['max_reps']} 次，总预算 {settings['max_total_runs']} 次")
+    logging.info(f"{'='*80}")
+
+    clusters = get_cluster_pool()
+    if clusters:
+        install_context_log_filter()
+        logging.info(f"【实验活动】在 {len(clusters)} 个集群上并行运行: {[c.name for c in clusters]}")
+    condition = threading.Condition()
+    in_flight: Dict[str, int] = {}
+    # 本次执行中发起与完成的运行次数，用于判断活动整体是否失败
+    attempts = {"started": 0, "finished": 0}
+
+    def worker(cluster: Optional[RunContext]):
+        where = f"集群 {cluster.name} " if cluster else ""
+        while True:
+            with condition:
+                # 其他集群上的运行结束后可能让单元重新变为未收敛，有运行中的单元时等待而不是退出
+                while True:
+                    name = choose_next_cell(state, in_flight)
+                    if name is not None or not any(in_flight.values()):
+                        break
+                    condition.wait()
+                if name is None:
+                    return
+                cell_state = state["cells"][name]
+                in_flight[name] = in_flight.get(name, 0) + 1
+                rep = len(cell_state["runs"]) + in_flight[name]
+                logging.info(f"\n【实验活动】{where}运行单元 {name}（{cell_state['scenario']}）第 {rep} 次，"
+                             f"当前最宽相对半宽 {cell_state['worst_rel_half_width']}")
+                record_event("campaign_run", cell=name, rep=rep, cluster=cluster.name if cluster else None)
+                cell = {key: cell_state[key] for key in ("name", "scenario", "config", "metrics")}
+
+            started = time.time()
+            try:
+                if cluster:
+                    result = run_on_cluster(cluster.derive({"abnormal_scenario": cell["scenario"]}),
+                                            f"单元 {name} 第 {rep} 次", run_cell_once, cell) or {}
+                else:
+                    result = run_cell_once(cell)
+            except Exception as e:
+                logging.error(f"❌ {where}单元 {name} 第 {rep} 次运行异常: {e}")
+                result = {"status": "failed", "error_msg": str(e)}
+
+            run = {"rep": rep, "status": result.get("status"), "seconds": round(time.time() - started, 1),
+                   "cluster": cluster.name if cluster else None,
+                   "metrics": extract_run_metrics(result, cell["metrics"]) if result.get("status") == "finished" else {}}
+            with condition:
+                in_flight[name] -= 1
+                attempts["started"] += 1
+                attempts["finished"] += run["status"] == "finished"
+                cell_state["runs"].append(run)
+                summarize_cell(cell_state, settings["confidence"], settings["target_rel_half_width"])
+                _save_state(state, state_path)
+                logging.info(f"【实验活动】{where}单元 {name} 第 {rep} 次: {run['metrics']}，"
+                             f"{'已收敛' if cell_state['converged'] else '未收敛'}"
+                             f"（最宽相对半宽 {cell_state['worst_rel_half_width']}）")
+                condition.notify_all()
+
+    threads = [ContextThread(target=worker, args=(cluster,)) for cluster in (clusters or [None])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    finished_runs = sum(run["status"] == "finished" for c in state["cells"].values() for run in c["runs"])
+    failed = finished_runs == 0 or (attempts["started"] > 0 and attempts["finished"] == 0)
+    state["status"] = "failed" if failed else "finished"
+    state["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    _save_state(state, state_path)
+    for name, cell_state in state["cells"].items():
+        logging.info(f"【实验活动汇总】{name}: {len(cell_state['runs'])} 次，"
+                     f"{'已收敛' if cell_state['converged'] else '未收敛'}，"
+                     + "，".join(f"{m} {s['mean']}±{s['half_width']}" for m, s in cell_state["stats"].items()))
+    if failed:
+        logging.error(f"❌ 实验活动没有完成任何一次运行，状态已保存到 {state_path}")
+    else:
+        logging.info(f"✅ 实验活动完成，状态已保存到 {state_path}")
+    return state
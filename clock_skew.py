@@ -0,0 +1,284 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List
+import os
+from tools import (startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system,
+                   modify_db_switch, run_on_nodes, run_remote_command)
+from cluster_topology import probe_cluster_topology, select_fault_targets, config_leader_excluded
+from node_faults import describe_fault, apply_faults_to_nodes, remove_faults_from_nodes
+from prometheus_metrics import collect_phase_metrics
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
+
+
+def get_clock_skew_points() -> List[Dict[str, Any]]:
+    """
+    返回config中配置的时钟偏移参数列表（CLOCK_SKEW_POINTS），每个元素运行一次；默认向前跳变60秒
+    """
+    points = ctx.get("CLOCK_SKEW_POINTS", None) or [{"offset_ms": 60000}]
+    return [dict(point, kind="clock_skew") for point in points]
+
+
+def measure_node_clock_offset(node_idx: int) -> float:
+    """
+    估算节点时钟相对控制机的偏移（毫秒），以SSH往返的中点作为对比时刻
+
+    参数:
+        node_idx: 节点索引
+    """
+    sent = time.time()
+    _, output, _ = run_remote_command(node_idx, "date +%s.%N")
+    received = time.time()
+    return round((float(output.strip()) - (sent + received) / 2) * 1000, 1)
+
+
+def measure_clock_offsets() -> Dict[int, float]:
+    """并行估算所有节点的时钟偏移，返回 {节点索引: 毫秒}"""
+    return run_on_nodes(measure_node_clock_offset, list(range(ctx.node_num)))
+
+
+@with_run_context
+def clock_skew_scenario(bat_path: str = "test.bat",
+                        test_result_file_path: str = "test_result.txt",
+                        storing_path: str = "single_run_results"):
+    """
+    运行时钟偏移场景，CLOCK_SKEW_POINTS 中的每组偏移/漂移参数各运行一次
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        storing_path: 结果输出路径
+
+    返回:
+        单组参数时返回该次实验结果，多组参数时返回结果列表
+    """
+    current_time = int(time.time())
+    points = get_clock_skew_points()
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始时钟偏移场景实验，共 {len(points)} 组参数")
+    for point in points:
+        logging.info(f"  {describe_fault(point)}")
+    logging.info(f"{'='*80}")
+
+    # 修改DB_SWITCH配置
+    logging.info("\n【配置数据库】修改benchmark配置中的DB_SWITCH...")
+    if not modify_db_switch():
+        logging.error("❌ 修改DB_SWITCH失败，实验终止")
+        return None
+
+    sweep_results = []
+    for point_idx, point in enumerate(points):
+        if len(points) == 1:
+            output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
+        else:
+            output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}_{point_idx}\\single_run.json"
+            logging.info(f"\n【参数扫描 {point_idx + 1}/{len(points)}】{describe_fault(point)}")
+
+        exp_result = clock_skew_scenario_single_run(
+            bat_path=bat_path,
+            test_result_file_path=test_result_file_path,
+            output_store_path=output_store_path,
+            skew=point
+        )
+        sweep_results.append(exp_result)
+        logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+
+    return sweep_results[0] if len(sweep_results) == 1 else sweep_results
+
+
+def clock_skew_scenario_single_run(bat_path, test_result_file_path, output_store_path, skew: Dict[str, Any]):
+    """
+    单次时钟偏移场景主函数：清理→启动→等待20分钟→异常测试(期间跳变目标节点时钟并在之后恢复)→结果存储→停止系统
+
+    参数：
+        bat_path: str - 测试用bat文件的完整路径
+        test_result_file_path: str - 单次测试结果文件的完整路径
+        output_store_path: str - 最终测试结果集合的存储路径
+        skew: dict - 时钟偏移参数 {"kind": "clock_skew", "offset_ms": ..., "drift_ppm": ...}
+
+    返回：
+        dict - 异常测试的结果集合（含状态信息及各阶段实测的时钟偏移）
+    """
+    skew_desc = describe_fault(skew)
+    strategy = ctx.get("FAULT_TARGET_STRATEGY", "random")
+    target_count = ctx.get("CLOCK_SKEW_NODES", 1)
+    target_nodes = []
+
+    # 初始化测试结果集合
+    all_test_results = {
+        "scenario_name": "clock_skew_scenario_single_run",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "clock_skew": skew,
+        "target_strategy": strategy,
+        "target_nodes": target_nodes,
+        "measured_clock_offsets_ms": {},
+        "test_results": [],
+        "end_time": "",
+        "status": "running"
+    }
+
+    try:
+        # -------------------------- 1. 清理所有节点 --------------------------
+        logging.info("【步骤1/5】清理所有节点...")
+        clean_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            clean_threads.append(t)
+
+        time.sleep(10)
+        logging.info("【步骤1/5】所有节点清理完成")
+
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # 同时恢复所有节点的时钟（预防性清理，上次异常退出时可能遗留偏移）
+        logging.info("【步骤1/5】预防性移除节点故障...")
+        remove_faults_from_nodes()
+
+        # -------------------------- 2. 启动所有ConfigNode --------------------------
+        logging.info("\n【步骤2/5】启动所有ConfigNode...")
+        config_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
+            t.start()
+            config_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤2/5】所有ConfigNode启动完成")
+
+        # -------------------------- 3. 启动所有DataNode --------------------------
+        logging.info("\n【步骤3/5】启动所有DataNode...")
+        data_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
+            t.start()
+            data_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤3/5】所有DataNode启动完成")
+
+        # -------------------------- 4. 启动节点监控系统 --------------------------
+        logging.info("\n【步骤4/5】启动节点监控系统（Prometheus + Grafana）...")
+        start_monitoring_system()
+        logging.info("【步骤4/5】节点监控系统启动完成")
+
+        # -------------------------- 5. 异常测试：等待20分钟后开始，期间跳变目标节点时钟 --------------------------
+        logging.info(f"\n【步骤5/5】预热等待后开始异常测试（期间对目标节点施加 {skew_desc}）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
+
+        # 按 FAULT_TARGET_STRATEGY 选择目标节点（默认1个，非0号节点，0号节点同时运行Prometheus）
+        topology = probe_cluster_topology() if strategy != "random" else None
+        target_nodes.extend(select_fault_targets(target_count, strategy, topology=topology))
+        all_test_results["cluster_topology"] = topology
+        all_test_results["leader_excluded"] = config_leader_excluded(strategy, topology)
+        offsets = all_test_results["measured_clock_offsets_ms"]
+        offsets["baseline"] = measure_clock_offsets()
+        phase_times = {"test_start": time.time()}
+
+        # 创建异步执行时钟偏移操作的线程
+        def clock_skew_operation():
+            logging.info(f"等待10分钟后跳变节点 {target_nodes} 的时钟...")
+            time.sleep(10 * 60)  # 等待10分钟
+
+            phase_times["skew_on"] = time.time()
+            apply_faults_to_nodes(target_nodes, [skew])
+            offsets["fault"] = measure_clock_offsets()
+            logging.info(f"【时钟偏移】施加后各节点实测偏移(ms): {offsets['fault']}")
+
+            logging.info("等待15分钟后恢复时钟...")
+            time.sleep(15 * 60)  # 等待15分钟
+
+            offsets["before_recovery"] = measure_clock_offsets()
+            remove_faults_from_nodes(target_nodes, [skew])
+            phase_times["skew_off"] = time.time()
+            offsets["recovery"] = measure_clock_offsets()
+            logging.info(f"【时钟偏移】恢复后各节点实测偏移(ms): {offsets['recovery']}")
+            logging.info("时钟偏移操作完成")
+
+        # 启动时钟偏移操作线程
+        operation_thread = ContextThread(target=clock_skew_operation)
+        operation_thread.start()
+
+        # 同时开始异常测试
+        logging.info("开始异常测试...")
+        abnormal_test = run_bat_and_parse(
+            bat_path=bat_path,
+            result_file_path=test_result_file_path
+        )
+        abnormal_test["test_phase"] = "abnormal"
+        abnormal_test["phase_description"] = f"时钟偏移测试（异常状态 - {skew_desc}，影响节点: {target_nodes}）"
+        abnormal_test["affected_nodes"] = target_nodes
+        abnormal_test["clock_skew"] = skew
+        all_test_results["test_results"].append(abnormal_test)
+
+        # 等待时钟偏移操作完成
+        operation_thread.join()
+        phase_times["test_end"] = time.time()
+        all_test_results["phase_times"] = phase_times
+        # Prometheus 在0号节点上以控制机视角的时间戳查询，目标节点的时钟偏移不影响阶段划分
+        all_test_results["compaction_metrics"] = collect_phase_metrics([
+            ("baseline", phase_times["test_start"], phase_times.get("skew_on")),
+            ("skew", phase_times.get("skew_on"), phase_times.get("skew_off")),
+            ("recovery", phase_times.get("skew_off"), phase_times["test_end"]),
+        ])
+        logging.info("【步骤5/5】异常测试和时钟偏移操作均完成")
+
+        # -------------------------- 6. 更新场景状态，存储结果 --------------------------
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "finished"
+        logging.info(f"\n{'='*60}")
+        logging.info(f"场景执行完成！开始将结果写入存储文件：{output_store_path}")
+
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.info(f"✅ 结果已成功存储到 {output_store_path}")
+
+    except Exception as e:
+        error_msg = f"场景执行异常：{str(e)}"
+        logging.error(f"\n❌ {error_msg}")
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "failed"
+        all_test_results["error_msg"] = error_msg
+
+        # 异常情况下也要恢复时钟
+        try:
+            remove_faults_from_nodes(target_nodes)
+        except Exception as restore_error:
+            logging.warning(f"⚠️ 恢复时钟时出错: {restore_error}")
+
+        # 存储异常状态下的结果
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
+
+    finally:
+        # 最终清理：确保时钟恢复并停止所有节点
+        try:
+            logging.info("\n【最终步骤】确保时钟恢复...")
+            remove_faults_from_nodes(target_nodes)
+        except Exception as e:
+            logging.warning(f"⚠️ 最终恢复时钟时出错: {e}")
+
+        restore_dataset_properties()
+
+        logging.info("【最终步骤】停止所有节点...")
+        stop_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            stop_threads.append(t)
+        time.sleep(10)
+        logging.info("【最终步骤】所有节点停止完成")
+
+    return all_test_results
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    clock_skew_scenario()
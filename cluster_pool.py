@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+import logging
+from typing import Any, Callable, List
+from run_context import ctx, RunContext, current_context, use_context
+from run_manifest import start_run_manifest, finish_run_manifest, result_status
+from dataset_snapshot import prepare_dataset_snapshot
+from fault_control import heal_before_run
+
+# 每个集群必须有自己的benchmark实例
+_REQUIRED_CLUSTER_KEYS = ("name", "server_ip", "BENCHMARK_CONFIG_PATH", "INPUT_BAT_PATH", "INPUT_TEST_RESULT_PATH")
+
+# 已准备过的集群：每个集群只在第一次运行前清除遗留故障、检查数据集快照
+_prepared_lock = threading.Lock()
+_prepared_clusters = set()
+
+
+def get_cluster_pool() -> List[RunContext]:
+    """
+    按config中的 CLUSTER_POOL 为每个集群创建运行上下文，未配置时为空列表
+
+    每个集群为 {"name", "server_ip", "BENCHMARK_CONFIG_PATH", "INPUT_BAT_PATH", "INPUT_TEST_RESULT_PATH", 其他配置项...}，
+    node_num 默认为 server_ip 的长度，OUTPUT_STORE_PATH 默认为 OUTPUT_STORE_PATH/clusters/{name}
+
+    异常:
+        ValueError: 集群缺少必需的配置项、名称重复或配置项校验失败
+    """
+    clusters = []
+    for cluster in ctx.get("CLUSTER_POOL", None) or []:
+        missing = [key for key in _REQUIRED_CLUSTER_KEYS if key not in cluster]
+        if missing:
+            raise ValueError(f"CLUSTER_POOL 中的集群缺少配置项: {missing}")
+        overrides = {key: value for key, value in cluster.items() if key != "name"}
+        overrides.setdefault("OUTPUT_STORE_PATH", os.path.join(ctx.OUTPUT_STORE_PATH, "clusters", cluster["name"]))
+        # 集群上下文只运行分配给它的单元，不再嵌套集群池或重放清单
+        overrides.update({"CLUSTER_POOL": None, "REPLAY_MANIFEST": None})
+        clusters.append(current_context().derive(overrides, name=cluster["name"], share_state=False))
+    names = [cluster.name for cluster in clusters]
+    if len(set(names)) != len(names):
+        raise ValueError(f"CLUSTER_POOL 中存在重复的集群名称: {names}")
+    return clusters
+
+
+def run_on_cluster(cluster: RunContext, label: str, func: Callable, *args) -> Any:
+    """
+    在指定集群上运行一次 func(*args)，阻塞直到完成
+
+    每次运行使用由集群上下文派生的独立上下文（自己的运行清单与随机种子），结果与清单写入集群的输出目录；
+    集群第一次运行前清除该集群上遗留的故障，并按该集群检查并准备数据集快照
+
+    参数:
+        cluster: 集群运行上下文，见 get_cluster_pool
+        label: 用于日志的运行名称
+        func: 在该集群上执行的函数，返回场景结果字典
+    """
+    with use_context(cluster.derive(share_state=False)) as run_context:
+        os.makedirs(run_context.OUTPUT_STORE_PATH, exist_ok=True)
+        with _prepared_lock:
+            first_run = cluster.name not in _prepared_clusters
+            _prepared_clusters.add(cluster.name)
+        if first_run:
+            heal_before_run()
+            prepare_dataset_snapshot(run_context.INPUT_BAT_PATH, run_context.INPUT_TEST_RESULT_PATH)
+
+        logging.info(f"【集群池】集群 {cluster.name} 开始运行{label}")
+        started = time.time()
+        start_run_manifest()
+        result = None
+        try:
+            result = func(*args)
+        finally:
+            finish_run_manifest(result_status(result))
+        logging.info(f"【集群池】集群 {cluster.name} {label}完成，耗时 {round(time.time() - started, 1)} 秒")
+        return result
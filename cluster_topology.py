@@ -0,0 +1,263 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+from tools import run_remote_command
+from node_facts import get_node_facts
+from run_manifest import record_event, next_replay_targets
+from run_context import ctx
+
+# 故障目标选择策略
+#   random         随机选择（原有行为）
+#   leader         持有最多写入region/vnode leader的节点
+#   follower       持有写入region/vnode副本但leader最少的节点
+#   most_regions   持有最多写入region/vnode副本的节点
+#   config_leader  IoTDB ConfigNode leader / TDengine mnode leader
+TARGET_STRATEGIES = ("random", "leader", "follower", "most_regions", "config_leader")
+
+# 多条查询在一次SSH往返中执行，用分隔行切分各自的输出
+_SECTION_MARKER = "#####ABNORMAL_SECTION#####"
+
+
+def parse_cli_table(output: str) -> List[Dict[str, str]]:
+    """
+    解析IoTDB CLI / TDengine taos 输出的 | 分隔表格
+
+    参数:
+        output: CLI输出文本
+
+    返回:
+        list: 每行一个 {列名: 值} 字典，列名统一转为小写
+    """
+    header = None
+    rows = []
+    for line in output.splitlines():
+        line = line.strip()
+        if "|" not in line or set(line) <= set("+-=| "):
+            continue
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if header is None:
+            header = [cell.lower() for cell in cells]
+            continue
+        if len(cells) == len(header):
+            rows.append(dict(zip(header, cells)))
+    return rows
+
+
+def _node_index_of(address: str) -> Optional[int]:
+    """将CLI输出中的IP、主机名或 host:port 映射为节点索引"""
+    host = address.rsplit(":", 1)[0] if address.count(":") == 1 else address
+    if host in ctx.server_ip:
+        return ctx.server_ip.index(host)
+    for idx in range(ctx.node_num):
+        if get_node_facts(idx).get("hostname") == host:
+            return idx
+    return None
+
+
+def _build_probe_command() -> str:
+    """生成在0号节点上一次执行全部拓扑查询的命令"""
+    if ctx.DB_TYPE == "IoTDB":
+        cli = f"/mnt/data/apache-iotdb-2.0.4-all-bin/sbin/start-cli.sh -h {ctx.server_ip[0]} -p 6667 -u root -pw root"
+        statements = ["show regions", "show confignodes", "show cluster"]
+        return f"; echo '{_SECTION_MARKER}'; ".join(f"{cli} -e \"{stmt}\"" for stmt in statements)
+    if ctx.DB_TYPE == "TDengine":
+        statements = ["show vnodes;", "show mnodes;", "show dnodes;"]
+        return f"; echo '{_SECTION_MARKER}'; ".join(f"taos -s \"{stmt}\"" for stmt in statements)
+    raise ValueError(f"未知的数据库类型: {ctx.DB_TYPE}")
+
+
+def _summarize_iotdb(sections: List[List[Dict[str, str]]]) -> Dict[str, Any]:
+    """汇总IoTDB的 show regions / show confignodes / show cluster 结果"""
+    regions, confignodes, cluster = (sections + [[], [], []])[:3]
+    summary = _empty_summary()
+    for row in regions:
+        if row.get("type") != "DataRegion":
+            continue
+        node_idx = _node_index_of(row.get("rpcaddress") or row.get("internaladdress", ""))
+        if node_idx is None:
+            continue
+        summary["write_regions"][node_idx] += 1
+        if row.get("role", "").lower() == "leader":
+            summary["write_leaders"][node_idx] += 1
+    for row in confignodes:
+        if row.get("role", "").lower() == "leader":
+            summary["config_leader"] = _node_index_of(row.get("internaladdress", ""))
+    summary["node_status"] = _parse_node_status(cluster)
+    return summary
+
+
+def _summarize_tdengine(sections: List[List[Dict[str, str]]]) -> Dict[str, Any]:
+    """汇总TDengine的 show vnodes / show mnodes / show dnodes 结果"""
+    vnodes, mnodes, dnodes = (sections + [[], [], []])[:3]
+    summary = _empty_summary()
+    dnode_to_idx = {row.get("id"): _node_index_of(row.get("endpoint", "")) for row in dnodes}
+    for row in vnodes:
+        node_idx = dnode_to_idx.get(row.get("dnode_id"))
+        if node_idx is None:
+            continue
+        summary["write_regions"][node_idx] += 1
+        # 3.x 的 show vnodes 中角色在 status 列，部分版本为 role 列
+        if (row.get("role") or row.get("status", "")).lower() == "leader":
+            summary["write_leaders"][node_idx] += 1
+    for row in mnodes:
+        if row.get("role", "").lower() == "leader":
+            summary["config_leader"] = _node_index_of(row.get("endpoint", ""))
+    summary["node_status"] = _parse_node_status(dnodes)
+    return summary
+
+
+def _parse_node_status(rows: List[Dict[str, str]]) -> Dict[int, Dict[str, str]]:
+    """
+    将 show cluster（IoTDB）/ show dnodes（TDengine）的结果整理为按节点索引的组件状态
+
+    返回:
+        dict: {节点索引: {"confignode"/"datanode": 状态}}，TDengine 的 dnode 记为 datanode
+    """
+    status: Dict[int, Dict[str, str]] = {}
+    for row in rows:
+        if ctx.DB_TYPE == "IoTDB":
+            node_idx = _node_index_of(row.get("internaladdress", ""))
+            component = row.get("nodetype", "").lower()
+        else:
+            node_idx = _node_index_of(row.get("endpoint", ""))
+            component = "datanode"
+        if node_idx is not None:
+            status.setdefault(node_idx, {})[component] = row.get("status", "")
+    return status
+
+
+def _empty_summary() -> Dict[str, Any]:
+    return {
+        "db_type": ctx.DB_TYPE,
+        "write_regions": {idx: 0 for idx in range(ctx.node_num)},
+        "write_leaders": {idx: 0 for idx in range(ctx.node_num)},
+        "config_leader": None,
+        "node_status": {},
+    }
+
+
+def probe_cluster_topology() -> Dict[str, Any]:
+    """
+    在0号节点上查询当前集群的region/vnode分布与leader位置（一次SSH往返）
+
+    返回:
+        dict: {
+            "db_type": 数据库类型,
+            "write_regions": {节点索引: 写入region/vnode副本数},
+            "write_leaders": {节点索引: 写入region/vnode leader数},
+            "config_leader": ConfigNode/mnode leader所在节点索引（未知为None）,
+            "node_status": {节点索引: {组件: 状态}},
+        }
+        查询失败时返回None
+    """
+    try:
+        _, output, _ = run_remote_command(0, _build_probe_command())
+    except Exception as e:
+        logging.error(f"查询集群拓扑时出错: {e}")
+        return None
+
+    sections = [parse_cli_table(part) for part in output.split(_SECTION_MARKER)]
+    summary = _summarize_iotdb(sections) if ctx.DB_TYPE == "IoTDB" else _summarize_tdengine(sections)
+    logging.info(f"【集群拓扑】写入region副本分布: {summary['write_regions']}")
+    logging.info(f"【集群拓扑】写入region leader分布: {summary['write_leaders']}")
+    logging.info(f"【集群拓扑】ConfigNode/mnode leader: 节点 {summary['config_leader']}")
+    return summary
+
+
+def probe_node_status() -> Optional[Dict[int, Dict[str, str]]]:
+    """
+    在0号节点上查询各节点组件的运行状态（IoTDB show cluster / TDengine show dnodes）
+
+    返回:
+        dict: {节点索引: {"confignode"/"datanode": 状态}}，查询失败时返回None
+    """
+    if ctx.DB_TYPE == "IoTDB":
+        command = (f"/mnt/data/apache-iotdb-2.0.4-all-bin/sbin/start-cli.sh -h {ctx.server_ip[0]} "
+                   f"-p 6667 -u root -pw root -e \"show cluster\"")
+    else:
+        command = "taos -s \"show dnodes;\""
+    try:
+        _, output, _ = run_remote_command(0, command)
+    except Exception as e:
+        logging.warning(f"查询节点状态时出错: {e}")
+        return None
+    return _parse_node_status(parse_cli_table(output))
+
+
+def is_component_healthy(status: Optional[Dict[int, Dict[str, str]]], node_idx: int, component: str) -> bool:
+    """判断某节点组件是否已恢复运行（IoTDB 为 Running，TDengine 为 ready）"""
+    if not status:
+        return False
+    value = status.get(node_idx, {}).get(component, "").lower()
+    return value in ("running", "ready")
+
+
+def config_leader_excluded(strategy: str, topology: Optional[Dict[str, Any]],
+                           exclude: Sequence[int] = (0,)) -> bool:
+    """config_leader 策略下 ConfigNode/mnode leader 是否位于被排除的节点（此时改选其他节点）"""
+    return strategy == "config_leader" and topology is not None and topology.get("config_leader") in exclude
+
+
+def rank_fault_targets(strategy: str, topology: Optional[Dict[str, Any]],
+                       exclude: Sequence[int] = (0,)) -> List[int]:
+    """
+    按策略对候选故障节点排序，排在最前的最符合策略
+
+    参数:
+        strategy: 选择策略，见 TARGET_STRATEGIES
+        topology: probe_cluster_topology 的返回值，random策略可为None
+        exclude: 不参与选择的节点（默认0号节点，benchmark经其写入）
+
+    返回:
+        list: 排好序的节点索引
+    """
+    if strategy not in TARGET_STRATEGIES:
+        raise ValueError(f"未知的故障目标选择策略: {strategy}")
+    candidates = [idx for idx in range(ctx.node_num) if idx not in exclude]
+    if strategy == "random" or topology is None:
+        if strategy != "random":
+            logging.warning(f"未获取到集群拓扑，策略 {strategy} 退化为随机选择")
+        return ctx.random.sample(candidates, len(candidates))
+
+    leaders = topology["write_leaders"]
+    regions = topology["write_regions"]
+    if strategy == "leader":
+        return sorted(candidates, key=lambda idx: (-leaders[idx], -regions[idx], idx))
+    if strategy == "follower":
+        return sorted(candidates, key=lambda idx: (regions[idx] == 0, leaders[idx], -regions[idx], idx))
+    if strategy == "most_regions":
+        return sorted(candidates, key=lambda idx: (-regions[idx], -leaders[idx], idx))
+    # config_leader
+    config_leader = topology.get("config_leader")
+    if config_leader_excluded(strategy, topology, exclude):
+        logging.warning(f"ConfigNode/mnode leader 位于被排除的节点 {config_leader}，改选其他节点")
+    return sorted(candidates, key=lambda idx: (idx != config_leader, idx))
+
+
+def select_fault_targets(count: int = 1, strategy: str = None, exclude: Sequence[int] = (0,),
+                         topology: Optional[Dict[str, Any]] = None) -> List[int]:
+    """
+    选择故障目标节点，非random策略时先查询集群拓扑
+
+    参数:
+        count: 需要的节点数
+        strategy: 选择策略，默认取config中的 FAULT_TARGET_STRATEGY（未配置为random）
+        exclude: 不参与选择的节点
+        topology: 已查询到的集群拓扑，为None且需要时自动查询
+
+    返回:
+        list: 选中的节点索引
+    """
+    if strategy is None:
+        strategy = ctx.get("FAULT_TARGET_STRATEGY", "random")
+    # 重放运行清单时直接使用记录的目标节点
+    targets = next_replay_targets(count)
+    if targets is not None:
+        logging.info(f"按运行清单重放故障目标节点: {targets}")
+    else:
+        if strategy != "random" and topology is None:
+            topology = probe_cluster_topology()
+        targets = rank_fault_targets(strategy, topology, exclude)[:count]
+        logging.info(f"按策略 {strategy} 选择故障目标节点: {targets}")
+    record_event("fault_targets", strategy=strategy, count=count, targets=targets,
+                 leader_excluded=config_leader_excluded(strategy, topology, exclude))
+    return targets
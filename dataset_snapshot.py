@@ -0,0 +1,261 @@
+import json
+import os
+import posixpath
+import shlex
+import time
+import logging
+from typing import Any, Dict, Optional
+from tools import (startConfigNode, startDataNode, stopNode, run_bat_and_parse, run_remote_command, run_on_nodes,
+                   modify_benchmark_properties, restore_benchmark_properties, write_benchmark_properties,
+                   build_operation_proportion)
+from node_faults import get_data_dir
+from run_manifest import record_event
+from run_context import ctx, current_context
+
+# 快照清单：记录每个快照的创建时间、写入参数和各节点快照大小（位于 OUTPUT_STORE_PATH 下）
+SNAPSHOT_MANIFEST_NAME = "dataset_snapshots.json"
+# 打包/恢复数据目录前需确认数据库进程已全部退出
+_DB_PROCESS_PATTERN = {"IoTDB": "[o]rg.apache.iotdb", "TDengine": "[t]aosd"}
+_STOP_WAIT_S = 120
+# 使用快照时不能让benchmark在开始前删除数据或重建schema
+REUSE_DATASET_PROPERTIES = {"IS_DELETE_DATA": "false", "CREATE_SCHEMA": "false"}
+
+
+def get_dataset_snapshot_name() -> Optional[str]:
+    """config中的 DATASET_SNAPSHOT，None 表示不使用数据集快照（每次运行从空库开始）"""
+    return ctx.get("DATASET_SNAPSHOT", None)
+
+
+def get_snapshot_file(node_idx: int, name: str) -> str:
+    """
+    节点上快照文件的路径
+
+    默认与数据目录放在同一文件系统（数据目录的上级目录下的 abnormal_snapshots），可用 DATASET_SNAPSHOT_DIR 覆盖
+    """
+    snapshot_dir = (ctx.get("DATASET_SNAPSHOT_DIR", None)
+                    or posixpath.join(posixpath.dirname(get_data_dir(node_idx)), "abnormal_snapshots"))
+    return f"{snapshot_dir}/{ctx.DB_TYPE}_{name}.tar"
+
+
+def build_wait_stopped_script() -> str:
+    """等待数据库进程全部退出，超时返回非0"""
+    return (f"i=0; while pgrep -f '{_DB_PROCESS_PATTERN[ctx.DB_TYPE]}' >/dev/null; do "
+            f"i=$((i+1)); if [ $i -ge {_STOP_WAIT_S} ]; then echo 'database still running' >&2; exit 1; fi; "
+            f"sleep 1; done")
+
+
+def build_snapshot_script(node_idx: int, name: str) -> str:
+    """打包数据目录为快照文件（先写临时文件再改名，中途失败不会留下不完整的快照），输出快照字节数"""
+    data_dir = get_data_dir(node_idx)
+    snapshot = get_snapshot_file(node_idx, name)
+    return (f"{build_wait_stopped_script()} && mkdir -p {posixpath.dirname(snapshot)} && "
+            f"tar -C {posixpath.dirname(data_dir)} -cf {snapshot}.tmp {posixpath.basename(data_dir)} && "
+            f"mv {snapshot}.tmp {snapshot} && stat -c %s {snapshot}")
+
+
+def build_restore_script(node_idx: int, name: str) -> str:
+    """用快照替换数据目录；快照不存在时不删除现有数据"""
+    data_dir = get_data_dir(node_idx)
+    snapshot = get_snapshot_file(node_idx, name)
+    return (f"{build_wait_stopped_script()} && test -f {snapshot} && rm -rf {data_dir} && "
+            f"mkdir -p {posixpath.dirname(data_dir)} && tar -C {posixpath.dirname(data_dir)} -xf {snapshot}")
+
+
+def _run_snapshot_script(node_idx: int, script: str):
+    exit_status, output, error_output = run_remote_command(node_idx, f"sudo sh -c {shlex.quote(script)}")
+    if exit_status != 0:
+        raise RuntimeError(error_output.strip() or output.strip() or f"退出码 {exit_status}")
+    return output.strip()
+
+
+def probe_dataset_snapshot(name: str) -> Dict[int, Optional[int]]:
+    """返回 {节点索引: 快照字节数}，快照不存在的节点为 None"""
+    def probe(node_idx: int) -> Optional[int]:
+        snapshot = get_snapshot_file(node_idx, name)
+        _, output, _ = run_remote_command(node_idx, f"sudo stat -c %s {snapshot} 2>/dev/null")
+        return int(output.strip()) if output.strip().isdigit() else None
+    return run_on_nodes(probe, list(range(ctx.node_num)))
+
+
+def get_snapshot_manifest_path() -> str:
+    """当前上下文的快照清单路径"""
+    return os.path.join(ctx.OUTPUT_STORE_PATH, SNAPSHOT_MANIFEST_NAME)
+
+
+def _load_manifest() -> Dict[str, Any]:
+    try:
+        with open(get_snapshot_manifest_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _stop_all_nodes():
+    """停止所有节点并等待停止命令返回"""
+    run_on_nodes(stopNode, list(range(ctx.node_num)))
+
+
+def create_dataset_snapshot(name: str) -> Dict[int, int]:
+    """
+    在所有节点上并行打包数据目录（节点必须已停止）
+
+    返回:
+        dict: {节点索引: 快照字节数}
+
+    异常:
+        RuntimeError: 任一节点打包失败
+    """
+    logging.info(f"【数据集快照】在 {ctx.node_num} 个节点上并行创建快照 {name}...")
+    sizes = run_on_nodes(lambda idx: int(_run_snapshot_script(idx, build_snapshot_script(idx, name))),
+                         list(range(ctx.node_num)))
+    failed = [idx for idx, size in sizes.items() if size is None]
+    if failed:
+        raise RuntimeError(f"节点 {failed} 创建快照失败")
+    logging.info(f"✅ 快照 {name} 创建完成: " + ", ".join(f"节点{idx} {size / 1024 / 1024:.1f}MB"
+                                                   for idx, size in sorted(sizes.items())))
+    return sizes
+
+
+def restore_dataset_snapshot(name: str = None) -> Optional[Dict[str, Any]]:
+    """
+    在所有节点上并行用快照替换数据目录，并将benchmark设置为不删除数据、不重建schema
+
+    在场景的清理步骤之后、启动节点之前调用；未配置 DATASET_SNAPSHOT 时什么也不做。
+    场景的 finally 中须调用 restore_dataset_properties 写回修改前的benchmark配置
+
+    参数:
+        name: 快照名称，默认为 DATASET_SNAPSHOT
+
+    返回:
+        dict: {"name", "restored_nodes", "restore_seconds"}，未使用快照时返回 None
+
+    异常:
+        RuntimeError: 任一节点恢复失败（此时集群数据不一致，不能继续测试）
+    """
+    name = name or get_dataset_snapshot_name()
+    if not name:
+        return None
+
+    logging.info(f"【数据集快照】在 {ctx.node_num} 个节点上并行恢复快照 {name}...")
+    start = time.time()
+    results = run_on_nodes(lambda idx: _run_snapshot_script(idx, build_restore_script(idx, name)) is not None,
+                           list(range(ctx.node_num)))
+    failed = [idx for idx, ok in results.items() if not ok]
+    if failed:
+        raise RuntimeError(f"节点 {failed} 恢复快照 {name} 失败")
+    elapsed = round(time.time() - start, 1)
+    logging.info(f"✅ 快照 {name} 已在所有节点恢复，耗时 {elapsed} 秒")
+    record_event("dataset_restored", name=name, seconds=elapsed)
+
+    # 只记录本次修改前的内容（场景本身可能已修改过配置，如乱序参数），恢复时不影响外层的修改
+    state = current_context().state
+    if "dataset_properties_original" not in state:
+        with open(ctx.BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            state["dataset_properties_original"] = f.read()
+    write_benchmark_properties(REUSE_DATASET_PROPERTIES)
+    return {"name": name, "restored_nodes": sorted(results), "restore_seconds": elapsed,
+            "manifest": _load_manifest().get(name)}
+
+
+def restore_dataset_properties() -> bool:
+    """
+    写回 restore_dataset_snapshot 修改前的benchmark配置（IS_DELETE_DATA / CREATE_SCHEMA），未修改时什么也不做
+
+    返回:
+        bool: 是否写回了配置
+    """
+    original = current_context().state.pop("dataset_properties_original", None)
+    if original is None:
+        return False
+    try:
+        with open(ctx.BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
+            f.write(original)
+    except Exception as e:
+        logging.error(f"❌ 恢复benchmark配置时出错: {e}")
+        return False
+    logging.info("【数据集快照】benchmark配置已恢复为使用快照前的内容")
+    return True
+
+
+def wait_warm_up():
+    """
+    启动后、异常测试前的预热等待：默认20分钟；从快照恢复时数据已经就绪，只等待 DATASET_WARMUP_S 秒
+    """
+    warm_up_s = ctx.get("DATASET_WARMUP_S", 120) if get_dataset_snapshot_name() else 20 * 60
+    logging.info(f"预热等待 {warm_up_s} 秒...")
+    time.sleep(warm_up_s)
+
+
+def prepare_dataset_snapshot(bat_path: str, test_result_file_path: str, force: bool = None) -> Optional[Dict[str, Any]]:
+    """
+    数据准备阶段：所有节点都已有快照时直接返回，否则启动集群、只写入一份可复现的数据集、停止集群并创建快照
+
+    写入参数为只写入的 OPERATION_PROPORTION、DATASET_PRELOAD_LOOP，以及 DATASET_PRELOAD_PROPERTIES
+    （例如固定 DATA_SEED 与 START_TIME，使每次生成的数据集完全相同）
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        force: 是否重建已存在的快照，默认为 DATASET_SNAPSHOT_REBUILD
+
+    返回:
+        dict: 快照清单条目，未配置 DATASET_SNAPSHOT 时返回 None
+    """
+    name = get_dataset_snapshot_name()
+    if not name:
+        return None
+    if force is None:
+        force = ctx.get("DATASET_SNAPSHOT_REBUILD", False)
+
+    manifest = _load_manifest()
+    if not force:
+        sizes = probe_dataset_snapshot(name)
+        missing = [idx for idx, size in sizes.items() if size is None]
+        if not missing:
+            logging.info(f"【数据集快照】所有节点已有快照 {name}，跳过数据写入")
+            return manifest.get(name)
+        logging.info(f"【数据集快照】节点 {missing} 缺少快照 {name}，开始写入数据集")
+
+    preload_overrides = {"OPERATION_PROPORTION": build_operation_proportion({"INGESTION": 1}),
+                         "IS_DELETE_DATA": "true", "CREATE_SCHEMA": "true"}
+    if ctx.get("DATASET_PRELOAD_LOOP", None):
+        preload_overrides["LOOP"] = ctx.DATASET_PRELOAD_LOOP
+    preload_overrides.update(ctx.get("DATASET_PRELOAD_PROPERTIES", None) or {})
+
+    start = time.time()
+    try:
+        logging.info("【数据集快照】停止所有节点...")
+        _stop_all_nodes()
+
+        logging.info("【数据集快照】启动所有ConfigNode和DataNode...")
+        run_on_nodes(startConfigNode, list(range(ctx.node_num)))
+        time.sleep(60)
+        run_on_nodes(startDataNode, list(range(ctx.node_num)))
+        time.sleep(60)
+
+        logging.info(f"【数据集快照】写入数据集: {preload_overrides}")
+        if not modify_benchmark_properties(preload_overrides):
+            raise RuntimeError("修改benchmark配置失败")
+        preload_result = run_bat_and_parse(bat_path=bat_path, result_file_path=test_result_file_path)
+        if not preload_result:
+            raise RuntimeError("数据集写入失败，未解析到benchmark结果")
+    finally:
+        restore_benchmark_properties()
+        # 正常停止时数据库会把内存中的数据刷盘，快照中只包含已持久化的文件
+        logging.info("【数据集快照】停止所有节点...")
+        _stop_all_nodes()
+
+    sizes = create_dataset_snapshot(name)
+    manifest[name] = {
+        "db_type": ctx.DB_TYPE,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "prepare_seconds": round(time.time() - start, 1),
+        "preload_properties": preload_overrides,
+        "preload_result": preload_result,
+        "snapshot_bytes": sizes,
+    }
+    os.makedirs(os.path.dirname(get_snapshot_manifest_path()), exist_ok=True)
+    with open(get_snapshot_manifest_path(), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logging.info(f"✅ 数据集快照 {name} 已就绪，清单写入 {get_snapshot_manifest_path()}")
+    return manifest[name]
@@ -0,0 +1,269 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List
+import os
+from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch, run_on_nodes
+from cluster_topology import probe_cluster_topology, select_fault_targets, config_leader_excluded
+from node_faults import (describe_fault, apply_faults_to_nodes, remove_faults_from_nodes,
+                         collect_disk_stats, diff_disk_stats)
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
+
+
+# 三个阶段对应的磁盘统计采样点
+DISK_PHASES = (("baseline", "test_start", "fault_applied"),
+               ("fault", "fault_applied", "fault_removed"),
+               ("recovery", "fault_removed", "test_end"))
+
+
+def get_disk_io_faults() -> List[Dict[str, Any]]:
+    """
+    返回config中配置的磁盘I/O故障列表（DISK_IO_FAULTS），默认将数据盘写带宽限制为20MB/s
+    """
+    return list(ctx.get("DISK_IO_FAULTS", None) or [{"kind": "io_throttle", "write_mbps": 20}])
+
+
+def snapshot_disk_stats(snapshots: Dict[str, Dict[int, Any]], point: str):
+    """并行采集所有节点数据盘的计数器，记录到 snapshots[point]"""
+    snapshots[point] = run_on_nodes(collect_disk_stats, list(range(ctx.node_num)))
+
+
+def summarize_disk_phases(snapshots: Dict[str, Dict[int, Any]]) -> Dict[str, Dict[int, Any]]:
+    """
+    按 基线/故障/恢复 三个阶段计算每个节点数据盘的写入吞吐与写入/刷盘延迟
+
+    返回:
+        dict: {阶段名: {节点索引: diff_disk_stats 结果}}
+    """
+    phases = {}
+    for phase, start, end in DISK_PHASES:
+        if start not in snapshots or end not in snapshots:
+            continue
+        phases[phase] = {idx: diff_disk_stats(snapshots[start].get(idx), snapshots[end].get(idx))
+                         for idx in range(ctx.node_num)}
+    return phases
+
+
+@with_run_context
+def disk_io_fault_scenario(bat_path: str = "test.bat",
+                           test_result_file_path: str = "test_result.txt",
+                           storing_path: str = "single_run_results") -> Dict[str, Any]:
+    """
+    运行磁盘I/O故障场景
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        storing_path: 结果输出路径
+    """
+    current_time = int(time.time())
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始磁盘I/O故障场景实验：{', '.join(describe_fault(f) for f in get_disk_io_faults())}")
+    logging.info(f"{'='*80}")
+
+    # 修改DB_SWITCH配置
+    logging.info("\n【配置数据库】修改benchmark配置中的DB_SWITCH...")
+    if not modify_db_switch():
+        logging.error("❌ 修改DB_SWITCH失败，实验终止")
+        return None
+
+    exp_result = disk_io_fault_scenario_single_run(
+        bat_path=bat_path,
+        test_result_file_path=test_result_file_path,
+        output_store_path=output_store_path
+    )
+
+    logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+    return exp_result
+
+
+def disk_io_fault_scenario_single_run(bat_path, test_result_file_path, output_store_path):
+    """
+    单次磁盘I/O故障场景主函数：清理→启动→等待20分钟→异常测试(期间对目标节点数据盘施加I/O故障)→结果存储→停止系统
+
+    参数：
+        bat_path: str - 测试用bat文件的完整路径
+        test_result_file_path: str - 单次测试结果文件的完整路径
+        output_store_path: str - 最终测试结果集合的存储路径
+
+    返回：
+        dict - 异常测试的结果集合（含状态信息及各阶段磁盘统计）
+    """
+    faults = get_disk_io_faults()
+    faults_desc = ", ".join(describe_fault(fault) for fault in faults)
+    strategy = ctx.get("FAULT_TARGET_STRATEGY", "random")
+    target_count = ctx.get("DISK_IO_FAULT_NODES", 1)
+    target_nodes = []
+
+    # 初始化测试结果集合
+    all_test_results = {
+        "scenario_name": "disk_io_fault_scenario_single_run",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "disk_io_faults": faults,
+        "target_strategy": strategy,
+        "target_nodes": target_nodes,
+        "test_results": [],
+        "end_time": "",
+        "status": "running"
+    }
+
+    try:
+        # -------------------------- 1. 清理所有节点 --------------------------
+        logging.info("【步骤1/5】清理所有节点...")
+        clean_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            clean_threads.append(t)
+
+        time.sleep(10)
+        logging.info("【步骤1/5】所有节点清理完成")
+
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # 同时移除所有节点的I/O故障（预防性清理）
+        logging.info("【步骤1/5】预防性移除节点故障...")
+        remove_faults_from_nodes()
+
+        # -------------------------- 2. 启动所有ConfigNode --------------------------
+        logging.info("\n【步骤2/5】启动所有ConfigNode...")
+        config_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
+            t.start()
+            config_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤2/5】所有ConfigNode启动完成")
+
+        # -------------------------- 3. 启动所有DataNode --------------------------
+        logging.info("\n【步骤3/5】启动所有DataNode...")
+        data_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
+            t.start()
+            data_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤3/5】所有DataNode启动完成")
+
+        # -------------------------- 4. 启动节点监控系统 --------------------------
+        logging.info("\n【步骤4/5】启动节点监控系统（Prometheus + Grafana）...")
+        start_monitoring_system()
+        logging.info("【步骤4/5】节点监控系统启动完成")
+
+        # -------------------------- 5. 异常测试：等待20分钟后开始，期间施加磁盘I/O故障 --------------------------
+        logging.info(f"\n【步骤5/5】预热等待后开始异常测试（期间对目标节点数据盘施加 {faults_desc}）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
+
+        # 按 FAULT_TARGET_STRATEGY 选择目标节点（默认1个，非0号节点）
+        topology = probe_cluster_topology() if strategy != "random" else None
+        target_nodes.extend(select_fault_targets(target_count, strategy, topology=topology))
+        all_test_results["cluster_topology"] = topology
+        all_test_results["leader_excluded"] = config_leader_excluded(strategy, topology)
+
+        # 基线/故障/恢复三个阶段的边界各采集一次数据盘计数器
+        disk_snapshots = {}
+        snapshot_disk_stats(disk_snapshots, "test_start")
+
+        # 创建异步执行磁盘I/O故障操作的线程
+        def disk_fault_operation():
+            logging.info(f"等待10分钟后对节点 {target_nodes} 施加磁盘I/O故障...")
+            time.sleep(10 * 60)  # 等待10分钟
+
+            snapshot_disk_stats(disk_snapshots, "fault_applied")
+            apply_faults_to_nodes(target_nodes, faults)
+
+            logging.info("等待15分钟后移除磁盘I/O故障...")
+            time.sleep(15 * 60)  # 等待15分钟
+
+            remove_faults_from_nodes(target_nodes, faults)
+            snapshot_disk_stats(disk_snapshots, "fault_removed")
+            logging.info("磁盘I/O故障操作完成")
+
+        # 启动磁盘I/O故障操作线程
+        operation_thread = ContextThread(target=disk_fault_operation)
+        operation_thread.start()
+
+        # 同时开始异常测试
+        logging.info("开始异常测试...")
+        abnormal_test = run_bat_and_parse(
+            bat_path=bat_path,
+            result_file_path=test_result_file_path
+        )
+        abnormal_test["test_phase"] = "abnormal"
+        abnormal_test["phase_description"] = f"磁盘I/O故障测试（异常状态 - {faults_desc}，影响节点: {target_nodes}）"
+        abnormal_test["affected_nodes"] = target_nodes
+        all_test_results["test_results"].append(abnormal_test)
+
+        # 等待磁盘I/O故障操作完成
+        operation_thread.join()
+        snapshot_disk_stats(disk_snapshots, "test_end")
+        all_test_results["disk_phases"] = summarize_disk_phases(disk_snapshots)
+        for phase, per_node in all_test_results["disk_phases"].items():
+            for idx in target_nodes:
+                stats = per_node.get(idx) or {}
+                logging.info(f"【磁盘统计】{phase} 节点 {idx}: 写入 {stats.get('write_mb_s')} MB/s，"
+                             f"写延迟 {stats.get('write_await_ms')} ms，刷盘延迟 {stats.get('flush_await_ms')} ms")
+        logging.info("【步骤5/5】异常测试和磁盘I/O故障操作均完成")
+
+        # -------------------------- 6. 更新场景状态，存储结果 --------------------------
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "finished"
+        logging.info(f"\n{'='*60}")
+        logging.info(f"场景执行完成！开始将结果写入存储文件：{output_store_path}")
+
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.info(f"✅ 结果已成功存储到 {output_store_path}")
+
+    except Exception as e:
+        error_msg = f"场景执行异常：{str(e)}"
+        logging.error(f"\n❌ {error_msg}")
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "failed"
+        all_test_results["error_msg"] = error_msg
+
+        # 异常情况下也要移除I/O故障
+        try:
+            remove_faults_from_nodes(target_nodes)
+        except Exception as restore_error:
+            logging.warning(f"⚠️ 移除磁盘I/O故障时出错: {restore_error}")
+
+        # 存储异常状态下的结果
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
+
+    finally:
+        # 最终清理：确保I/O故障移除并停止所有节点
+        try:
+            logging.info("\n【最终步骤】确保磁盘I/O故障移除...")
+            remove_faults_from_nodes(target_nodes)
+        except Exception as e:
+            logging.warning(f"⚠️ 最终移除磁盘I/O故障时出错: {e}")
+
+        restore_dataset_properties()
+
+        logging.info("【最终步骤】停止所有节点...")
+        stop_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            stop_threads.append(t)
+        time.sleep(10)
+        logging.info("【最终步骤】所有节点停止完成")
+
+    return all_test_results
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    disk_io_fault_scenario()
@@ -0,0 +1,410 @@
+import json
+import shlex
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from tools import open_ssh, run_remote_command, run_on_nodes
+from node_faults import (FAULT_KINDS, describe_fault, apply_faults_to_nodes, remove_faults_from_nodes,
+                         build_fault_apply_script, build_fault_remove_script, build_fault_probe_script,
+                         parse_fault_probe)
+from netem_tools import (describe_impairment, apply_scoped_impairment, remove_impairment_from_nodes,
+                         build_impairment_commands, build_peer_shaping_commands, get_network_interface,
+                         resolve_impairment_links, IMPAIRMENT_PROBE_COMMAND, parse_impairment_probe)
+from partition_tools import (build_block_map, apply_partition_rules, remove_partition_rules, resolve_partition_spec,
+                             split_block_map, build_partition_script, build_cleanup_script,
+                             build_partition_probe_script, parse_partition_probe)
+from partition_topology import single_node_isolation, majority_minority
+from run_manifest import record_event
+from fault_watchdog import (build_watchdog_arm_script, parse_watchdog_probe, WATCHDOG_CANCEL_SCRIPT,
+                            WATCHDOG_PROBE_SCRIPT)
+from harness_trace import traced
+from run_context import ctx
+
+# 统一的故障描述 {"kind": ..., 参数...}，供场景与命令行 inject/heal 共用：
+#   {"kind": "partition"}                    目标节点与其余节点双向隔离（多个目标时作为少数派整体隔离）
+#   {"kind": "network", "delay_ms": 100, ...} 按 IMPAIRMENT_SCOPE 对目标节点施加网络损伤，参数同 NETWORK_IMPAIRMENT
+#   node_faults 的各故障类型                   例如 {"kind": "cpu_stress", "workers": 4}
+CONTROL_KINDS = ("partition", "network") + tuple(FAULT_KINDS)
+
+
+def validate_fault(fault: Dict[str, Any]) -> Dict[str, Any]:
+    """检查故障类型，返回故障描述本身"""
+    if fault.get("kind") not in CONTROL_KINDS:
+        raise ValueError(f"未知的故障类型: {fault.get('kind')}，可选值: {CONTROL_KINDS}")
+    return fault
+
+
+def describe_fault_spec(fault: Dict[str, Any]) -> str:
+    """生成故障的简短描述"""
+    if fault["kind"] == "partition":
+        return "网络隔离"
+    if fault["kind"] == "network":
+        return f"网络损伤({describe_impairment({k: v for k, v in fault.items() if k != 'kind'})})"
+    return describe_fault(fault)
+
+
+def apply_fault(fault: Dict[str, Any], target_nodes: List[int]) -> Dict[str, Any]:
+    """
+    对目标节点施加故障
+
+    返回:
+        dict: 故障的实际生效范围，用于写入测试结果
+    """
+    validate_fault(fault)
+    logging.info(f"【故障控制】对节点 {target_nodes} 施加{describe_fault_spec(fault)}")
+    if fault["kind"] == "partition":
+        if len(target_nodes) == 1:
+            topology = single_node_isolation(ctx.node_num, target_nodes[0])
+        else:
+            topology = majority_minority(ctx.node_num, target_nodes)
+        apply_partition_rules(build_block_map(topology["blocked_pairs"]))
+        return {"partition": topology["name"]}
+    if fault["kind"] == "network":
+        return apply_scoped_impairment(target_nodes, {k: v for k, v in fault.items() if k != "kind"})
+    apply_faults_to_nodes(target_nodes, [fault])
+    return {"nodes": list(target_nodes)}
+
+
+def remove_fault(fault: Dict[str, Any] = None, target_nodes: List[int] = None):
+    """移除故障；fault 为 None 时清理所有节点上本工具施加的分区、网络损伤和节点故障"""
+    if fault is None or fault["kind"] == "partition":
+        remove_partition_rules()
+    if fault is None or fault["kind"] == "network":
+        remove_impairment_from_nodes()
+    if fault is None:
+        remove_faults_from_nodes()
+    elif fault["kind"] not in ("partition", "network"):
+        remove_faults_from_nodes(target_nodes, [fault])
+
+
+# ---------------- 现状读取与增量调和（命令行 inject / heal / status） ----------------
+# 每个节点的故障状态分三类，期望状态与现状都用同一结构描述：
+#   {"partition": {"OUTPUT": [对端], "INPUT": [对端], "spec": 规则范围} 或 None,
+#    "network":   {"interface": 网卡, "commands": [tc命令], "desc": 描述} 或 None,
+#    "faults":    {故障类型: 故障参数}}
+# 现状从节点上实时读取（专用链与ipset、句柄为 1: 的根队列、各资源故障的标记），本工具最后一次调和时
+# 施加的参数记录在节点上的 FAULT_STATE_FILE 中，用来判断参数是否与期望一致；只有不一致的部分才会变更
+FAULT_STATE_FILE = "/tmp/abnormal_fault_state.json"
+_SECTION_MARK = "@@abnormal@@"
+# 没有调和记录的遗留故障（例如场景异常退出），参数未知，只能保持或移除
+_UNKNOWN = "unknown_params"
+
+
+def empty_node_state() -> Dict[str, Any]:
+    """没有任何故障的节点状态"""
+    return {"partition": None, "network": None, "faults": {}}
+
+
+def build_state_probe_script(node_idx: int) -> str:
+    """生成一次读取节点上全部故障现状的shell脚本，各部分以 _SECTION_MARK 分隔"""
+    sections = {
+        "partition": build_partition_probe_script(),
+        "network": IMPAIRMENT_PROBE_COMMAND,
+        "faults": build_fault_probe_script(node_idx),
+        "watchdog": WATCHDOG_PROBE_SCRIPT,
+        "recorded": f"cat {FAULT_STATE_FILE} 2>/dev/null; true",
+    }
+    return "; ".join(f"echo {_SECTION_MARK} {name}; {script}" for name, script in sections.items())
+
+
+def parse_state_probe(output: str) -> Dict[str, Any]:
+    """
+    解析 build_state_probe_script 的输出
+
+    返回:
+        dict: {"partition": ..., "network": ..., "faults": [正在生效的类型], "watchdog": 看门狗剩余秒数或None,
+               "recorded": 上次调和记录的状态或None}
+    """
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith(_SECTION_MARK):
+            current = line[len(_SECTION_MARK):].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    try:
+        recorded = json.loads("\n".join(sections.get("recorded", [])) or "null")
+    except ValueError:
+        recorded = None
+    return {
+        "partition": parse_partition_probe("\n".join(sections.get("partition", []))),
+        "network": parse_impairment_probe("\n".join(sections.get("network", []))),
+        "faults": parse_fault_probe("\n".join(sections.get("faults", []))),
+        "watchdog": parse_watchdog_probe("\n".join(sections.get("watchdog", []))),
+        "recorded": recorded,
+    }
+
+
+def read_node_state(node_idx: int, ssh=None) -> Dict[str, Any]:
+    """通过一次SSH往返读取单个节点的故障现状，见 parse_state_probe"""
+    script = build_state_probe_script(node_idx)
+    exit_status, output, error_output = run_remote_command(
+        node_idx, f"sudo sh -c {shlex.quote(script)}", get_pty=True, ssh=ssh)
+    if exit_status != 0:
+        raise RuntimeError(f"读取故障现状失败: {error_output or output}")
+    return parse_state_probe(output)
+
+
+@traced("fault")
+def read_cluster_state(node_indices: List[int] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    并行读取各节点的故障现状
+
+    返回:
+        dict: {节点索引: 现状}，读取失败的节点为None
+    """
+    if node_indices is None:
+        node_indices = list(range(ctx.node_num))
+    return run_on_nodes(read_node_state, node_indices)
+
+
+def desired_from_live(live: Dict[int, Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    以现状作为期望状态的起点：仍在生效的故障保持上次记录的参数，没有记录的（例如场景异常退出遗留的）保留为未知参数
+    """
+    desired = {}
+    for node_idx, state in live.items():
+        if state is None:
+            continue
+        recorded = state.get("recorded") or empty_node_state()
+        node = empty_node_state()
+        if state["partition"] is not None:
+            node["partition"] = recorded.get("partition") or {**state["partition"], "spec": None}
+        if state["network"] is not None:
+            node["network"] = recorded.get("network") or {"interface": state["network"]["interface"],
+                                                          "commands": None, "desc": state["network"]["detail"]}
+        for kind in state["faults"]:
+            node["faults"][kind] = (recorded.get("faults") or {}).get(kind) or {"kind": kind, _UNKNOWN: True}
+        desired[node_idx] = node
+    return desired
+
+
+def overlay_fault(desired: Dict[int, Dict[str, Any]], fault: Dict[str, Any], target_nodes: List[int]):
+    """
+    在期望状态上叠加一个故障：分区和网络损伤替换整个集群上的同类状态，资源故障只作用于目标节点
+
+    参数:
+        desired: {节点索引: 期望状态}，原地修改
+        fault: 故障描述（kill 除外，它不是可持续的节点状态）
+        target_nodes: 目标节点
+    """
+    validate_fault(fault)
+    if fault["kind"] == "kill":
+        raise ValueError("kill 不是可调和的节点状态，请直接用 apply_fault")
+    for node_idx in range(ctx.node_num):
+        desired.setdefault(node_idx, empty_node_state())
+
+    if fault["kind"] == "partition":
+        if len(target_nodes) == 1:
+            topology = single_node_isolation(ctx.node_num, target_nodes[0])
+        else:
+            topology = majority_minority(ctx.node_num, target_nodes)
+        spec = resolve_partition_spec()
+        dst_peers, src_peers = split_block_map(build_block_map(topology["blocked_pairs"]), spec)
+        for node_idx, node in desired.items():
+            if node_idx in dst_peers or node_idx in src_peers:
+                node["partition"] = {"OUTPUT": sorted(dst_peers.get(node_idx, [])),
+                                     "INPUT": sorted(src_peers.get(node_idx, [])), "spec": spec}
+            else:
+                node["partition"] = None
+        return
+
+    if fault["kind"] == "network":
+        impairment = {k: v for k, v in fault.items() if k != "kind"}
+        desc = describe_impairment(impairment)
+        network: Dict[int, Dict[str, Any]] = {}
+        if ctx.get("IMPAIRMENT_SCOPE", "peer") == "interface":
+            for node_idx in target_nodes:
+                interface = get_network_interface(node_idx)
+                network[node_idx] = {"interface": interface, "desc": desc,
+                                     "commands": build_impairment_commands(interface, impairment)}
+        else:
+            links_by_node: Dict[int, List[Dict[str, Any]]] = {}
+            for link in resolve_impairment_links(target_nodes, impairment):
+                links_by_node.setdefault(link["from"], []).append(link)
+            for node_idx, links in links_by_node.items():
+                interface = get_network_interface(node_idx)
+                network[node_idx] = {"interface": interface, "desc": f"{desc} -> {[l['to'] for l in links]}",
+                                     "commands": build_peer_shaping_commands(interface, links)}
+        for node_idx, node in desired.items():
+            node["network"] = network.get(node_idx)
+        return
+
+    for node_idx in target_nodes:
+        desired[node_idx]["faults"][fault["kind"]] = dict(fault)
+
+
+def _same_partition(live: Optional[Dict[str, Any]], want: Dict[str, Any]) -> bool:
+    return all(sorted(live[d], key=str) == sorted(want[d], key=str) for d in ("OUTPUT", "INPUT"))
+
+
+def plan_node_changes(node_idx: int, live: Dict[str, Any], want: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """
+    比较单个节点的现状与期望状态，生成需要执行的变更
+
+    分区只比较被阻断的对端与规则范围；网络损伤与资源故障在仍生效、且上次记录的参数与期望一致时视为无需变更
+
+    返回:
+        list: [(状态类别, 变更描述, 以root执行的shell脚本), ...]，类别为 partition / network / 故障类型，
+              按执行顺序排列（先移除后施加）
+    """
+    recorded = live.get("recorded") or empty_node_state()
+    changes: List[Tuple[str, str, str]] = []
+
+    want_partition = want["partition"]
+    if want_partition is None:
+        if live["partition"] is not None:
+            changes.append(("partition", "移除分区规则", build_cleanup_script()))
+    elif live["partition"] is None or not _same_partition(live["partition"], want_partition) \
+            or (recorded.get("partition") or {}).get("spec") != want_partition["spec"]:
+        changes.append(("partition", f"阻断 发往 {want_partition['OUTPUT']} / 来自 {want_partition['INPUT']}",
+                        build_partition_script(want_partition["OUTPUT"], want_partition["INPUT"],
+                                               want_partition["spec"])))
+
+    want_network = want["network"]
+    if want_network is None:
+        if live["network"] is not None:
+            changes.append(("network", "移除网络损伤", f"tc qdisc del dev {live['network']['interface']} root"))
+    elif live["network"] is None or (recorded.get("network") or {}).get("commands") != want_network["commands"]:
+        if not want_network["commands"]:
+            raise ValueError(f"节点 {node_idx} 的网络损伤参数未知，无法重新施加")
+        changes.append(("network", f"施加网络损伤 {want_network['desc']}", " && ".join(want_network["commands"])))
+
+    recorded_faults = recorded.get("faults") or {}
+    for kind in FAULT_KINDS:
+        active = kind in live["faults"]
+        wanted = want["faults"].get(kind)
+        if wanted is None:
+            if active:
+                changes.append((kind, f"移除节点故障 {kind}", build_fault_remove_script(node_idx, kind) + "; true"))
+            continue
+        if wanted.get(_UNKNOWN) or (active and recorded_faults.get(kind) == wanted):
+            continue
+        if active:
+            # 参数不一致：先移除再按期望参数重新施加
+            changes.append((kind, f"移除节点故障 {kind}", build_fault_remove_script(node_idx, kind) + "; true"))
+        changes.append((kind, f"施加节点故障 {describe_fault(wanted)}", build_fault_apply_script(node_idx, wanted)))
+    return changes
+
+
+def _record_script(state: Dict[str, Any]) -> str:
+    """生成在节点上记录本次调和结果的shell脚本，没有任何故障时删除记录文件"""
+    if state == empty_node_state():
+        return f"rm -f {FAULT_STATE_FILE}"
+    return f"echo {shlex.quote(json.dumps(state, ensure_ascii=False))} > {FAULT_STATE_FILE}"
+
+
+def reconcile_node(node_idx: int, live: Dict[str, Any], want: Dict[str, Any], dry_run: bool = False,
+                   ttl: int = None) -> Dict[str, Any]:
+    """
+    把单个节点调和到期望状态，所有变更复用一条SSH连接；现状已与期望一致、且看门狗无需变更时不建立连接
+
+    期望没有任何故障时同时取消节点上的看门狗；给出 ttl 时为仍有故障的节点启动（或推迟）看门狗，
+    ttl 秒后由节点自行清除全部故障
+
+    返回:
+        dict: {"changes": [变更描述], "failed": [失败的变更描述]}
+    """
+    changes = plan_node_changes(node_idx, live, want)
+    result = {"changes": [desc for _, desc, _ in changes], "failed": []}
+    watchdog_script = None
+    if want == empty_node_state():
+        if live.get("watchdog") is not None:
+            watchdog_script = WATCHDOG_CANCEL_SCRIPT
+    elif ttl:
+        watchdog_script = build_watchdog_arm_script(node_idx, ttl)
+    if dry_run or (not changes and watchdog_script is None and live.get("recorded") in (None, want)):
+        return result
+
+    recorded = json.loads(json.dumps(want))
+    ssh = open_ssh(node_idx)
+    try:
+        for category, desc, script in changes:
+            exit_status, output, error_output = run_remote_command(
+                node_idx, f"sudo sh -c {shlex.quote(script)}", get_pty=True, ssh=ssh)
+            if exit_status == 0:
+                logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) {desc}")
+                continue
+            logging.error(f"节点 {node_idx} {desc} 失败: {error_output or output}")
+            result["failed"].append(desc)
+            # 失败的部分不写入记录，下一次调和时会重新尝试
+            if category in ("partition", "network"):
+                recorded[category] = None
+            else:
+                recorded["faults"].pop(category, None)
+        run_remote_command(node_idx, f"sudo sh -c {shlex.quote(_record_script(recorded))}", get_pty=True, ssh=ssh)
+        if watchdog_script is not None:
+            exit_status, output, error_output = run_remote_command(
+                node_idx, f"sudo sh -c {shlex.quote(watchdog_script)}", ssh=ssh)
+            if exit_status != 0:
+                logging.error(f"节点 {node_idx} 设置看门狗失败: {error_output or output}")
+            elif ttl and watchdog_script != WATCHDOG_CANCEL_SCRIPT:
+                logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 的故障将在 {ttl} 秒后由看门狗自动清除")
+    finally:
+        ssh.close()
+    return result
+
+
+@traced("fault")
+def reconcile(desired: Dict[int, Dict[str, Any]], live: Dict[int, Dict[str, Any]] = None,
+              dry_run: bool = False, ttl: int = None) -> Dict[int, Dict[str, Any]]:
+    """
+    并行把各节点调和到期望状态，只执行现状与期望不一致的部分
+
+    参数:
+        desired: {节点索引: 期望状态}，未出现的节点视为没有任何故障
+        live: 已读取的现状，默认重新读取
+        dry_run: 只计算变更，不执行
+        ttl: 仍有故障的节点在 ttl 秒后由看门狗自动清除，None 表示不设置
+
+    返回:
+        dict: {节点索引: {"changes": [...], "failed": [...]}}，读取现状失败的节点为None
+    """
+    if live is None:
+        live = read_cluster_state(sorted(set(range(ctx.node_num)) | set(desired)))
+    unreachable = [idx for idx, state in live.items() if state is None]
+    if unreachable:
+        logging.error(f"【故障控制】节点 {unreachable} 无法读取现状，跳过调和")
+    reachable = sorted(idx for idx, state in live.items() if state is not None)
+    results = run_on_nodes(lambda idx: reconcile_node(idx, live[idx], desired.get(idx) or empty_node_state(),
+                                                      dry_run, ttl), reachable)
+    changed = {idx: r["changes"] for idx, r in results.items() if r and r["changes"]}
+    if not dry_run:
+        record_event("fault_reconciled", changes={str(k): v for k, v in changed.items()})
+    logging.info(f"【故障控制】{'计划变更' if dry_run else '调和完成'}: "
+                 f"{sum(len(v) for v in changed.values())} 项变更，涉及节点 {sorted(changed)}")
+    return {**{idx: None for idx in unreachable}, **results}
+
+
+def format_node_state(node_idx: int, state: Optional[Dict[str, Any]]) -> List[str]:
+    """节点故障现状的文本描述"""
+    header = f"节点 {node_idx} ({ctx.server_ip[node_idx]})"
+    if state is None:
+        return [f"{header}: 无法读取"]
+    recorded = state.get("recorded") or empty_node_state()
+    lines = []
+    if state["partition"] is not None:
+        lines.append(f"   分区: 阻断 发往 {state['partition']['OUTPUT']} / 来自 {state['partition']['INPUT']}")
+    if state["network"] is not None:
+        desc = (recorded.get("network") or {}).get("desc") or state["network"]["detail"]
+        lines.append(f"   网络损伤: {state['network']['interface']} {desc}")
+    for kind in state["faults"]:
+        fault = (recorded.get("faults") or {}).get(kind)
+        known = fault and not fault.get(_UNKNOWN)
+        lines.append(f"   节点故障: {describe_fault(fault) if known else kind + '（参数未知）'}")
+    if lines and state.get("watchdog") is not None:
+        lines.append(f"   看门狗: {max(state['watchdog'], 0)} 秒后自动清除")
+    return [f"{header}: {'正常' if not lines else ''}".rstrip()] + lines
+
+
+def heal_before_run():
+    """运行开始前读取各节点现状，清除上次运行遗留的故障；HEAL_BEFORE_RUN = False 时跳过"""
+    if not ctx.get("HEAL_BEFORE_RUN", True):
+        return
+    live = read_cluster_state()
+    dirty = sorted(idx for idx, state in live.items()
+                   if state is not None and (state["partition"] or state["network"] or state["faults"]))
+    if not dirty:
+        return
+    logging.warning(f"【故障控制】节点 {dirty} 上有遗留的故障，运行前先清除")
+    reconcile({}, live)
@@ -0,0 +1,181 @@
+import time
+import shlex
+import logging
+import threading
+from typing import Iterable, List
+from tools import run_remote_command, run_on_nodes
+from run_context import ctx, current_context, ContextThread
+
+# 节点端的故障看门狗（dead-man switch）：施加故障时在节点上启动一个脱离SSH会话的后台循环，
+# 截止时间写在 WATCHDOG_DEADLINE_FILE 中（以 /proc/uptime 计，不受时钟偏移故障影响），
+# 到期后在节点本地清除本工具施加的全部分区规则、网络损伤和资源故障。控制端存活期间定期推迟截止时间，
+# 控制端崩溃或卡死时故障最多再持续 FAULT_WATCHDOG_SECONDS 秒；删除截止时间文件即取消看门狗
+WATCHDOG_DEADLINE_FILE = "/tmp/abnormal_watchdog.deadline"
+WATCHDOG_PID_FILE = "/tmp/abnormal_watchdog.pid"
+WATCHDOG_POLL_SECONDS = 5
+
+_UPTIME = "$(cut -d. -f1 /proc/uptime)"
+_watchdog_lock = threading.Lock()
+
+
+def get_watchdog_timeout() -> int:
+    """看门狗超时（秒），0 或 None 表示不启用"""
+    return int(ctx.get("FAULT_WATCHDOG_SECONDS", 120) or 0)
+
+
+def build_watchdog_cleanup_script(node_idx: int) -> str:
+    """生成看门狗到期时在节点本地执行的清理脚本：分区专用链、句柄为 1: 的根队列、全部资源类故障与调和记录"""
+    from partition_tools import build_cleanup_script
+    from node_faults import build_fault_cleanup_script
+    from fault_control import FAULT_STATE_FILE
+
+    remove_qdiscs = ("for dev in $(tc qdisc show 2>/dev/null | "
+                     "awk '($2==\"netem\" || $2==\"htb\") && $3==\"1:\" && $6==\"root\" {print $5}'); do "
+                     "tc qdisc del dev $dev root; done")
+    return "; ".join([build_cleanup_script().replace("\n", "; "), remove_qdiscs,
+                      build_fault_cleanup_script(node_idx), f"rm -f {FAULT_STATE_FILE}"])
+
+
+def build_watchdog_arm_script(node_idx: int, timeout: int) -> str:
+    """
+    生成启动或推迟看门狗的shell脚本：写入新的截止时间，看门狗进程不存在时在后台启动
+
+    看门狗循环每 WATCHDOG_POLL_SECONDS 秒读取一次截止时间，文件被删除（取消）时直接退出，不做清理
+    """
+    loop = (f"while d=$(cat {WATCHDOG_DEADLINE_FILE} 2>/dev/null); do "
+            f"if [ {_UPTIME} -ge \"$d\" ]; then "
+            f"logger -t abnormal_watchdog '控制端超时，自动清除故障'; "
+            f"{build_watchdog_cleanup_script(node_idx)}; rm -f {WATCHDOG_DEADLINE_FILE}; break; fi; "
+            f"sleep {WATCHDOG_POLL_SECONDS}; done; rm -f {WATCHDOG_PID_FILE}")
+    return (f"echo $(({_UPTIME} + {int(timeout)})) > {WATCHDOG_DEADLINE_FILE} && "
+            f"{{ [ -f {WATCHDOG_PID_FILE} ] && kill -0 $(cat {WATCHDOG_PID_FILE}) 2>/dev/null || "
+            f"{{ setsid nohup sh -c {shlex.quote(loop)} >/dev/null 2>&1 < /dev/null & "
+            f"echo $! > {WATCHDOG_PID_FILE}; }}; }}")
+
+
+def build_watchdog_refresh_script(timeout: int) -> str:
+    """生成推迟截止时间的shell脚本，看门狗已取消或已到期时不做任何事"""
+    return f"[ -f {WATCHDOG_DEADLINE_FILE} ] && echo $(({_UPTIME} + {int(timeout)})) > {WATCHDOG_DEADLINE_FILE}; true"
+
+
+# 取消看门狗：先删除截止时间文件使循环退出，再结束进程
+WATCHDOG_CANCEL_SCRIPT = (f"rm -f {WATCHDOG_DEADLINE_FILE}; "
+                          f"[ -f {WATCHDOG_PID_FILE} ] && kill $(cat {WATCHDOG_PID_FILE}) 2>/dev/null; "
+                          f"rm -f {WATCHDOG_PID_FILE}; true")
+
+# 读取看门狗剩余秒数，未启用时无输出
+WATCHDOG_PROBE_SCRIPT = (f"[ -f {WATCHDOG_DEADLINE_FILE} ] && "
+                         f"echo watchdog $(($(cat {WATCHDOG_DEADLINE_FILE}) - {_UPTIME})); true")
+
+
+def parse_watchdog_probe(output: str):
+    """解析 WATCHDOG_PROBE_SCRIPT 的输出，返回剩余秒数，未启用时为None"""
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "watchdog" and parts[1].lstrip("-").isdigit():
+            return int(parts[1])
+    return None
+
+
+def _watchdog_state() -> dict:
+    """
+    当前运行上下文中的看门狗状态：{"nodes": {节点索引: {类别, ...}}, "armed_at": {节点索引: 时间戳},
+    "expired": {超过 FAULT_WATCHDOG_MAX_SECONDS 的节点}, "thread": 刷新线程}
+    """
+    return current_context().state.setdefault("watchdog", {"nodes": {}, "armed_at": {}, "expired": set(), "thread": None})
+
+
+def arm_watchdog(node_indices: Iterable[int], category: str, timeout: int = None, refresh: bool = True) -> List[int]:
+    """
+    在节点上启动（或推迟）看门狗，并登记该节点上生效的故障类别
+
+    参数:
+        node_indices: 节点索引
+        category: 故障类别（partition / network / fault:类型），全部类别移除后才取消看门狗
+        timeout: 截止时间距现在的秒数，默认取 FAULT_WATCHDOG_SECONDS
+        refresh: 是否由本进程定期推迟截止时间，False 时故障在 timeout 秒后自动恢复
+
+    返回:
+        list: 看门狗启动成功的节点
+    """
+    timeout = get_watchdog_timeout() if timeout is None else int(timeout)
+    node_indices = sorted(set(node_indices))
+    if not timeout or not node_indices:
+        return []
+
+    results = run_on_nodes(
+        lambda idx: run_remote_command(idx, f"sudo sh -c {shlex.quote(build_watchdog_arm_script(idx, timeout))}")[0] == 0,
+        node_indices)
+    armed = [idx for idx, ok in results.items() if ok]
+    failed = [idx for idx in node_indices if idx not in armed]
+    if failed:
+        logging.warning(f"【故障看门狗】节点 {failed} 启动看门狗失败，控制端异常退出时故障不会自动恢复")
+    if armed:
+        logging.info(f"【故障看门狗】节点 {armed} 的 {category} 已受看门狗保护，控制端失联 {timeout} 秒后自动恢复")
+    if not refresh:
+        return armed
+
+    state = _watchdog_state()
+    with _watchdog_lock:
+        for idx in armed:
+            state["nodes"].setdefault(idx, set()).add(category)
+            state["armed_at"].setdefault(idx, time.time())
+        if state["thread"] is None or not state["thread"].is_alive():
+            state["thread"] = ContextThread(target=_refresh_loop, args=(state, timeout), daemon=True)
+            state["thread"].start()
+    return armed
+
+
+def disarm_watchdog(node_indices: Iterable[int], categories: Iterable[str] = None):
+    """
+    注销节点上的故障类别，节点上已没有登记的类别时取消看门狗
+
+    参数:
+        node_indices: 节点索引
+        categories: 需要注销的类别，None 表示全部类别
+    """
+    state = _watchdog_state()
+    to_cancel = []
+    with _watchdog_lock:
+        for idx in node_indices:
+            registered = state["nodes"].get(idx)
+            if registered is None:
+                continue
+            if categories is None:
+                registered.clear()
+            else:
+                registered.difference_update(categories)
+            if not registered:
+                state["nodes"].pop(idx)
+                state["armed_at"].pop(idx, None)
+                state["expired"].discard(idx)
+                to_cancel.append(idx)
+    if to_cancel:
+        run_on_nodes(lambda idx: run_remote_command(idx, f"sudo sh -c {shlex.quote(WATCHDOG_CANCEL_SCRIPT)}"),
+                     to_cancel)
+        logging.info(f"【故障看门狗】节点 {to_cancel} 的故障已全部移除，看门狗已取消")
+
+
+def _refresh_loop(state: dict, timeout: int):
+    """
+    控制端存活期间每 timeout/3 秒推迟一次各节点的截止时间，没有登记的节点时退出
+
+    设置了 FAULT_WATCHDOG_MAX_SECONDS 时，故障持续超过该时长的节点不再推迟，由看门狗强制恢复
+    """
+    interval = max(1, timeout // 3)
+    max_seconds = ctx.get("FAULT_WATCHDOG_MAX_SECONDS", None)
+    while True:
+        time.sleep(interval)
+        with _watchdog_lock:
+            if not state["nodes"]:
+                state["thread"] = None
+                return
+            now = time.time()
+            nodes = [idx for idx in state["nodes"]
+                     if not max_seconds or now - state["armed_at"].get(idx, now) < max_seconds]
+            expired = sorted(set(state["nodes"]) - set(nodes) - state["expired"])
+            state["expired"].update(expired)
+        if expired:
+            logging.warning(f"【故障看门狗】节点 {expired} 的故障已超过 {max_seconds} 秒，停止推迟，将由看门狗自动恢复")
+        run_on_nodes(lambda idx: run_remote_command(idx, f"sudo sh -c {shlex.quote(build_watchdog_refresh_script(timeout))}"),
+                     nodes)
@@ -0,0 +1,129 @@
+import json
+import base64
+import queue
+import logging
+import threading
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+from run_context import ctx, current_context, ContextThread
+
+# 故障阶段标注：分区、网络损伤、资源故障、节点/组件停止等故障开始时在 Grafana 中添加一条区域标注（region annotation），
+# 结束时补上结束时间，所有面板上即可看到故障的起止时刻。标注带 abnormal、场景名和故障类别标签；
+# 未设置 GRAFANA_DASHBOARD_UID 时为组织级标注，需要在仪表板的标注查询中按 abnormal 标签过滤显示
+# 请求由后台线程按顺序发送，Grafana 不可用时只记录一次警告，不影响运行
+_annotation_queue: "queue.Queue[Tuple[str, Dict[str, Any], Any]]" = queue.Queue()
+_annotation_lock = threading.Lock()
+_annotation_worker = None
+# 已添加、尚未结束的标注 {(上下文名称, 故障类别): 标注id}
+_open_annotations: Dict[Tuple[str, str], Optional[int]] = {}
+_warned = False
+
+
+def get_grafana_url() -> str:
+    """Grafana地址，默认为0号节点的3000端口，可用config中的 GRAFANA_URL 覆盖"""
+    return (ctx.get("GRAFANA_URL", None) or f"http://{ctx.server_ip[0]}:3000").rstrip("/")
+
+
+def _auth_header() -> str:
+    """GRAFANA_API_TOKEN（服务账号令牌）优先，否则使用 GRAFANA_USER / GRAFANA_PASSWORD 的基本认证"""
+    token = ctx.get("GRAFANA_API_TOKEN", None)
+    if token:
+        return f"Bearer {token}"
+    credentials = f"{ctx.get('GRAFANA_USER', 'admin')}:{ctx.get('GRAFANA_PASSWORD', 'admin')}"
+    return "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+
+def grafana_request(method: str, path: str, body: Dict[str, Any], settings: Dict[str, str]) -> Dict[str, Any]:
+    """
+    调用 Grafana HTTP API
+
+    参数:
+        method: POST / PATCH
+        path: 以 /api 开头的路径
+        body: JSON请求体
+        settings: {"url", "auth"}，在事件发生时从运行上下文取得
+
+    返回:
+        dict: 响应JSON
+    """
+    request = urllib.request.Request(f"{settings['url']}{path}", data=json.dumps(body).encode("utf-8"), method=method,
+                                     headers={"Content-Type": "application/json", "Authorization": settings["auth"]})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read().decode("utf-8") or "{}")
+
+
+def _describe(details: Dict[str, Any]) -> str:
+    """故障详情的简短文本，用于标注内容"""
+    text = json.dumps(details, ensure_ascii=False, default=str, separators=(",", ":"))
+    return text if len(text) <= 300 else text[:297] + "..."
+
+
+def annotate_transitions(transitions: List[tuple], timestamp: float):
+    """
+    为故障的开始/结束添加或结束 Grafana 区域标注（由 record_event 调用），GRAFANA_ANNOTATIONS 为 False 时不做任何事
+
+    参数:
+        transitions: run_progress.note_event 返回的 [(类别, 是否为开始, 详情)]
+        timestamp: 事件发生的时间戳（秒），标注使用事件时间而非请求发送时间
+    """
+    if not transitions or not ctx.get("GRAFANA_ANNOTATIONS", True):
+        return
+    context = current_context()
+    settings = {"url": get_grafana_url(), "auth": _auth_header(),
+                "dashboard_uid": ctx.get("GRAFANA_DASHBOARD_UID", None),
+                "scenario": str(context.abnormal_scenario), "context": context.name or "default"}
+    for category, started, details in transitions:
+        _annotation_queue.put((category, {"started": started, "details": details, "time": int(timestamp * 1000)},
+                               settings))
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _annotation_worker
+    with _annotation_lock:
+        if _annotation_worker is None or not _annotation_worker.is_alive():
+            _annotation_worker = ContextThread(target=_annotation_loop, daemon=True)
+            _annotation_worker.start()
+
+
+def _send_annotation(category: str, event: Dict[str, Any], settings: Dict[str, Any]):
+    """添加一条标注或为已有标注补上结束时间"""
+    key = (settings["context"], category)
+    if event["started"]:
+        body = {"time": event["time"], "tags": ["abnormal", settings["scenario"], category],
+                "text": f"【{settings['scenario']}】{category} 开始 {_describe(event['details'])}"}
+        if settings["dashboard_uid"]:
+            body["dashboardUID"] = settings["dashboard_uid"]
+        _open_annotations[key] = grafana_request("POST", "/api/annotations", body, settings).get("id")
+    elif _open_annotations.get(key) is not None:
+        annotation_id = _open_annotations.pop(key)
+        grafana_request("PATCH", f"/api/annotations/{annotation_id}", {"timeEnd": event["time"]}, settings)
+    else:
+        # 开始时的标注未能添加，结束时也无法补上
+        _open_annotations.pop(key, None)
+
+
+def _annotation_loop():
+    global _warned
+    while True:
+        category, event, settings = _annotation_queue.get()
+        try:
+            _send_annotation(category, event, settings)
+        except Exception as e:
+            if not _warned:
+                _warned = True
+                logging.warning(f"⚠️ 【故障标注】无法写入 Grafana 标注（{settings['url']}）: {e}，之后的失败不再提示")
+        finally:
+            _annotation_queue.task_done()
+
+
+def flush_annotations(timeout: float = 10) -> bool:
+    """
+    等待已排队的标注发送完成（运行结束时调用）
+
+    返回:
+        bool: 是否在超时前全部发送
+    """
+    done = threading.Event()
+    ContextThread(target=lambda: (_annotation_queue.join(), done.set()), daemon=True).start()
+    return done.wait(timeout)
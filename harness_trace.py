@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from run_context import ctx, current_context
+
+# 控制端自剖析：记录本工具自身每个操作的耗时（SSH连接与命令执行、故障施加与移除、结果解析、汇总、写文件、
+# 并行线程等），写成 Chrome trace 格式（chrome://tracing 或 https://ui.perfetto.dev 打开），
+# 用于判断控制端给故障时间点带来多少偏差、控制端时间花在哪里。HARNESS_TRACE 或命令行 --trace 开启；
+# 未开启时 span/traced 只多一次布尔判断。HARNESS_PROFILE 另外以 cProfile 或 pyinstrument 剖析主线程
+TRACE_MAX_EVENTS = 500000
+_COMMAND_PREVIEW = 80
+
+_trace_lock = threading.Lock()
+_enabled = False
+_events: List[Dict[str, Any]] = []
+_thread_names: Dict[int, str] = {}
+_origin_ns = 0
+_started_at = 0.0
+_dropped = 0
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def start_tracing():
+    """开始记录（清空之前的记录）"""
+    global _enabled, _origin_ns, _started_at, _dropped
+    with _trace_lock:
+        _events.clear()
+        _thread_names.clear()
+        _dropped = 0
+        _origin_ns = time.perf_counter_ns()
+        _started_at = time.time()
+        _enabled = True
+
+
+def _record(name: str, cat: str, start_ns: int, end_ns: int, args: Dict[str, Any]):
+    global _dropped
+    thread = threading.current_thread()
+    event = {"name": name, "cat": cat, "ph": "X", "ts": (start_ns - _origin_ns) / 1000,
+             "dur": (end_ns - start_ns) / 1000, "pid": os.getpid(), "tid": thread.ident,
+             "args": {"context": current_context().name or "default", **args}}
+    with _trace_lock:
+        if len(_events) >= TRACE_MAX_EVENTS:
+            _dropped += 1
+            return
+        _events.append(event)
+        _thread_names.setdefault(thread.ident, thread.name)
+
+
+@contextmanager
+def span(name: str, cat: str = "harness", **args):
+    """
+    记录一段操作的耗时，产生异常时记录异常类型
+
+    用法:
+        with span("ssh_exec", "ssh", node=1) as info:
+            ...
+            info["lines"] = 10  # 可在结束前补充参数
+    """
+    if not _enabled:
+        yield args
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        _record(name, cat, start, time.perf_counter_ns(), args)
+
+
+def traced(cat: str, name: str = None):
+    """函数装饰器：以函数名（或 name）记录每次调用的耗时"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(label, cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def preview_command(command: str) -> str:
+    """命令的简短形式，只保留前 _COMMAND_PREVIEW 个字符"""
+    command = " ".join(command.split())
+    return command if len(command) <= _COMMAND_PREVIEW else command[:_COMMAND_PREVIEW] + "..."
+
+
+def summarize_trace(events: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    按 (类别, 名称) 汇总耗时
+
+    返回:
+        list: [{"cat", "name", "count", "total_ms", "avg_ms", "max_ms", "errors"}]，按总耗时降序
+    """
+    if events is None:
+        with _trace_lock:
+            events = list(_events)
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for event in events:
+        group = groups.setdefault((event["cat"], event["name"]), {
+            "cat": event["cat"], "name": event["name"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+        group["count"] += 1
+        group["total_ms"] += event["dur"] / 1000
+        group["max_ms"] = max(group["max_ms"], event["dur"] / 1000)
+        group["errors"] += "error" in event["args"]
+    summary = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+    for group in summary:
+        group["avg_ms"] = round(group["total_ms"] / group["count"], 3)
+        group["total_ms"] = round(group["total_ms"], 3)
+        group["max_ms"] = round(group["max_ms"], 3)
+    return summary
+
+
+def stop_tracing(path: str = None) -> Optional[str]:
+    """
+    停止记录，写出 trace 文件并在日志中打印耗时最多的操作
+
+    参数:
+        path: 输出路径，默认为 OUTPUT_STORE_PATH/harness_trace_{时间戳}.json
+
+    返回:
+        str: trace 文件路径，未开启时为None
+    """
+    global _enabled
+    with _trace_lock:
+        if not _enabled:
+            return None
+        _enabled = False
+        events = list(_events)
+        thread_names = dict(_thread_names)
+    if path is None:
+        path = os.path.join(ctx.OUTPUT_STORE_PATH, f"harness_trace_{int(_started_at)}.json")
+    metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread_name}}
+                for tid, thread_name in thread_names.items()]
+    summary = summarize_trace(events)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                   "otherData": {"start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_started_at)),
+                                 "dropped_events": _dropped, "summary": summary}},
+                  f, ensure_ascii=False)
+    logging.info(f"【自剖析】记录 {len(events)} 个操作，trace 已写入 {path}")
+    for group in summary[:15]:
+        logging.info(f"   {group['cat']:<10} {group['name']:<32} {group['count']:>6} 次  总计 {group['total_ms']:>12.1f} ms"
+                     f"  平均 {group['avg_ms']:>10.1f} ms  最长 {group['max_ms']:>10.1f} ms"
+                     + (f"  失败 {group['errors']}" if group["errors"] else ""))
+    if _dropped:
+        logging.warning(f"⚠️ 【自剖析】超过 {TRACE_MAX_EVENTS} 个操作，之后的 {_dropped} 个未记录")
+    return path
+
+
+class HarnessProfiler:
+    """
+    主线程剖析：mode 为 "cprofile"（标准库，输出 .prof，可用 snakeviz 等查看）或 "pyinstrument"（可选依赖，输出 .html）
+
+    只剖析调用 start 的线程；各节点的并行线程请看 trace
+    """
+
+    def __init__(self, mode: str):
+        if mode not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"未知的剖析模式 {mode}，可选 cprofile / pyinstrument")
+        self.mode = mode
+        self._profiler = None
+
+    def start(self):
+        if self.mode == "pyinstrument":
+            try:
+                from pyinstrument import Profiler  # 可选依赖，只在使用时导入
+            except ImportError:
+                raise ValueError("剖析模式 pyinstrument 需要先安装 pyinstrument（pip install pyinstrument）")
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self) -> str:
+        """停止剖析并写出结果，返回文件路径"""
+        stamp = int(time.time())
+        if self.mode == "pyinstrument":
+            self._profiler.stop()
+            path = os.path.join(ctx.OUTPUT_STORE_PATH, f"harness_profile_{stamp}.html")
+            os.makedirs(ctx.OUTPUT_STORE_PATH, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+        else:
+            import io
+            import pstats
+            self._profiler.disable()
+            path = os.path.join(ctx.OUTPUT_STORE_PATH, f"harness_profile_{stamp}.prof")
+            os.makedirs(ctx.OUTPUT_STORE_PATH, exist_ok=True)
+            self._profiler.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(self._profiler, stream=text).sort_stats("cumulative").print_stats(15)
+            logging.info(f"【自剖析】主线程累计耗时最多的函数:\n{text.getvalue()}")
+        logging.info(f"【自剖析】剖析结果已写入 {path}")
+        return path
+
+
+@contextmanager
+def harness_instrumentation(trace: bool = None, profile: str = None):
+    """
+    在入口处包住一条命令：按参数（默认取 HARNESS_TRACE / HARNESS_PROFILE）开启 trace 与剖析，结束时写出结果
+
+    参数:
+        trace: 是否记录 trace
+        profile: None / "cprofile" / "pyinstrument"
+    """
+    trace = ctx.get("HARNESS_TRACE", False) if trace is None else trace
+    profile = ctx.get("HARNESS_PROFILE", None) if profile is None else profile
+    profiler = HarnessProfiler(profile) if profile else None
+    if profiler:
+        profiler.start()
+    if trace:
+        start_tracing()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.stop()
+        if trace:
+            stop_tracing()
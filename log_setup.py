@@ -0,0 +1,39 @@
+import os
+import logging
+import threading
+from run_context import ctx
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_FILE_NAME = 'info.log'
+
+_setup_lock = threading.Lock()
+_log_file_path = None
+
+
+def setup_logging(log_to_file: bool = True, level: int = logging.INFO):
+    """
+    配置根日志记录器：输出到控制台，并可追加写入 OUTPUT_STORE_PATH/info.log
+
+    整个进程只需在入口处调用一次（命令行、场景模块的 __main__），重复调用是安全的：
+    控制台处理器只添加一次，之后再要求写文件时才补充文件处理器。只读命令传 log_to_file=False，
+    不会创建结果目录
+
+    参数:
+        log_to_file: 是否写入 info.log
+        level: 日志级别
+    """
+    global _log_file_path
+    with _setup_lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if not any(getattr(h, "_abnormal_console", False) for h in root.handlers):
+            console = logging.StreamHandler()  # 同时输出到控制台
+            console.setFormatter(logging.Formatter(LOG_FORMAT))
+            console._abnormal_console = True
+            root.addHandler(console)
+        if log_to_file and _log_file_path is None:
+            os.makedirs(ctx.OUTPUT_STORE_PATH, exist_ok=True)
+            _log_file_path = os.path.join(ctx.OUTPUT_STORE_PATH, LOG_FILE_NAME)
+            file_handler = logging.FileHandler(_log_file_path, encoding='utf-8')
+            file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            root.addHandler(file_handler)
@@ -1,80 +1,341 @@
-import threading
-import time
+import argparse
+import json
 import logging
-import os
-from config import node_num, abnormal_scenario, INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH, DB_TYPE
-from tools import startConfigNode, startDataNode, modify_db_switch
-from node_outage import node_outage_scenario
-from symmetric_network_partition import symmetric_network_partition_scenario
-from asymmetric_network_partition import asymmetric_network_partition_scenario
-from abnormal_transmission import abnormal_transmission_scenario
-from over_load import over_load_scenario
-from out_of_order import out_of_order_scenario
-from performance_imbalance import performance_imbalance_scenario
-
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
+import sys
+import time
+from run_context import ctx, current_context, set_default_context
+
+# 命令行入口：各子命令只在执行时导入所需模块（场景模块、paramiko 等），报告与对比命令不连接节点、不写结果目录
+#   python main.py                       等同于 run，运行 config 中的 abnormal_scenario
+#   python main.py run [场景名]
+#   python main.py campaign [--state 状态文件]
+#   python main.py report 结果文件或目录...
+#   python main.py compare 基线结果 对比结果
+#   python main.py inject 故障类型 --nodes 1,2 [--param 参数=取值 ...] [--ttl 秒] [--dry-run]
+#   python main.py heal [--nodes 1,2] [--dry-run]
+#   python main.py status [--nodes 1,2]
+
+# 场景名与日志中的说明；场景入口按命名约定为模块 {场景名}.py 中的 {场景名}_scenario
+SCENARIOS = {
+    "node_outage": "单次节点宕机",
+    "symmetric_network_partition": "对称网络分区",
+    "asymmetric_network_partition": "非对称网络分区",
+    "abnormal_transmission": "传输时间异常",
+    "over_load": "过载",
+    "out_of_order": "消息乱序",
+    "performance_imbalance": "性能不平衡",
+    "network_partition_sweep": "分区拓扑扫描",
+    "rolling_outage": "滚动节点故障",
+    "disk_io_fault": "磁盘I/O故障",
+    "clock_skew": "时钟偏移",
+    "query_degradation": "查询降级",
+}
+
+
+def _start_all_nodes():
+    """默认场景：仅启动所有节点，不执行测试"""
+    from tools import startConfigNode, startDataNode
+    from run_context import ContextThread
+
+    logging.info("\nℹ️  无异常场景（或场景配置错误），仅启动所有节点...")
+    start_threads = []
+    for i in range(ctx.node_num):
+        # 先启动ConfigNode，再启动DataNode（确保依赖顺序）
+        t_config = ContextThread(target=startConfigNode, args=(i,))
+        t_data = ContextThread(target=startDataNode, args=(i,))
+        start_threads.extend([t_config, t_data])
+        t_config.start()
+        time.sleep(2)  # 给ConfigNode启动缓冲时间
+        t_data.start()
+
+    # 等待所有启动线程完成
+    for t in start_threads:
+        t.join()
+    logging.info("\n✅ 所有节点（ConfigNode + DataNode）启动完成")
+
+
+def _prepare_run() -> bool:
+    """运行场景或实验活动前的准备：启动进度服务、修改DB_SWITCH、收集节点信息、清除遗留故障、准备数据集快照"""
+    from tools import modify_db_switch
+    from node_facts import discover_node_facts
+    from dataset_snapshot import prepare_dataset_snapshot
+    from fault_control import heal_before_run
+    from run_progress import start_progress_server
+
+    # 运行期间通过 PROGRESS_HTTP_PORT 发布当前步骤、生效的故障与benchmark实时吞吐
+    start_progress_server()
 
-if __name__ == "__main__":
-    stop_event = threading.Event()  # 保留原stop_event，供监控函数（如monitor_and_restart）使用
-    logging.info(f"{'='*60}")
-    logging.info(f"启动程序 | 数据库类型：{DB_TYPE} | 异常场景：{abnormal_scenario} | 节点数量：{node_num}")
-    logging.info(f"{'='*60}")
-    
     # 在运行测试前，根据DB_TYPE修改benchmark配置文件中的DB_SWITCH参数
-    logging.info(f"\n【配置数据库】根据DB_TYPE={DB_TYPE}修改benchmark配置...")
+    logging.info(f"\n【配置数据库】根据DB_TYPE={ctx.DB_TYPE}修改benchmark配置...")
     if not modify_db_switch():
         logging.error("❌ 修改DB_SWITCH失败，程序终止")
-        exit(1)
-
-    if abnormal_scenario == "node_outage":
-        # 执行单次节点宕机场景，自动触发异常测试并输出结果
-        logging.info("开始执行单次节点宕机测试流程...")
-        node_outage_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "symmetric_network_partition":
-        logging.info("开始执行对称网络分区测试流程...")
-        symmetric_network_partition_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "asymmetric_network_partition":
-        logging.info("开始执行非对称网络分区测试流程...")
-        asymmetric_network_partition_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "abnormal_transmission":
-        logging.info("开始执行传输时间异常测试流程...")
-        abnormal_transmission_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "over_load":
-        logging.info("开始执行过载测试流程...")
-        over_load_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "out_of_order":
-        logging.info("开始执行消息乱序测试流程...")
-        out_of_order_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    elif abnormal_scenario == "performance_imbalance":
-        logging.info("开始执行性能不平衡测试流程...")
-        performance_imbalance_scenario(INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH)
-    else:
-        # 默认场景：仅启动所有节点，不执行测试
-        logging.info("\nℹ️  无异常场景（或场景配置错误），仅启动所有节点...")
-        start_threads = []
-        for i in range(node_num):
-            # 先启动ConfigNode，再启动DataNode（确保依赖顺序）
-            t_config = threading.Thread(target=startConfigNode, args=(i,))
-            t_data = threading.Thread(target=startDataNode, args=(i,))
-            start_threads.extend([t_config, t_data])
-            t_config.start()
-            time.sleep(2)  # 给ConfigNode启动缓冲时间
-            t_data.start()
-        
-        # 等待所有启动线程完成
-        for t in start_threads:
-            t.join()
-        logging.info("\n✅ 所有节点（ConfigNode + DataNode）启动完成，程序保持运行...")
-        
-        config_threads = []
-        data_threads = []
-        restart_count = [0] * node_num
+        return False
+
+    # 一次并行收集各节点的网卡、内核、工具可用性等信息并缓存，后续各场景直接复用
+    discover_node_facts()
+
+    # 上次运行遗留、看门狗尚未清除的故障先移除，避免在被污染的集群上开始
+    heal_before_run()
+
+    # 配置了 DATASET_SNAPSHOT 时，先准备好数据集快照（已存在则跳过），各场景启动前从快照恢复
+    try:
+        prepare_dataset_snapshot(ctx.INPUT_BAT_PATH, ctx.INPUT_TEST_RESULT_PATH)
+    except Exception as e:
+        logging.error(f"❌ 准备数据集快照失败，程序终止: {e}")
+        return False
+    return True
+
+
+def cmd_run(args) -> int:
+    """运行一个异常场景（默认为 config 中的 abnormal_scenario）"""
+    from log_setup import setup_logging
+    from run_manifest import apply_replay_manifest, restore_replay_benchmark_config
+
+    setup_logging()
+    # 设置了 REPLAY_MANIFEST 时，用清单中的配置替换进程默认运行上下文，并写入清单中的benchmark配置
+    replayed_manifest = apply_replay_manifest()
+    try:
+        return _run_scenario(args, replayed_manifest)
+    finally:
+        restore_replay_benchmark_config()
+
+
+def _run_scenario(args, replayed_manifest) -> int:
+    from run_manifest import start_run_manifest, finish_run_manifest, result_status
+
+    if args.scenario:
+        set_default_context(current_context().derive({"abnormal_scenario": args.scenario}))
+    scenario = ctx.abnormal_scenario
+    if scenario == "campaign":
+        return cmd_campaign(args)
+
+    logging.info(f"{'='*60}")
+    logging.info(f"启动程序 | 数据库类型：{ctx.DB_TYPE} | 异常场景：{scenario} | 节点数量：{ctx.node_num}")
+    logging.info(f"{'='*60}")
+    if not _prepare_run():
+        return 1
+
+    # 固定随机种子并记录运行清单（配置、benchmark配置、节点版本、故障时间点），可用 REPLAY_MANIFEST 重放
+    if replayed_manifest:
+        logging.info(f"【运行清单】重放 {replayed_manifest['start_time']} 的 {replayed_manifest['scenario']} 运行，"
+                     f"种子 {replayed_manifest['seed']}")
+    start_run_manifest()
+
+    # 场景抛出异常或返回失败时，清单与进度服务记录为 failed
+    status = "failed"
+    try:
+        if scenario in SCENARIOS:
+            from campaign import get_scenario_function
+            from harness_trace import span
+            logging.info(f"开始执行{SCENARIOS[scenario]}测试流程...")
+            with span(scenario, "scenario"):
+                result = get_scenario_function(scenario)(ctx.INPUT_BAT_PATH, ctx.INPUT_TEST_RESULT_PATH,
+                                                         ctx.OUTPUT_STORE_PATH)
+            status = result_status(result)
+        else:
+            _start_all_nodes()
+            status = "finished"
+    finally:
+        finish_run_manifest(status)
+    return 0 if status == "finished" else 1
+
+
+def cmd_campaign(args) -> int:
+    """自适应重复实验活动"""
+    from log_setup import setup_logging
+    from run_manifest import start_run_manifest, finish_run_manifest, result_status
+    from campaign import run_campaign
+
+    setup_logging()
+    logging.info(f"{'='*60}")
+    logging.info(f"启动实验活动 | 数据库类型：{ctx.DB_TYPE} | 节点数量：{ctx.node_num}")
+    logging.info(f"{'='*60}")
+    if not _prepare_run():
+        return 1
+    start_run_manifest()
+    logging.info("开始执行自适应重复实验活动...")
+    # 未配置单元或没有任何一次运行完成时，清单与进度服务记录为 failed
+    status = "failed"
+    try:
+        status = result_status(run_campaign(getattr(args, "state", None)))
+    finally:
+        finish_run_manifest(status)
+    return 0 if status == "finished" else 1
+
+
+def cmd_report(args) -> int:
+    """打印结果文件的报告"""
+    from report import build_report
+
+    print("\n".join(build_report(args.paths)))
+    return 0
+
+
+def cmd_compare(args) -> int:
+    """对比两次运行的结果"""
+    from report import load_result, compare_results, format_comparison
+
+    comparison = compare_results(load_result(args.base), load_result(args.candidate))
+    print("\n".join(format_comparison(args.base, args.candidate, comparison)))
+    return 0
+
+
+def _parse_params(params) -> dict:
+    """把 参数=取值 列表解析为字典，取值按 JSON 解析（数字、列表等），解析失败时作为字符串"""
+    parsed = {}
+    for item in params or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"参数格式应为 参数=取值: {item}")
+        try:
+            parsed[key] = json.loads(value)
+        except ValueError:
+            parsed[key] = value
+    return parsed
+
+
+def _parse_nodes(nodes) -> list:
+    """把逗号分隔的节点索引解析为列表，未给出时为全部节点"""
+    if not nodes:
+        return list(range(ctx.node_num))
+    return [int(n) for n in nodes.split(",")]
+
+
+def _print_reconcile_results(results) -> int:
+    """打印各节点的变更，存在失败或无法读取的节点时返回1"""
+    failed = False
+    for node_idx, result in sorted(results.items()):
+        if result is None:
+            print(f"节点 {node_idx}: 无法读取现状")
+            failed = True
+            continue
+        for desc in result["changes"]:
+            print(f"节点 {node_idx}: {desc}{'  [失败]' if desc in result['failed'] else ''}")
+        failed = failed or bool(result["failed"])
+    return 1 if failed else 0
+
+
+def cmd_inject(args) -> int:
+    """对指定节点施加一个故障，不运行benchmark；只变更与现状不一致的部分，其余已生效的故障保持不变"""
+    from log_setup import setup_logging
+    from fault_control import apply_fault, read_cluster_state, desired_from_live, overlay_fault, reconcile
+
+    setup_logging(log_to_file=not args.dry_run)
+    nodes = _parse_nodes(args.nodes)
+    fault = {"kind": args.kind, **_parse_params(args.param)}
+    if fault["kind"] == "kill":
+        # 进程被杀不是可持续的节点状态，直接执行
+        apply_fault(fault, nodes)
+        return 0
+    live = read_cluster_state()
+    desired = desired_from_live(live)
+    overlay_fault(desired, fault, nodes)
+    # 命令行进程随即退出，不会推迟看门狗：故障在 ttl 秒后由节点自行清除，0 表示不设置看门狗
+    ttl = args.ttl if args.ttl is not None else ctx.get("INJECT_TTL_SECONDS", 3600)
+    return _print_reconcile_results(reconcile(desired, live, dry_run=args.dry_run, ttl=ttl))
+
+
+def cmd_heal(args) -> int:
+    """读取各节点现状，只移除实际存在的分区规则、网络损伤和节点故障"""
+    from log_setup import setup_logging
+    from fault_control import read_cluster_state, reconcile
+
+    setup_logging(log_to_file=not args.dry_run)
+    live = read_cluster_state(_parse_nodes(args.nodes))
+    return _print_reconcile_results(reconcile({}, live, dry_run=args.dry_run))
+
+
+def cmd_status(args) -> int:
+    """并行读取并打印各节点上本工具施加的故障现状"""
+    from log_setup import setup_logging
+    from fault_control import read_cluster_state, format_node_state
+
+    setup_logging(log_to_file=False)
+    live = read_cluster_state(_parse_nodes(args.nodes))
+    for node_idx, state in sorted(live.items()):
+        print("\n".join(format_node_state(node_idx, state)))
+    return 1 if any(state is None for state in live.values()) else 0
+
+
+def cmd_monitoring(args) -> int:
+    """启动、停止或查看0号节点上的 Prometheus / Grafana"""
+    from log_setup import setup_logging
+    from monitoring_stack import ensure_monitoring, stop_monitoring, monitoring_status
+
+    setup_logging(log_to_file=False)
+    if args.action == "start":
+        return 0 if ensure_monitoring() else 1
+    if args.action == "stop":
+        return 0 if stop_monitoring() else 1
+    status = monitoring_status()
+    print(f"Prometheus {status['prometheus_url']}: {'就绪' if status['prometheus_ready'] else '未就绪'}，"
+          f"进程 {status['prometheus_pids'] or '无'}")
+    print(f"Grafana {status['grafana_url']}: {'就绪' if status['grafana_ready'] else '未就绪'}")
+    return 0 if status["prometheus_ready"] and status["grafana_ready"] else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="IoTDB / TDengine 集群异常场景测试")
+    parser.add_argument("--trace", action="store_true", default=None,
+                        help="记录本工具自身各操作的耗时，结束时写出 Chrome trace（默认取 HARNESS_TRACE）")
+    parser.add_argument("--profile", choices=("cprofile", "pyinstrument"),
+                        help="剖析控制端主线程（默认取 HARNESS_PROFILE）")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run = subparsers.add_parser("run", help="运行一个异常场景（默认为 config 中的 abnormal_scenario）")
+    run.add_argument("scenario", nargs="?", help=f"场景名: {', '.join(SCENARIOS)}")
+    run.set_defaults(func=cmd_run)
+
+    campaign = subparsers.add_parser("campaign", help="自适应重复实验活动（CAMPAIGN_CELLS）")
+    campaign.add_argument("--state", help="状态文件路径，已存在时从断点继续")
+    campaign.set_defaults(func=cmd_campaign)
+
+    report = subparsers.add_parser("report", help="打印单次运行结果或实验活动状态的报告")
+    report.add_argument("paths", nargs="+", help="结果文件或目录（递归查找 single_run.json 与 campaign_*.json）")
+    report.set_defaults(func=cmd_report)
+
+    compare = subparsers.add_parser("compare", help="按阶段与操作对比两次运行的吞吐和延迟")
+    compare.add_argument("base", help="基线 single_run.json")
+    compare.add_argument("candidate", help="对比 single_run.json")
+    compare.set_defaults(func=cmd_compare)
+
+    inject = subparsers.add_parser("inject", help="对指定节点施加故障（partition / network / 节点故障类型），只变更与现状不一致的部分")
+    inject.add_argument("kind", help="故障类型，见 fault_control.CONTROL_KINDS")
+    inject.add_argument("--nodes", required=True, help="目标节点索引，逗号分隔，例如 1,2")
+    inject.add_argument("--param", action="append", help="故障参数 参数=取值，可重复，例如 --param delay_ms=100")
+    inject.add_argument("--ttl", type=int, help="故障在多少秒后由节点上的看门狗自动清除，默认 INJECT_TTL_SECONDS，0 表示不清除")
+    inject.add_argument("--dry-run", action="store_true", help="只打印需要的变更，不执行")
+    inject.set_defaults(func=cmd_inject)
+
+    heal = subparsers.add_parser("heal", help="移除节点上本工具施加、且仍在生效的故障")
+    heal.add_argument("--nodes", help="节点索引，逗号分隔，默认为全部节点")
+    heal.add_argument("--dry-run", action="store_true", help="只打印需要的变更，不执行")
+    heal.set_defaults(func=cmd_heal)
+
+    status = subparsers.add_parser("status", help="读取各节点上本工具施加的故障现状")
+    status.add_argument("--nodes", help="节点索引，逗号分隔，默认为全部节点")
+    status.set_defaults(func=cmd_status)
+
+    monitoring = subparsers.add_parser("monitoring", help="启动（已运行时复用）、停止或查看 Prometheus / Grafana")
+    monitoring.add_argument("action", choices=("start", "stop", "status"))
+    monitoring.set_defaults(func=cmd_monitoring)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        args.scenario = None
+        args.func = cmd_run
+    try:
+        from harness_trace import harness_instrumentation
+        with harness_instrumentation(args.trace, args.profile):
+            return args.func(args)
+    except ValueError as e:
+        # 配置或参数错误（未知的故障类型、运行上下文校验失败等）
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+import urllib.request
+from typing import Any, Dict, List
+from tools import run_remote_command
+from prometheus_metrics import get_prometheus_url
+from grafana_annotations import get_grafana_url
+from run_context import ctx
+
+# 监控系统生命周期：Prometheus 与 Grafana 运行在0号节点上，多次运行、实验活动的多个单元及并行集群共用一套。
+# 启动前先检查：Prometheus 的 /-/ready 已就绪或进程已存在（正在回放WAL）时直接复用，只在没有进程时以脱离SSH会话的
+# 方式启动一个；Grafana 只在 systemd 服务未运行时启动。之后轮询健康检查接口直到就绪，而不是固定等待
+MONITORING_NODE = 0
+PROMETHEUS_LOG_FILE = "/tmp/abnormal_prometheus.log"
+
+_monitoring_lock = threading.Lock()
+
+
+def _http_ok(url: str) -> bool:
+    """GET url 是否返回200"""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+
+def prometheus_ready() -> bool:
+    return _http_ok(f"{get_prometheus_url()}/-/ready")
+
+
+def grafana_ready() -> bool:
+    return _http_ok(f"{get_grafana_url()}/api/health")
+
+
+def get_prometheus_pids() -> List[int]:
+    """监控节点上正在运行的 prometheus 进程（按进程名精确匹配，不会匹配到查询命令本身）"""
+    _, output, _ = run_remote_command(MONITORING_NODE, "pgrep -x prometheus; true")
+    return [int(pid) for pid in output.split() if pid.isdigit()]
+
+
+def build_prometheus_start_command() -> str:
+    """
+    生成在后台启动 Prometheus 的命令，进程脱离SSH会话，控制端退出后继续运行
+
+    工作目录保持为SSH登录目录，TSDB 仍使用之前版本启动时的相对路径 data/，历史数据不受影响
+    """
+    home = ctx.get("PROMETHEUS_HOME", "/mnt/data/prometheus-3.5.0.linux-amd64").rstrip("/")
+    args = ctx.get("PROMETHEUS_ARGS", "--storage.tsdb.retention.time=180d")
+    return (f"setsid nohup {home}/prometheus --config.file={home}/prometheus.yml {args} "
+            f"> {PROMETHEUS_LOG_FILE} 2>&1 < /dev/null & echo $!")
+
+
+def _wait_until(check, pid: int = None, timeout: float = None) -> bool:
+    """
+    每秒检查一次 check()，直到返回True或超时；给出 pid 时进程退出即提前返回False
+    """
+    timeout = ctx.get("MONITORING_READY_TIMEOUT", 60) if timeout is None else timeout
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if check():
+            return True
+        if pid is not None and pid not in get_prometheus_pids():
+            return False
+        time.sleep(1)
+    return check()
+
+
+def ensure_prometheus() -> bool:
+    """Prometheus 已就绪时直接复用，进程存在但未就绪时等待，没有进程时启动一个并等待 /-/ready"""
+    if prometheus_ready():
+        return True
+    pids = get_prometheus_pids()
+    if pids:
+        logging.info(f"Prometheus 进程 {pids} 已存在但尚未就绪，等待 /-/ready...")
+        pid = pids[0]
+    else:
+        logging.info("启动Prometheus服务...")
+        status, output, error = run_remote_command(MONITORING_NODE, build_prometheus_start_command())
+        pid = int(output.split()[-1]) if status == 0 and output.split() and output.split()[-1].isdigit() else None
+        if pid is None:
+            logging.error(f"❌ 启动Prometheus失败: {error.strip() or output.strip()}")
+            return False
+    if _wait_until(prometheus_ready, pid):
+        logging.info(f"✅ Prometheus已就绪（进程 {pid}）")
+        return True
+    _, log_tail, _ = run_remote_command(MONITORING_NODE, f"tail -n 20 {PROMETHEUS_LOG_FILE} 2>/dev/null; true")
+    logging.error(f"❌ Prometheus未能就绪（{get_prometheus_url()}/-/ready），日志 {PROMETHEUS_LOG_FILE}:\n{log_tail}")
+    return False
+
+
+def ensure_grafana() -> bool:
+    """Grafana 服务未运行时启动，并等待 /api/health"""
+    if grafana_ready():
+        return True
+    status, _, error = run_remote_command(
+        MONITORING_NODE, "systemctl is-active --quiet grafana-server || sudo /bin/systemctl start grafana-server")
+    if status != 0:
+        logging.error(f"❌ 启动Grafana失败: {error.strip()}")
+        return False
+    if _wait_until(grafana_ready):
+        logging.info("✅ Grafana已就绪")
+        return True
+    logging.error(f"❌ Grafana未能就绪（{get_grafana_url()}/api/health）")
+    return False
+
+
+def ensure_monitoring() -> bool:
+    """
+    确保 Prometheus 与 Grafana 都已运行并就绪，可重复调用：已就绪时只做两次HTTP检查
+
+    返回:
+        bool: 两者是否都已就绪
+    """
+    with _monitoring_lock:
+        if prometheus_ready() and grafana_ready():
+            logging.info("【监控系统】Prometheus和Grafana已在运行，直接复用")
+            return True
+        logging.info("\n【启动监控系统】检查并启动Prometheus和Grafana...")
+        prometheus_ok = ensure_prometheus()
+        grafana_ok = ensure_grafana()
+    if prometheus_ok and grafana_ok:
+        logging.info("【监控系统】Prometheus和Grafana已就绪")
+        logging.info(f"Prometheus Web界面: {get_prometheus_url()}")
+        logging.info(f"Grafana Web界面: {get_grafana_url()}")
+    return prometheus_ok and grafana_ok
+
+
+def stop_monitoring() -> bool:
+    """
+    停止监控节点上的 Prometheus（SIGTERM，等待TSDB正常关闭），Grafana 服务保持运行
+
+    返回:
+        bool: Prometheus 是否已全部退出
+    """
+    with _monitoring_lock:
+        pids = get_prometheus_pids()
+        if not pids:
+            logging.info("【监控系统】Prometheus未在运行")
+            return True
+        run_remote_command(MONITORING_NODE, f"kill {' '.join(map(str, pids))}")
+        if _wait_until(lambda: not get_prometheus_pids(), timeout=60):
+            logging.info(f"【监控系统】Prometheus进程 {pids} 已停止")
+            return True
+    logging.error(f"❌ Prometheus进程 {pids} 在60秒内未退出")
+    return False
+
+
+def monitoring_status() -> Dict[str, Any]:
+    """Prometheus 与 Grafana 的当前状态"""
+    return {"prometheus_url": get_prometheus_url(), "prometheus_ready": prometheus_ready(),
+            "prometheus_pids": get_prometheus_pids(),
+            "grafana_url": get_grafana_url(), "grafana_ready": grafana_ready()}
@@ -0,0 +1,482 @@
+import shlex
+import logging
+import itertools
+from typing import Any, Dict, List
+from tools import run_remote_command, run_on_nodes
+from node_facts import get_node_facts
+from run_manifest import record_event
+from fault_watchdog import arm_watchdog, disarm_watchdog
+from harness_trace import traced
+from run_context import ctx
+
+# netem 支持的时延分布（对应 /usr/lib/tc 下的分布表）
+NETEM_DISTRIBUTIONS = ("normal", "pareto", "paretonormal", "experimental")
+
+# 网络损伤参数说明（均为可选，未给出的项不生效）：
+#   delay_ms / jitter_ms / delay_correlation_pct / delay_distribution  时延、抖动、相关性、抖动分布
+#   loss_pct / loss_correlation_pct                                     随机丢包
+#   loss_model="gemodel" + ge_p_pct / ge_r_pct / ge_1_h_pct / ge_1_k_pct Gilbert-Elliott突发丢包
+#   duplicate_pct                                                       报文重复
+#   reorder_pct / reorder_correlation_pct / reorder_gap                 报文乱序（需同时设置delay_ms）
+#   corrupt_pct                                                         报文损坏
+#   rate_kbit / burst_kb / limit_latency_ms                             通过tbf限制带宽
+IMPAIRMENT_KEYS = (
+    "delay_ms", "jitter_ms", "delay_correlation_pct", "delay_distribution",
+    "loss_pct", "loss_correlation_pct", "loss_model", "ge_p_pct", "ge_r_pct", "ge_1_h_pct", "ge_1_k_pct",
+    "duplicate_pct", "reorder_pct", "reorder_correlation_pct", "reorder_gap",
+    "corrupt_pct", "rate_kbit", "burst_kb", "limit_latency_ms",
+)
+
+
+def get_default_impairment() -> Dict[str, Any]:
+    """
+    返回config中配置的网络损伤参数
+
+    未配置 NETWORK_IMPAIRMENT 时退化为原有的 TRANSMISSION_DELAY_MS / DELAY_VARIANCE_MS 时延配置
+    """
+    impairment = ctx.get("NETWORK_IMPAIRMENT", None)
+    if impairment is None:
+        impairment = {"delay_ms": ctx.TRANSMISSION_DELAY_MS, "jitter_ms": ctx.DELAY_VARIANCE_MS}
+    return dict(impairment)
+
+
+def expand_impairment_sweep(base: Dict[str, Any] = None, sweep: Dict[str, List[Any]] = None) -> List[Dict[str, Any]]:
+    """
+    将损伤参数扫描配置展开为每次实验使用的参数列表（各扫描轴取笛卡尔积）
+
+    参数:
+        base: 基础损伤参数，默认取 get_default_impairment()
+        sweep: {参数名: [取值, ...]}，默认取config中的 NETWORK_IMPAIRMENT_SWEEP
+
+    返回:
+        list: 每个元素为一次实验的完整损伤参数
+    """
+    if base is None:
+        base = get_default_impairment()
+    if sweep is None:
+        sweep = ctx.get("NETWORK_IMPAIRMENT_SWEEP", {}) or {}
+    if not sweep:
+        return [dict(base)]
+
+    keys = list(sweep)
+    points = []
+    for values in itertools.product(*(sweep[k] for k in keys)):
+        point = dict(base)
+        point.update(zip(keys, values))
+        points.append(point)
+    return points
+
+
+def describe_impairment(impairment: Dict[str, Any]) -> str:
+    """生成损伤参数的简短描述，用于日志、阶段描述和结果目录名"""
+    parts = [f"{key}={impairment[key]}" for key in IMPAIRMENT_KEYS if impairment.get(key) not in (None, 0, "")]
+    return ",".join(parts) if parts else "none"
+
+
+def build_netem_args(impairment: Dict[str, Any]) -> str:
+    """
+    将损伤参数转换为 netem 参数串
+
+    参数:
+        impairment: 损伤参数字典，键见 IMPAIRMENT_KEYS
+
+    返回:
+        str: 如 "delay 100ms 10ms 25% distribution normal loss 1%"
+    """
+    unknown = set(impairment) - set(IMPAIRMENT_KEYS)
+    if unknown:
+        raise ValueError(f"未知的网络损伤参数: {sorted(unknown)}")
+
+    args = []
+    delay_ms = impairment.get("delay_ms", 0)
+    jitter_ms = impairment.get("jitter_ms", 0)
+    if delay_ms or jitter_ms:
+        delay = f"delay {delay_ms}ms"
+        if jitter_ms:
+            delay += f" {jitter_ms}ms"
+            if impairment.get("delay_correlation_pct"):
+                delay += f" {impairment['delay_correlation_pct']}%"
+            distribution = impairment.get("delay_distribution")
+            if distribution:
+                if distribution not in NETEM_DISTRIBUTIONS:
+                    raise ValueError(f"未知的时延分布: {distribution}")
+                delay += f" distribution {distribution}"
+        args.append(delay)
+
+    if impairment.get("loss_model") == "gemodel":
+        # Gilbert-Elliott模型：p为好->坏转移概率，r为坏->好转移概率，1-h/1-k为坏/好状态丢包率
+        loss = f"loss gemodel {impairment.get('ge_p_pct', 1)}% {impairment.get('ge_r_pct', 50)}%"
+        if "ge_1_h_pct" in impairment:
+            loss += f" {impairment['ge_1_h_pct']}%"
+            if "ge_1_k_pct" in impairment:
+                loss += f" {impairment['ge_1_k_pct']}%"
+        args.append(loss)
+    elif impairment.get("loss_pct"):
+        loss = f"loss random {impairment['loss_pct']}%"
+        if impairment.get("loss_correlation_pct"):
+            loss += f" {impairment['loss_correlation_pct']}%"
+        args.append(loss)
+
+    if impairment.get("duplicate_pct"):
+        args.append(f"duplicate {impairment['duplicate_pct']}%")
+
+    if impairment.get("reorder_pct"):
+        if not delay_ms:
+            raise ValueError("reorder_pct 需要同时设置 delay_ms（netem只能对被延迟的报文乱序）")
+        reorder = f"reorder {impairment['reorder_pct']}%"
+        if impairment.get("reorder_correlation_pct"):
+            reorder += f" {impairment['reorder_correlation_pct']}%"
+        if impairment.get("reorder_gap"):
+            reorder += f" gap {impairment['reorder_gap']}"
+        args.append(reorder)
+
+    if impairment.get("corrupt_pct"):
+        args.append(f"corrupt {impairment['corrupt_pct']}%")
+
+    return " ".join(args)
+
+
+def build_tbf_args(impairment: Dict[str, Any]) -> str:
+    """将带宽限制参数转换为 tbf 参数串，未设置 rate_kbit 时返回空串"""
+    rate_kbit = impairment.get("rate_kbit")
+    if not rate_kbit:
+        return ""
+    burst_kb = impairment.get("burst_kb", max(32, int(rate_kbit) // 80))
+    limit_latency_ms = impairment.get("limit_latency_ms", 400)
+    return f"rate {rate_kbit}kbit burst {burst_kb}kb latency {limit_latency_ms}ms"
+
+
+def build_impairment_commands(interface: str, impairment: Dict[str, Any]) -> List[str]:
+    """
+    生成在网卡根队列上施加损伤的tc命令：根队列为netem，设置带宽限制时在其下挂tbf
+
+    参数:
+        interface: 网卡名
+        impairment: 损伤参数字典
+
+    返回:
+        list: 依次执行的tc命令
+    """
+    netem_args = build_netem_args(impairment)
+    tbf_args = build_tbf_args(impairment)
+    if not netem_args and not tbf_args:
+        raise ValueError("网络损伤参数为空")
+    commands = [f"tc qdisc replace dev {interface} root handle 1: netem {netem_args}".rstrip()]
+    if tbf_args:
+        commands.append(f"tc qdisc replace dev {interface} parent 1:1 handle 10: tbf {tbf_args}")
+    return commands
+
+
+def get_network_interface(node_idx: int) -> str:
+    """
+    获取指定节点的网络接口名称（默认路由所在网卡），取自节点信息缓存，不额外建立SSH连接
+
+    参数:
+        node_idx: 节点索引
+
+    返回:
+        网络接口名称（如eth0, ens3等）
+    """
+    interface = get_node_facts(node_idx).get("interface")
+    if not interface:
+        logging.error(f"获取节点 {node_idx} 网络接口失败，使用默认接口 eth0")
+        return "eth0"  # 默认接口名
+    return interface
+
+
+# 读取所有网卡根队列，本工具施加的损伤根队列句柄固定为 1:（接口级为netem，按链路分流时为htb）
+IMPAIRMENT_PROBE_COMMAND = "tc qdisc show 2>/dev/null; true"
+
+
+def parse_impairment_probe(output: str) -> Dict[str, Any]:
+    """
+    解析 IMPAIRMENT_PROBE_COMMAND 的输出，找出本工具施加的根队列
+
+    返回:
+        dict: {"interface": 网卡名, "qdisc": "netem"/"htb", "detail": tc输出行}，没有时返回None
+    """
+    for line in output.splitlines():
+        parts = line.split()
+        # 形如 "qdisc netem 1: dev eth0 root refcnt 2 limit 1000 delay 100ms"
+        if len(parts) >= 6 and parts[0] == "qdisc" and parts[1] in ("netem", "htb") \
+                and parts[2] == "1:" and parts[3] == "dev" and parts[5] == "root":
+            return {"interface": parts[4], "qdisc": parts[1], "detail": line.strip()}
+    return None
+
+
+def apply_network_impairment(node_idx: int, impairment: Dict[str, Any]) -> bool:
+    """
+    在指定节点的网卡上施加网络损伤（时延/丢包/重复/乱序/损坏/限速）
+
+    参数:
+        node_idx: 节点索引
+        impairment: 损伤参数字典
+
+    返回:
+        bool: 操作是否成功
+    """
+    try:
+        interface = get_network_interface(node_idx)
+        script = " && ".join(build_impairment_commands(interface, impairment))
+        exit_status, _, error_output = run_remote_command(node_idx, f"sudo sh -c {shlex.quote(script)}")
+        if exit_status == 0:
+            logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 已施加网络损伤: {describe_impairment(impairment)}")
+            return True
+        logging.error(f"节点 {node_idx} 施加网络损伤失败: {error_output}")
+        return False
+    except Exception as e:
+        logging.error(f"节点 {node_idx} 施加网络损伤时出错: {e}")
+        return False
+
+
+def remove_network_impairment(node_idx: int) -> bool:
+    """
+    移除指定节点网卡根队列上的网络损伤
+
+    参数:
+        node_idx: 节点索引
+
+    返回:
+        bool: 操作是否成功
+    """
+    try:
+        interface = get_network_interface(node_idx)
+        exit_status, _, _ = run_remote_command(node_idx, f"sudo tc qdisc del dev {interface} root")
+        if exit_status == 0:
+            logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 的网络损伤已移除")
+        else:
+            # 可能没有规则可删除，这通常不是错误
+            logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 没有需要删除的网络损伤规则")
+        return True
+    except Exception as e:
+        logging.error(f"节点 {node_idx} 移除网络损伤时出错: {e}")
+        return False
+
+
+@traced("fault")
+def apply_impairment_to_nodes(node_indices: List[int], impairment: Dict[str, Any]) -> int:
+    """
+    并行为多个节点施加网络损伤
+
+    返回:
+        int: 成功的节点数
+    """
+    logging.info(f"\n【开始施加网络损伤】{describe_impairment(impairment)}，目标节点: {node_indices}")
+    record_event("impairment_applied", nodes=list(node_indices), impairment=impairment)
+    results = run_on_nodes(apply_network_impairment, node_indices, impairment)
+    arm_watchdog([idx for idx, ok in results.items() if ok], "network")
+    success_count = sum(1 for ok in results.values() if ok)
+    if success_count == len(node_indices):
+        logging.info(f"【网络损伤施加完成】成功为 {success_count} 个节点施加网络损伤")
+    else:
+        logging.warning(f"【网络损伤施加部分完成】成功: {success_count}/{len(node_indices)} 个节点")
+    return success_count
+
+
+@traced("heal")
+def remove_impairment_from_nodes(node_indices: List[int] = None) -> int:
+    """
+    并行移除多个节点的网络损伤，默认为全部节点
+
+    返回:
+        int: 成功的节点数
+    """
+    if node_indices is None:
+        node_indices = list(range(ctx.node_num))
+    logging.info(f"\n【开始移除网络损伤】目标节点: {node_indices}")
+    record_event("impairment_removed", nodes=list(node_indices))
+    results = run_on_nodes(remove_network_impairment, node_indices)
+    disarm_watchdog([idx for idx, ok in results.items() if ok], ["network"])
+    success_count = sum(1 for ok in results.values() if ok)
+    if success_count == len(node_indices):
+        logging.info(f"【网络损伤移除完成】成功移除 {success_count} 个节点的网络损伤")
+    else:
+        logging.warning(f"【网络损伤移除部分完成】成功: {success_count}/{len(node_indices)} 个节点")
+    return success_count
+
+
+def build_links_between(from_nodes: List[int], to_nodes: List[int], impairment: Dict[str, Any],
+                        ports=None) -> List[Dict[str, Any]]:
+    """
+    为 from_nodes 到 to_nodes 的每条有向链路生成相同的损伤配置
+
+    参数:
+        from_nodes: 源节点索引（在这些节点的出方向施加损伤）
+        to_nodes: 目标节点索引
+        impairment: 损伤参数字典
+        ports: 只影响发往这些目标端口的流量，None表示全部端口
+
+    返回:
+        list: [{"from": 源节点, "to": 目标节点, "impairment": {...}, "ports": [...] 或 None}, ...]
+    """
+    return [{"from": a, "to": b, "impairment": dict(impairment), "ports": ports}
+            for a in from_nodes for b in to_nodes if a != b]
+
+
+def build_zone_links(zones: List[str], impairment: Dict[str, Any], ports=None) -> List[Dict[str, Any]]:
+    """
+    按节点所在可用区生成链路损伤：跨可用区链路施加损伤，同可用区链路不受影响
+
+    参数:
+        zones: 每个节点所在的可用区名称，长度等于节点数，如 ["az1", "az1", "az2"]
+        impairment: 跨可用区链路的损伤参数
+        ports: 只影响发往这些目标端口的流量，None表示全部端口
+    """
+    return [link for link in build_links_between(range(len(zones)), range(len(zones)), impairment, ports)
+            if zones[link["from"]] != zones[link["to"]]]
+
+
+def resolve_impairment_ports(ports="all"):
+    """将端口配置（"all"、端口预设名或端口列表）解析为端口列表，"all" 返回None"""
+    if ports is None or ports == "all":
+        return None
+    if isinstance(ports, str):
+        from partition_tools import PARTITION_PORT_PRESETS
+        presets = PARTITION_PORT_PRESETS.get(ctx.DB_TYPE, {})
+        if ports not in presets:
+            raise ValueError(f"{ctx.DB_TYPE} 没有名为 {ports} 的端口预设")
+        return list(presets[ports])
+    return sorted({int(p) for p in ports})
+
+
+def check_peer_impairment(impairment: Dict[str, Any]):
+    """检查损伤参数能否按链路施加：htb 没有排队时延上限，limit_latency_ms 只适用于 all 范围的 tbf"""
+    if "limit_latency_ms" in impairment:
+        raise ValueError("limit_latency_ms 只适用于 all 范围的 tbf 限速，按链路施加（peer 范围）时请去掉该参数")
+
+
+def build_peer_shaping_commands(interface: str, node_links: List[Dict[str, Any]]) -> List[str]:
+    """
+    生成按目标IP/端口分流的tc命令：根队列为htb，未匹配的流量走不限速的默认类1:1，
+    每条链路一个htb子类并挂netem叶子队列，由u32过滤器按目标IP（及端口）分流。
+    指定端口时同时匹配目的端口和源端口，与分区规则一致，发往对端的请求和对对端请求的应答都受影响；
+    burst_kb 作为htb子类的 burst/cburst，htb 没有排队时延上限，limit_latency_ms 只能用于 all 范围
+
+    参数:
+        interface: 网卡名
+        node_links: 以本节点为源的链路损伤配置列表
+
+    返回:
+        list: 依次执行的tc命令
+    """
+    commands = [
+        f"tc qdisc del dev {interface} root 2>/dev/null || true",
+        f"tc qdisc add dev {interface} root handle 1: htb default 1",
+        f"tc class add dev {interface} parent 1: classid 1:1 htb rate 10gbit",
+    ]
+    for offset, link in enumerate(node_links):
+        minor = 16 + offset  # 子类号从0x10开始，避开默认类
+        impairment = link["impairment"]
+        check_peer_impairment(impairment)
+        rate = f"{impairment['rate_kbit']}kbit" if impairment.get("rate_kbit") else "10gbit"
+        burst = f" burst {impairment['burst_kb']}kb cburst {impairment['burst_kb']}kb" if impairment.get("burst_kb") else ""
+        netem_args = build_netem_args({k: v for k, v in impairment.items() if k not in ("rate_kbit", "burst_kb")})
+        commands.append(f"tc class add dev {interface} parent 1: classid 1:{minor:x} htb rate {rate} ceil {rate}{burst}")
+        commands.append(f"tc qdisc add dev {interface} parent 1:{minor:x} handle {minor:x}: netem {netem_args}".rstrip())
+        match_dst = f"match ip dst {ctx.server_ip[link['to']]}/32"
+        for port in link.get("ports") or [None]:
+            for match_port in ([f" match ip dport {port} 0xffff", f" match ip sport {port} 0xffff"] if port else [""]):
+                commands.append(f"tc filter add dev {interface} parent 1: protocol ip prio 1 u32 "
+                                f"{match_dst}{match_port} flowid 1:{minor:x}")
+    return commands
+
+
+def apply_peer_impairment(node_idx: int, node_links: List[Dict[str, Any]]) -> bool:
+    """
+    在指定节点上只对发往指定对端的流量施加损伤，SSH、客户端和监控流量不受影响
+
+    参数:
+        node_idx: 节点索引
+        node_links: 以该节点为源的链路损伤配置列表
+
+    返回:
+        bool: 操作是否成功
+    """
+    try:
+        interface = get_network_interface(node_idx)
+        script = " && ".join(build_peer_shaping_commands(interface, node_links))
+        exit_status, _, error_output = run_remote_command(node_idx, f"sudo sh -c {shlex.quote(script)}")
+        if exit_status == 0:
+            for link in node_links:
+                logging.info(f"节点 {node_idx} -> 节点 {link['to']} ({ctx.server_ip[link['to']]}) "
+                             f"已施加链路损伤: {describe_impairment(link['impairment'])}"
+                             f"{'，端口 ' + str(link['ports']) if link.get('ports') else ''}")
+            return True
+        logging.error(f"节点 {node_idx} 施加链路损伤失败: {error_output}")
+        return False
+    except Exception as e:
+        logging.error(f"节点 {node_idx} 施加链路损伤时出错: {e}")
+        return False
+
+
+@traced("fault")
+def apply_link_impairments(links: List[Dict[str, Any]]) -> int:
+    """
+    按链路并行施加损伤，每个源节点一次SSH往返
+
+    参数:
+        links: 链路损伤配置列表，见 build_links_between
+
+    返回:
+        int: 成功的源节点数
+    """
+    links_by_node: Dict[int, List[Dict[str, Any]]] = {}
+    for link in links:
+        check_peer_impairment(link["impairment"])
+        links_by_node.setdefault(link["from"], []).append(link)
+    logging.info(f"\n【开始施加链路损伤】共 {len(links)} 条链路，涉及源节点: {sorted(links_by_node)}")
+    record_event("impairment_applied", links=links)
+
+    results = run_on_nodes(lambda idx: apply_peer_impairment(idx, links_by_node[idx]), sorted(links_by_node))
+    arm_watchdog([idx for idx, ok in results.items() if ok], "network")
+    success_count = sum(1 for ok in results.values() if ok)
+    if success_count == len(links_by_node):
+        logging.info(f"【链路损伤施加完成】成功为 {success_count} 个源节点施加链路损伤")
+    else:
+        logging.warning(f"【链路损伤施加部分完成】成功: {success_count}/{len(links_by_node)} 个源节点")
+    return success_count
+
+
+def resolve_impairment_links(from_nodes: List[int], impairment: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    根据config确定本次实验的链路损伤配置，优先级：
+    LINK_IMPAIRMENTS（显式链路列表）> NODE_ZONES（跨可用区链路）> from_nodes 到其余所有节点
+
+    参数:
+        from_nodes: 默认施加损伤的源节点
+        impairment: 默认损伤参数（参数扫描的当前取值）
+    """
+    ports = resolve_impairment_ports(ctx.get("IMPAIRMENT_PORTS", "all"))
+    explicit_links = ctx.get("LINK_IMPAIRMENTS", None)
+    if explicit_links:
+        return [{"from": link["from"], "to": link["to"],
+                 "impairment": dict(link.get("impairment", impairment)),
+                 "ports": resolve_impairment_ports(link.get("ports", "all")) if "ports" in link else ports}
+                for link in explicit_links]
+    zones = ctx.get("NODE_ZONES", None)
+    if zones:
+        if len(zones) != ctx.node_num:
+            raise ValueError(f"NODE_ZONES 长度 {len(zones)} 与节点数 {ctx.node_num} 不一致")
+        return [link for link in build_zone_links(zones, impairment, ports) if link["from"] in from_nodes]
+    return build_links_between(from_nodes, range(ctx.node_num), impairment, ports)
+
+
+def apply_scoped_impairment(from_nodes: List[int], impairment: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按 IMPAIRMENT_SCOPE 施加网络损伤
+
+    IMPAIRMENT_SCOPE = "peer"（默认）时只影响节点之间的链路；
+    IMPAIRMENT_SCOPE = "interface" 时沿用整块网卡根队列的损伤方式
+
+    返回:
+        dict: 实际生效的范围描述 {"scope": ..., "links": [...]}，用于写入测试结果
+    """
+    scope = ctx.get("IMPAIRMENT_SCOPE", "peer")
+    if scope == "interface":
+        apply_impairment_to_nodes(from_nodes, impairment)
+        return {"scope": scope, "nodes": list(from_nodes)}
+    if scope != "peer":
+        raise ValueError(f"未知的损伤范围: {scope}")
+    links = resolve_impairment_links(from_nodes, impairment)
+    apply_link_impairments(links)
+    return {"scope": scope, "links": links}
@@ -0,0 +1,260 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List
+import os
+from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
+from partition_tools import build_block_map, apply_partition_rules, remove_partition_rules, resolve_partition_spec
+from partition_topology import enumerate_partition_topologies, block_matrix_topology, resolve_leader_isolation
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
+
+
+def get_configured_topologies() -> List[Dict[str, Any]]:
+    """
+    按config生成本次需要扫描的分区拓扑
+
+    PARTITION_TOPOLOGY_KINDS: 需要枚举的拓扑类型，默认全部
+    PARTITION_BLOCK_MATRICES: 额外的自定义阻断矩阵 {名称: 矩阵}
+    PARTITION_TOPOLOGY_LIMIT: 最多运行的拓扑数，None表示不限
+    """
+    extra = [block_matrix_topology(matrix, name)
+             for name, matrix in (ctx.get("PARTITION_BLOCK_MATRICES", None) or {}).items()]
+    topologies = enumerate_partition_topologies(
+        ctx.node_num,
+        kinds=ctx.get("PARTITION_TOPOLOGY_KINDS", None),
+        extra_topologies=extra
+    )
+    limit = ctx.get("PARTITION_TOPOLOGY_LIMIT", None)
+    if limit:
+        topologies = topologies[:limit]
+    return topologies
+
+
+def restore_network_connectivity():
+    """
+    恢复网络连接：删除所有节点上由本工具创建的分区专用链
+    """
+    logging.info("\n【开始恢复网络连接】")
+    remove_partition_rules()
+    logging.info("【网络连接恢复完成】所有节点的分区规则已清除")
+
+
+@with_run_context
+def network_partition_sweep_scenario(bat_path: str = "test.bat",
+                                     test_result_file_path: str = "test_result.txt",
+                                     storing_path: str = "single_run_results") -> List[Dict[str, Any]]:
+    """
+    分区拓扑扫描场景：对每种互不同构的分区拓扑各运行一次
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        storing_path: 结果输出路径
+
+    返回:
+        list: 每种拓扑的实验结果
+    """
+    current_time = int(time.time())
+    topologies = get_configured_topologies()
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始分区拓扑扫描实验，共 {len(topologies)} 种拓扑")
+    for topology in topologies:
+        if topology["kind"] == "leader_isolation" and topology.get("leader") is None:
+            logging.info(f"  {topology['name']}: 隔离施加时的leader节点")
+        else:
+            logging.info(f"  {topology['name']}: 阻断 {len(topology['blocked_pairs'])} 条有向链路")
+    logging.info(f"{'='*80}")
+
+    # 修改DB_SWITCH配置
+    logging.info("\n【配置数据库】修改benchmark配置中的DB_SWITCH...")
+    if not modify_db_switch():
+        logging.error("❌ 修改DB_SWITCH失败，实验终止")
+        return None
+
+    sweep_results = []
+    for topo_idx, topology in enumerate(topologies):
+        logging.info(f"\n【拓扑 {topo_idx + 1}/{len(topologies)}】{topology['name']}")
+        output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}_{topology['name']}\\single_run.json"
+        exp_result = network_partition_sweep_single_run(
+            bat_path=bat_path,
+            test_result_file_path=test_result_file_path,
+            output_store_path=output_store_path,
+            topology=topology
+        )
+        sweep_results.append(exp_result)
+        logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+
+    return sweep_results
+
+
+def network_partition_sweep_single_run(bat_path, test_result_file_path, output_store_path, topology: Dict[str, Any]):
+    """
+    单个分区拓扑的实验主函数：清理→启动→等待20分钟→异常测试(期间应用该拓扑的分区)→结果存储→停止系统
+
+    参数：
+        bat_path: str - 测试用bat文件的完整路径
+        test_result_file_path: str - 单次测试结果文件的完整路径
+        output_store_path: str - 最终测试结果集合的存储路径
+        topology: dict - 分区拓扑，见 partition_topology
+
+    返回：
+        dict - 异常测试的结果集合（含状态信息）
+    """
+    # 初始化测试结果集合
+    all_test_results = {
+        "scenario_name": "network_partition_sweep_single_run",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "topology": topology,
+        "test_results": [],
+        "end_time": "",
+        "status": "running"
+    }
+
+    try:
+        partition_spec = resolve_partition_spec()
+
+        # -------------------------- 1. 清理所有节点 --------------------------
+        logging.info("【步骤1/5】清理所有节点...")
+        clean_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            clean_threads.append(t)
+
+        time.sleep(10)
+        logging.info("【步骤1/5】所有节点清理完成")
+
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # 同时清空所有节点的分区规则（预防性清理）
+        logging.info("【步骤1/5】预防性清理分区规则...")
+        restore_network_connectivity()
+
+        # -------------------------- 2. 启动所有ConfigNode --------------------------
+        logging.info("\n【步骤2/5】启动所有ConfigNode...")
+        config_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
+            t.start()
+            config_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤2/5】所有ConfigNode启动完成")
+
+        # -------------------------- 3. 启动所有DataNode --------------------------
+        logging.info("\n【步骤3/5】启动所有DataNode...")
+        data_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
+            t.start()
+            data_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤3/5】所有DataNode启动完成")
+
+        # -------------------------- 4. 启动节点监控系统 --------------------------
+        logging.info("\n【步骤4/5】启动节点监控系统（Prometheus + Grafana）...")
+        start_monitoring_system()
+        logging.info("【步骤4/5】节点监控系统启动完成")
+
+        # -------------------------- 5. 异常测试：等待20分钟后开始，期间应用分区拓扑 --------------------------
+        logging.info(f"\n【步骤5/5】预热等待后开始异常测试（期间应用分区拓扑 {topology['name']}）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
+
+        # 创建异步执行网络分区操作的线程
+        def network_partition_operation():
+            logging.info("等待10分钟后应用网络分区...")
+            time.sleep(10 * 60)  # 等待10分钟
+
+            # leader_isolation 在此时（集群已运行、预热完成）才查询leader
+            applied = resolve_leader_isolation(topology, ctx.node_num)
+            all_test_results["topology"] = applied
+            logging.info(f"开始应用分区拓扑 {applied['name']}...")
+            apply_partition_rules(build_block_map(applied["blocked_pairs"]), partition_spec)
+
+            logging.info("等待15分钟后恢复网络连接...")
+            time.sleep(15 * 60)  # 等待15分钟
+
+            logging.info("开始恢复网络连接...")
+            restore_network_connectivity()
+            logging.info("网络分区操作完成")
+
+        # 启动网络分区操作线程
+        operation_thread = ContextThread(target=network_partition_operation)
+        operation_thread.start()
+
+        # 同时开始异常测试
+        logging.info("开始异常测试...")
+        abnormal_test = run_bat_and_parse(
+            bat_path=bat_path,
+            result_file_path=test_result_file_path
+        )
+        abnormal_test["test_phase"] = "abnormal"
+        abnormal_test["phase_description"] = f"分区拓扑测试（异常状态 - {topology['kind']}: {topology['name']}）"
+        abnormal_test["topology"] = all_test_results["topology"]["name"]
+        abnormal_test["partition_spec"] = partition_spec
+        all_test_results["test_results"].append(abnormal_test)
+
+        # 等待网络分区操作完成
+        operation_thread.join()
+        logging.info("【步骤5/5】异常测试和网络分区操作均完成")
+
+        # -------------------------- 6. 更新场景状态，存储结果 --------------------------
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "finished"
+        logging.info(f"\n{'='*60}")
+        logging.info(f"场景执行完成！开始将结果写入存储文件：{output_store_path}")
+
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.info(f"✅ 结果已成功存储到 {output_store_path}")
+
+    except Exception as e:
+        error_msg = f"场景执行异常：{str(e)}"
+        logging.error(f"\n❌ {error_msg}")
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "failed"
+        all_test_results["error_msg"] = error_msg
+
+        # 异常情况下也要恢复网络连接
+        try:
+            restore_network_connectivity()
+        except Exception as restore_error:
+            logging.warning(f"⚠️ 恢复网络连接时出错: {restore_error}")
+
+        # 存储异常状态下的结果
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
+
+    finally:
+        # 最终清理：确保网络连接恢复并停止所有节点
+        try:
+            logging.info("\n【最终步骤】确保网络连接恢复...")
+            restore_network_connectivity()
+        except Exception as e:
+            logging.warning(f"⚠️ 最终网络恢复时出错: {e}")
+
+        restore_dataset_properties()
+
+        logging.info("【最终步骤】停止所有节点...")
+        stop_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            stop_threads.append(t)
+        time.sleep(10)
+        logging.info("【最终步骤】所有节点停止完成")
+
+    return all_test_results
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    network_partition_sweep_scenario()
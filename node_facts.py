@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List
+from tools import run_remote_command, run_on_nodes
+from harness_trace import traced
+from run_context import ctx
+
+# 节点信息在一次实验活动中基本不变，缓存到磁盘（OUTPUT_STORE_PATH 下）供所有模块和后续运行复用；
+# 内存缓存按节点IP索引，同一进程内的多个运行上下文共享
+NODE_FACTS_CACHE_NAME = "node_facts_cache.json"
+
+# 一次SSH往返收集全部节点信息，每行输出一个 key=value
+NODE_FACTS_COMMAND = "; ".join([
+    "dev=$(ip route get 8.8.8.8 2>/dev/null | awk '{for(i=1;i<=NF;i++) if($i==\"dev\") print $(i+1)}' | head -1)",
+    "[ -n \"$dev\" ] || dev=$(ip link show | grep -E '^[0-9]+: [^l][^o]' | head -1 | cut -d: -f2 | tr -d ' ')",
+    "echo interface=$dev",
+    "echo hostname=$(hostname)",
+    "echo kernel=$(uname -r)",
+    "echo os=$(. /etc/os-release 2>/dev/null && echo $PRETTY_NAME)",
+    "echo cpu_count=$(nproc)",
+    "echo mem_total_kb=$(awk '/MemTotal/ {print $2}' /proc/meminfo)",
+    "for tool in tc iptables iptables-restore ipset stress-ng fallocate adjtimex; do "
+    "if command -v $tool >/dev/null 2>&1 || [ -x /sbin/$tool ] || [ -x /usr/sbin/$tool ]; "
+    "then echo has_$tool=1; else echo has_$tool=0; fi; done",
+    "[ -f /sys/fs/cgroup/cgroup.controllers ] && echo has_cgroup2=1 || echo has_cgroup2=0",
+])
+
+_facts_lock = threading.Lock()
+_facts_memory: Dict[str, Dict[str, Any]] = {}
+# 收集失败的节点只在内存中记录失败时间，NODE_FACTS_RETRY_SECONDS 内不再重复收集
+_facts_failures: Dict[str, float] = {}
+
+
+def parse_node_facts(output: str) -> Dict[str, Any]:
+    """
+    解析 NODE_FACTS_COMMAND 的输出
+
+    返回:
+        dict: 节点信息，has_* 为布尔值，cpu_count / mem_total_kb 为整数
+    """
+    facts: Dict[str, Any] = {}
+    for line in output.splitlines():
+        if "=" not in line:
+            continue
+        key, value = line.strip().split("=", 1)
+        if key.startswith("has_"):
+            facts[key.replace("-", "_")] = value == "1"
+        elif key in ("cpu_count", "mem_total_kb"):
+            facts[key] = int(value) if value.isdigit() else None
+        else:
+            facts[key] = value
+    return facts
+
+
+def collect_node_facts(node_idx: int) -> Dict[str, Any]:
+    """
+    通过一次SSH往返收集单个节点的网卡、内核、操作系统、工具可用性、CPU数和内存
+
+    参数:
+        node_idx: 节点索引
+
+    返回:
+        dict: 节点信息，额外包含 ip 与采集时间 collected_at；命令执行失败时为None
+    """
+    status, output, error_output = run_remote_command(node_idx, NODE_FACTS_COMMAND)
+    if status != 0 or not output.strip():
+        logging.warning(f"⚠️ 节点 {node_idx} 信息收集失败: {error_output or output}")
+        return None
+    facts = parse_node_facts(output)
+    facts["ip"] = ctx.server_ip[node_idx]
+    facts["collected_at"] = time.time()
+    return facts
+
+
+def get_node_facts_cache_path() -> str:
+    """当前上下文的磁盘缓存路径"""
+    return os.path.join(ctx.OUTPUT_STORE_PATH, NODE_FACTS_CACHE_NAME)
+
+
+def _load_cache() -> Dict[str, Dict[str, Any]]:
+    """读取磁盘缓存，文件不存在或损坏时返回空字典"""
+    try:
+        with open(get_node_facts_cache_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+@traced("write")
+def _save_cache(cache: Dict[str, Dict[str, Any]]):
+    """写入磁盘缓存"""
+    os.makedirs(os.path.dirname(get_node_facts_cache_path()), exist_ok=True)
+    with open(get_node_facts_cache_path(), 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+
+def _is_fresh(facts: Dict[str, Any]) -> bool:
+    """判断缓存条目是否在有效期内（NODE_FACTS_TTL_SECONDS，默认6小时）"""
+    ttl = ctx.get("NODE_FACTS_TTL_SECONDS", 6 * 3600)
+    return bool(facts) and time.time() - facts.get("collected_at", 0) < ttl
+
+
+def _recently_failed(ip: str) -> bool:
+    """判断节点是否仍在收集失败后的重试间隔内（NODE_FACTS_RETRY_SECONDS，默认60秒）"""
+    retry = ctx.get("NODE_FACTS_RETRY_SECONDS", 60)
+    return time.time() - _facts_failures.get(ip, 0) < retry
+
+
+def discover_node_facts(node_indices: List[int] = None, force: bool = False) -> Dict[int, Dict[str, Any]]:
+    """
+    并行收集节点信息，缓存仍有效的节点直接复用，结果写回磁盘缓存
+
+    参数:
+        node_indices: 需要收集的节点索引，默认为全部节点
+        force: 是否忽略缓存重新收集
+
+    返回:
+        dict: {节点索引: 节点信息}
+    """
+    if node_indices is None:
+        node_indices = list(range(ctx.node_num))
+
+    with _facts_lock:
+        if not _facts_memory:
+            _facts_memory.update(_load_cache())
+        stale = [idx for idx in node_indices
+                 if force or not (_is_fresh(_facts_memory.get(ctx.server_ip[idx], {}))
+                                  or _recently_failed(ctx.server_ip[idx]))]
+
+    # SSH收集期间不持有锁，避免并行运行的多个集群互相等待
+    collected = {}
+    if stale:
+        logging.info(f"【节点信息】并行收集节点 {stale} 的网卡、内核与工具信息...")
+        collected = run_on_nodes(collect_node_facts, stale)
+
+    with _facts_lock:
+        for idx, facts in collected.items():
+            ip = ctx.server_ip[idx]
+            if facts:
+                _facts_memory[ip] = facts
+                _facts_failures.pop(ip, None)
+                logging.info(f"节点 {idx} ({ip}): 网卡={facts.get('interface')} "
+                             f"内核={facts.get('kernel')} CPU={facts.get('cpu_count')} "
+                             f"内存={facts.get('mem_total_kb')}kB ipset={facts.get('has_ipset')}")
+            else:
+                _facts_failures[ip] = time.time()
+        if any(collected.values()):
+            _save_cache(_facts_memory)
+
+        return {idx: _facts_memory.get(ctx.server_ip[idx], {}) for idx in node_indices}
+
+
+def get_node_facts(node_idx: int) -> Dict[str, Any]:
+    """
+    获取单个节点的信息，优先使用内存和磁盘缓存，缓存缺失或过期时只重新收集该节点，
+    最近收集失败的节点在重试间隔内直接返回空字典
+
+    参数:
+        node_idx: 节点索引
+
+    返回:
+        dict: 节点信息，收集失败时为空字典
+    """
+    with _facts_lock:
+        facts = _facts_memory.get(ctx.server_ip[node_idx])
+        if facts and _is_fresh(facts):
+            return facts
+        if _recently_failed(ctx.server_ip[node_idx]):
+            return {}
+    return discover_node_facts([node_idx]).get(node_idx, {})
+
+
+def invalidate_node_facts():
+    """清空内存和磁盘上的节点信息缓存"""
+    with _facts_lock:
+        _facts_memory.clear()
+        _facts_failures.clear()
+        if os.path.exists(get_node_facts_cache_path()):
+            os.remove(get_node_facts_cache_path())
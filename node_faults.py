@@ -0,0 +1,585 @@
+import logging
+import shlex
+import time
+from typing import Any, Dict, List
+from tools import run_remote_command, run_on_nodes, startConfigNode, startDataNode
+from node_facts import get_node_facts
+from run_manifest import record_event
+from fault_watchdog import arm_watchdog, disarm_watchdog
+from harness_trace import traced
+from run_context import ctx
+
+# 节点组件：datanode（IoTDB DataNode / TDengine taosd）、confignode（IoTDB ConfigNode，TDengine 下等同 taosd）
+COMPONENTS = ("datanode", "confignode")
+
+# 停止方式：graceful 调用官方停止脚本 / systemctl stop，kill 直接发送 SIGKILL（崩溃一致性场景）
+STOP_MODES = ("graceful", "kill")
+
+# 进程匹配模式：首字母加方括号，避免 pkill -f 匹配到执行该命令的 shell 自身
+_IOTDB_PROCESS_PATTERNS = {
+    "datanode": "[o]rg.apache.iotdb.db.service.DataNode",
+    "confignode": "[o]rg.apache.iotdb.confignode.service.ConfigNode",
+}
+
+
+# 节点资源类故障，与网络损伤一样以 {"kind": ..., 参数...} 字典描述，可挂到场景的同一时间线上
+#   kill             SIGKILL 组件进程，移除时重新启动                        参数: component
+#   freeze           SIGSTOP 冻结组件进程（模拟GC停顿），移除时 SIGCONT       参数: component, pause_ms, period_s
+#   cpu_quota        用 cgroup 限制组件进程的CPU配额                          参数: component, cpu_pct（100 = 一个核）
+#   cpu_stress       stress-ng 占用CPU                                        参数: workers, load_pct
+#   memory_pressure  stress-ng 占用内存                                       参数: vm_pct
+#   disk_fill        在数据目录所在文件系统上预分配文件直到使用率达到 fill_pct  参数: fill_pct
+#   io_stress        stress-ng 在数据目录上持续写入并 fsync，拖慢数据库刷盘     参数: workers
+#   io_throttle      cgroup v2 io.max 限制数据盘读写带宽/IOPS                参数: component, read_mbps, write_mbps, read_iops, write_iops
+#   io_delay         将数据盘的 device-mapper linear 表在线替换为 delay 目标  参数: read_ms, write_ms, flush_ms
+#   clock_skew       暂停时间同步服务后跳变系统时钟，并可用 adjtimex 叠加频率漂移  参数: offset_ms, drift_ppm
+FAULT_KINDS = ("kill", "freeze", "cpu_quota", "cpu_stress", "memory_pressure", "disk_fill", "io_stress",
+               "io_throttle", "io_delay", "clock_skew")
+
+# 依赖 stress-ng 的故障类型
+_STRESS_KINDS = ("cpu_stress", "memory_pressure", "io_stress")
+# 依赖 cgroup v2 的故障类型（IoTDB 直接写故障cgroup；TDengine 的 io_throttle 依赖 systemd 的 IO*Max，同样只支持 cgroup v2）
+_CGROUP2_KINDS = ("cpu_quota", "io_throttle")
+
+# 远程节点上记录故障状态的文件
+_FAULT_STATE_DIR = "/tmp"
+_CGROUP_ROOT = "/sys/fs/cgroup"
+# cpu_quota 与 io_throttle 共用一个cgroup（进程同一时刻只能属于一个cgroup），原cgroup记录在 _CGROUP_ORIG_FILE
+_FAULT_CGROUP = f"{_CGROUP_ROOT}/abnormal_fault"
+_CGROUP_ORIG_FILE = f"{_FAULT_STATE_DIR}/abnormal_cgroup.orig"
+_IO_DELAY_STATE_FILE = f"{_FAULT_STATE_DIR}/abnormal_io_delay.table"
+# 记录施加时钟偏移前的真实时间、偏移量、漂移、原频率和被暂停的时间同步服务，移除时据此算回真实时间
+_CLOCK_STATE_FILE = f"{_FAULT_STATE_DIR}/abnormal_clock_skew.state"
+_TIME_SYNC_SERVICES = ("chrony", "chronyd", "ntp", "ntpd", "ntpsec", "systemd-timesyncd")
+_FILL_FILE_NAME = "abnormal_fill.img"
+
+
+def _iotdb_sbin(node_idx: int) -> str:
+    """IoTDB sbin 目录，0号节点安装在 /mnt/data 下"""
+    path_prefix = "/mnt/data/" if node_idx == 0 else "./"
+    return f"{path_prefix}apache-iotdb-2.0.4-all-bin/sbin"
+
+
+def get_data_dir(node_idx: int) -> str:
+    """数据库数据目录，磁盘类故障作用在该目录所在的文件系统上"""
+    if ctx.DB_TYPE == "IoTDB":
+        path_prefix = "/mnt/data/" if node_idx == 0 else "./"
+        return f"{path_prefix}apache-iotdb-2.0.4-all-bin/data"
+    return "/var/lib/taos"
+
+
+def _data_device_script(data_dir: str) -> str:
+    """
+    解析数据目录所在块设备的shell片段：$name 为设备名（如 sda1、dm-0），
+    $disk 为整盘设备名（分区取其父设备，io.max 只接受整盘），$devno 为整盘的 主:次 设备号
+    """
+    return (f"src=$(findmnt -no SOURCE --target {data_dir}) && name=$(basename $(readlink -f $src)) && "
+            f"disk=$name && if [ -f /sys/class/block/$name/partition ]; then "
+            f"disk=$(basename $(readlink -f /sys/class/block/$name/..)); fi && "
+            f"devno=$(cat /sys/class/block/$disk/dev)")
+
+
+def _enter_fault_cgroup_script(component: str, controller: str, limit_file: str, limit: str) -> str:
+    """把组件进程移入故障cgroup并写入限制，首次移入时记录进程原所在的cgroup"""
+    return (f"mkdir -p {_FAULT_CGROUP} && "
+            f"(echo +{controller} > {_CGROUP_ROOT}/cgroup.subtree_control 2>/dev/null; true) && "
+            f"for p in $(pgrep {_process_match(component)}); do "
+            f"grep -q \"^$p:\" {_CGROUP_ORIG_FILE} 2>/dev/null || "
+            f"echo $p:$(cut -d: -f3 /proc/$p/cgroup) >> {_CGROUP_ORIG_FILE}; "
+            f"echo $p > {_FAULT_CGROUP}/cgroup.procs; done && "
+            f"echo \"{limit}\" > {_FAULT_CGROUP}/{limit_file}")
+
+
+def _leave_fault_cgroup_script() -> str:
+    """cpu.max 与 io.max 均已解除限制时，把进程移回原cgroup并删除故障cgroup"""
+    return (f"cpu=$(cut -d' ' -f1 {_FAULT_CGROUP}/cpu.max 2>/dev/null); io=$(cat {_FAULT_CGROUP}/io.max 2>/dev/null); "
+            f"if [ \"${{cpu:-max}}\" = max ] && [ -z \"$io\" ]; then "
+            f"[ -f {_CGROUP_ORIG_FILE} ] && while IFS=: read p cg; do "
+            f"echo $p > {_CGROUP_ROOT}$cg/cgroup.procs 2>/dev/null; done < {_CGROUP_ORIG_FILE}; "
+            f"rm -f {_CGROUP_ORIG_FILE}; rmdir {_FAULT_CGROUP} 2>/dev/null; fi")
+
+
+def _process_match(component: str) -> str:
+    """pkill/pgrep 的进程匹配参数"""
+    if ctx.DB_TYPE == "IoTDB":
+        return f"-f {shlex.quote(_IOTDB_PROCESS_PATTERNS[component])}"
+    return "-x taosd"
+
+
+def build_stop_command(node_idx: int, component: str, mode: str = "graceful") -> str:
+    """
+    生成停止节点组件的远程命令
+
+    参数:
+        node_idx: 节点索引
+        component: 组件，见 COMPONENTS
+        mode: 停止方式，见 STOP_MODES
+
+    返回:
+        str: 远程shell命令
+    """
+    if component not in COMPONENTS:
+        raise ValueError(f"未知的节点组件: {component}")
+    if mode not in STOP_MODES:
+        raise ValueError(f"未知的停止方式: {mode}")
+
+    if ctx.DB_TYPE == "IoTDB":
+        if mode == "graceful":
+            return f"sudo {_iotdb_sbin(node_idx)}/stop-{component}.sh"
+        return f"sudo pkill -9 {_process_match(component)}"
+    if ctx.DB_TYPE == "TDengine":
+        if mode == "graceful":
+            return "sudo systemctl stop taosd"
+        # taosd 由 systemd 托管，SIGKILL 后立即 stop 以阻止 Restart= 策略把进程拉起
+        return "sudo pkill -9 -x taosd; sudo systemctl stop taosd"
+    raise ValueError(f"未知的数据库类型: {ctx.DB_TYPE}")
+
+
+@traced("fault")
+def stop_component(node_idx: int, component: str = "datanode", mode: str = "graceful") -> bool:
+    """
+    停止（或强制杀死）指定节点上的单个组件
+
+    参数:
+        node_idx: 节点索引
+        component: 组件，见 COMPONENTS
+        mode: 停止方式，见 STOP_MODES
+
+    返回:
+        bool: 命令是否成功执行
+    """
+    command = build_stop_command(node_idx, component, mode)
+    record_event("component_stopped", node=node_idx, component=component, mode=mode)
+    action = "强制杀死(SIGKILL)" if mode == "kill" else "停止"
+    logging.info(f"{action}节点 {node_idx} ({ctx.server_ip[node_idx]}) 的 {component}")
+    try:
+        exit_status, output, error = run_remote_command(node_idx, command, get_pty=True)
+    except Exception as e:
+        logging.error(f"{action}节点 {node_idx} 的 {component} 时出错: {e}")
+        return False
+    # pkill 未匹配到进程时退出码为1，说明进程已不存在，同样视为成功
+    if exit_status not in (0, 1):
+        logging.warning(f"⚠️ {action}节点 {node_idx} 的 {component} 返回码 {exit_status}: {(output + error).strip()}")
+        return False
+    return True
+
+
+@traced("heal")
+def start_component(node_idx: int, component: str = "datanode"):
+    """
+    启动指定节点上的单个组件（TDengine 两种组件均对应 taosd）
+
+    参数:
+        node_idx: 节点索引
+        component: 组件，见 COMPONENTS
+    """
+    record_event("component_started", node=node_idx, component=component)
+    if component == "confignode" and ctx.DB_TYPE == "IoTDB":
+        startConfigNode(node_idx)
+    else:
+        startDataNode(node_idx)
+
+
+def describe_fault(fault: Dict[str, Any]) -> str:
+    """生成故障参数的简短描述，用于日志和阶段描述"""
+    params = ",".join(f"{key}={value}" for key, value in fault.items() if key != "kind")
+    return f"{fault['kind']}({params})" if params else fault["kind"]
+
+
+def _pid_file(kind: str) -> str:
+    return f"{_FAULT_STATE_DIR}/abnormal_{kind}.pid"
+
+
+def _background(kind: str, command: str) -> str:
+    """后台运行命令并记录PID，移除时按PID文件结束"""
+    return f"nohup {command} >/dev/null 2>&1 & echo $! > {_pid_file(kind)}"
+
+
+def _kill_background(kind: str) -> str:
+    pid_file = _pid_file(kind)
+    return f"[ -f {pid_file} ] && kill $(cat {pid_file}) 2>/dev/null; rm -f {pid_file}"
+
+
+def build_fault_apply_script(node_idx: int, fault: Dict[str, Any]) -> str:
+    """
+    生成在节点上施加资源类故障的shell脚本（kill 类型由 stop_component 处理）
+
+    参数:
+        node_idx: 节点索引
+        fault: 故障参数字典，见 FAULT_KINDS
+
+    返回:
+        str: 以root执行的shell脚本
+    """
+    kind = fault["kind"]
+    component = fault.get("component", "datanode")
+    if kind == "freeze":
+        match = _process_match(component)
+        pause_ms = fault.get("pause_ms", 0)
+        if not pause_ms:
+            # 持续冻结，直到移除故障
+            return f"pkill -STOP {match}"
+        loop = (f"while true; do pkill -STOP {match}; sleep {pause_ms / 1000}; "
+                f"pkill -CONT {match}; sleep {fault.get('period_s', 10)}; done")
+        return _background(kind, f"sh -c {shlex.quote(loop)}")
+    if kind == "cpu_quota":
+        cpu_pct = fault.get("cpu_pct", 50)
+        if ctx.DB_TYPE == "TDengine":
+            return f"systemctl set-property --runtime taosd CPUQuota={cpu_pct}%"
+        return _enter_fault_cgroup_script(component, "cpu", "cpu.max", f"{int(cpu_pct * 1000)} 100000")
+    if kind == "cpu_stress":
+        workers = fault.get("workers") or get_node_facts(node_idx).get("cpu_count") or 1
+        return _background(kind, f"stress-ng --cpu {workers} --cpu-load {fault.get('load_pct', 100)}")
+    if kind == "memory_pressure":
+        return _background(kind, f"stress-ng --vm 1 --vm-bytes {fault.get('vm_pct', 80)}% --vm-keep")
+    if kind == "disk_fill":
+        data_dir = get_data_dir(node_idx)
+        fill_pct = fault.get("fill_pct", 95)
+        return (f"size=$(df --output=size,used -B1 {data_dir} | tail -1 | "
+                f"awk '{{s=$1*{fill_pct}/100-$2; print (s>0?int(s):0)}}') && "
+                f"if [ \"$size\" -gt 0 ]; then fallocate -l $size {data_dir}/{_FILL_FILE_NAME}; fi")
+    if kind == "io_stress":
+        return _background(kind, f"stress-ng --hdd {fault.get('workers', 4)} --hdd-opts fsync "
+                                 f"--temp-path {get_data_dir(node_idx)}")
+    if kind == "io_throttle":
+        limits = {"rbps": fault.get("read_mbps"), "wbps": fault.get("write_mbps"),
+                  "riops": fault.get("read_iops"), "wiops": fault.get("write_iops")}
+        if ctx.DB_TYPE == "TDengine":
+            # systemd 接受文件路径并自动解析其所在块设备
+            properties = {"rbps": "IOReadBandwidthMax", "wbps": "IOWriteBandwidthMax",
+                          "riops": "IOReadIOPSMax", "wiops": "IOWriteIOPSMax"}
+            settings = " ".join(
+                shlex.quote(f"{properties[key]}={get_data_dir(node_idx)} {value}M" if key.endswith("bps")
+                            else f"{properties[key]}={get_data_dir(node_idx)} {value}")
+                for key, value in limits.items() if value)
+            return f"systemctl set-property --runtime taosd {settings}"
+        limit = " ".join(f"{key}={int(value * 1024 * 1024) if key.endswith('bps') else int(value)}"
+                         for key, value in limits.items() if value)
+        return (f"{_data_device_script(get_data_dir(node_idx))} && "
+                + _enter_fault_cgroup_script(component, "io", "io.max", f"$devno {limit}"))
+    if kind == "io_delay":
+        # 仅支持单段 linear 表（如LVM逻辑卷），suspend→reload→resume 期间IO被挂起而不会失败
+        read_ms = fault.get("read_ms", 0)
+        write_ms = fault.get("write_ms", read_ms)
+        target = f"$4 $5 {read_ms} $4 $5 {write_ms}"
+        if fault.get("flush_ms") is not None:
+            target += f" $4 $5 {fault['flush_ms']}"
+        return (f"src=$(findmnt -no SOURCE --target {get_data_dir(node_idx)}) && "
+                f"dm=$(dmsetup info -c --noheadings -o name $src 2>/dev/null) && "
+                f"table=$(dmsetup table $dm) && [ $(echo \"$table\" | wc -l) -eq 1 ] && "
+                f"[ \"$(echo $table | cut -d' ' -f3)\" = linear ] || "
+                f"{{ echo \"数据目录不在单段 device-mapper linear 设备上: $src\" >&2; exit 1; }}; "
+                f"modprobe dm-delay; echo \"$dm $table\" > {_IO_DELAY_STATE_FILE} && set -- $table && "
+                f"dmsetup suspend $dm && {{ dmsetup reload $dm --table \"$1 $2 delay {target}\"; rc=$?; "
+                f"dmsetup resume $dm; [ $rc -eq 0 ]; }}")
+    if kind == "clock_skew":
+        # 先设置频率漂移再跳变时钟：任一步失败时恢复原频率和时间同步服务、删除状态文件，节点保持原状
+        offset_s = fault.get("offset_ms", 0) / 1000
+        drift_ppm = fault.get("drift_ppm", 0)
+        rollback = "for s in $services; do systemctl start $s; done"
+        if drift_ppm:
+            rollback = f"adjtimex -f $freq; {rollback}"
+        script = (f"[ ! -f {_CLOCK_STATE_FILE} ] || {{ echo '时钟偏移已存在，请先移除' >&2; exit 1; }}; "
+                  f"services=''; for s in {' '.join(_TIME_SYNC_SERVICES)}; do "
+                  f"systemctl is-active --quiet $s && systemctl stop $s && services=\"$services $s\"; done; "
+                  f"freq=$(adjtimex -p 2>/dev/null | awk '$1==\"frequency:\" {{print $2}}'); ")
+        if drift_ppm:
+            # adjtimex 频率单位为 2^-16 ppm，内核限制在 ±500 ppm 以内
+            script += (f"[ -n \"$freq\" ] && adjtimex -f $(awk -v f=$freq "
+                       f"'BEGIN {{printf \"%d\", f + {drift_ppm} * 65536}}') || "
+                       f"{{ for s in $services; do systemctl start $s; done; "
+                       f"echo 'adjtimex 设置频率漂移失败' >&2; exit 1; }}; ")
+        script += (f"t0=$(date +%s.%N) && echo \"$t0 {offset_s} {drift_ppm} ${{freq:-0}}$services\" > {_CLOCK_STATE_FILE} && "
+                   f"date -s \"@$(awk -v t=$t0 'BEGIN {{printf \"%.6f\", t + {offset_s}}}')\" >/dev/null || "
+                   f"{{ rm -f {_CLOCK_STATE_FILE}; {rollback}; echo '跳变系统时钟失败' >&2; exit 1; }}")
+        return script
+    raise ValueError(f"未知的节点故障类型: {kind}")
+
+
+def build_fault_remove_script(node_idx: int, kind: str) -> str:
+    """
+    生成移除某类资源故障的shell脚本，故障不存在时同样可以安全执行
+
+    参数:
+        node_idx: 节点索引
+        kind: 故障类型（kill 除外）
+    """
+    if kind == "freeze":
+        # pkill 未匹配到进程时返回1，不算失败
+        resume = "".join(f"pkill -CONT {_process_match(c)}; [ $? -le 1 ] || cont_rc=1; " for c in COMPONENTS)
+        return f"{_kill_background(kind)}; cont_rc=0; {resume}[ $cont_rc -eq 0 ]"
+    if kind == "cpu_quota":
+        if ctx.DB_TYPE == "TDengine":
+            return "systemctl set-property --runtime taosd CPUQuota="
+        return (f"if [ -d {_FAULT_CGROUP} ]; then echo max > {_FAULT_CGROUP}/cpu.max && "
+                f"{{ {_leave_fault_cgroup_script()}; }}; fi")
+    if kind == "io_throttle":
+        if ctx.DB_TYPE == "TDengine":
+            return ("systemctl set-property --runtime taosd "
+                    "IOReadBandwidthMax= IOWriteBandwidthMax= IOReadIOPSMax= IOWriteIOPSMax=")
+        return (f"if [ -d {_FAULT_CGROUP} ]; then io_rc=0; "
+                f"for devno in $(cut -d' ' -f1 {_FAULT_CGROUP}/io.max 2>/dev/null); do "
+                f"echo \"$devno rbps=max wbps=max riops=max wiops=max\" > {_FAULT_CGROUP}/io.max || io_rc=1; done; "
+                f"[ $io_rc -eq 0 ] && {{ {_leave_fault_cgroup_script()}; }}; fi")
+    if kind == "io_delay":
+        # 恢复失败时保留状态文件，故障仍可被探测到并再次移除
+        return (f"if [ -f {_IO_DELAY_STATE_FILE} ]; then read dm table < {_IO_DELAY_STATE_FILE} && "
+                f"dmsetup suspend $dm && {{ dmsetup reload $dm --table \"$table\"; rc=$?; dmsetup resume $dm && "
+                f"[ $rc -eq 0 ]; }} && rm -f {_IO_DELAY_STATE_FILE}; fi")
+    if kind == "clock_skew":
+        # 当前读数 = 真实时间 + 偏移 + 漂移累计，据此反推真实时间后恢复频率和时间同步服务
+        return (f"if [ -f {_CLOCK_STATE_FILE} ]; then read t0 off drift freq services < {_CLOCK_STATE_FILE}; "
+                f"clock_rc=0; date -s \"@$(awk -v t0=$t0 -v now=$(date +%s.%N) -v off=$off -v d=$drift "
+                f"'BEGIN {{printf \"%.6f\", t0 + (now - t0 - off) / (1 + d / 1000000)}}')\" >/dev/null || clock_rc=1; "
+                f"[ \"$drift\" = 0 ] || adjtimex -f $freq || clock_rc=1; "
+                f"for s in $services; do systemctl start $s || clock_rc=1; done; "
+                f"rm -f {_CLOCK_STATE_FILE}; [ $clock_rc -eq 0 ]; fi")
+    if kind in _STRESS_KINDS:
+        return _kill_background(kind)
+    if kind == "disk_fill":
+        return f"rm -f {get_data_dir(node_idx)}/{_FILL_FILE_NAME}"
+    raise ValueError(f"未知的节点故障类型: {kind}")
+
+
+def build_fault_cleanup_script(node_idx: int) -> str:
+    """生成移除全部资源类故障的shell脚本（用于预防性清理和异常退出），每类都会执行，任一类移除失败时返回非0"""
+    return ("cleanup_rc=0; "
+            + "".join(f"{{ {build_fault_remove_script(node_idx, kind)}; }} || cleanup_rc=1; "
+                      for kind in FAULT_KINDS if kind != "kill")
+            + "[ $cleanup_rc -eq 0 ]")
+
+
+def _fault_probe(node_idx: int, kind: str) -> str:
+    """生成判断某类资源故障当前是否生效的shell条件"""
+    if kind == "freeze":
+        stopped = " || ".join(f"pgrep {_process_match(c)} | while read p; do "
+                              f"grep '^State:' /proc/$p/status 2>/dev/null; done | grep -q '[[:space:]]T'"
+                              for c in COMPONENTS)
+        pid_file = _pid_file(kind)
+        return f"{{ [ -f {pid_file} ] && kill -0 $(cat {pid_file}) 2>/dev/null; }} || {stopped}"
+    if kind == "cpu_quota":
+        if ctx.DB_TYPE == "TDengine":
+            return "[ \"$(systemctl show taosd -p CPUQuotaPerSecUSec --value 2>/dev/null)\" != infinity ]"
+        return f"[ -f {_FAULT_CGROUP}/cpu.max ] && ! grep -q '^max' {_FAULT_CGROUP}/cpu.max"
+    if kind == "io_throttle":
+        if ctx.DB_TYPE == "TDengine":
+            return ("systemctl show taosd -p IOReadBandwidthMax -p IOWriteBandwidthMax "
+                    "-p IOReadIOPSMax -p IOWriteIOPSMax --value 2>/dev/null | grep -q .")
+        return f"grep -qE '(bps|iops)=[0-9]' {_FAULT_CGROUP}/io.max 2>/dev/null"
+    if kind in _STRESS_KINDS:
+        pid_file = _pid_file(kind)
+        return f"[ -f {pid_file} ] && kill -0 $(cat {pid_file}) 2>/dev/null"
+    if kind == "disk_fill":
+        return f"[ -f {get_data_dir(node_idx)}/{_FILL_FILE_NAME} ]"
+    if kind == "io_delay":
+        return f"[ -f {_IO_DELAY_STATE_FILE} ]"
+    if kind == "clock_skew":
+        return f"[ -f {_CLOCK_STATE_FILE} ]"
+    raise ValueError(f"未知的节点故障类型: {kind}")
+
+
+def build_fault_probe_script(node_idx: int) -> str:
+    """生成读取节点上资源类故障现状的shell脚本，每个正在生效的故障类型输出一行 fault 类型"""
+    return "; ".join(f"if {_fault_probe(node_idx, kind)}; then echo fault {kind}; fi"
+                     for kind in FAULT_KINDS if kind != "kill") + "; true"
+
+
+def parse_fault_probe(output: str) -> List[str]:
+    """解析 build_fault_probe_script 的输出，返回正在生效的故障类型"""
+    return [line.split()[1] for line in output.splitlines()
+            if len(line.split()) == 2 and line.split()[0] == "fault" and line.split()[1] in FAULT_KINDS]
+
+
+def apply_node_fault(node_idx: int, fault: Dict[str, Any]) -> bool:
+    """
+    在指定节点上施加一项资源类故障
+
+    参数:
+        node_idx: 节点索引
+        fault: 故障参数字典
+
+    返回:
+        bool: 操作是否成功
+    """
+    kind = fault["kind"]
+    if kind == "kill":
+        return stop_component(node_idx, fault.get("component", "datanode"), "kill")
+    if kind in _STRESS_KINDS and not get_node_facts(node_idx).get("has_stress_ng", True):
+        logging.error(f"节点 {node_idx} 未安装 stress-ng，无法施加故障 {describe_fault(fault)}")
+        return False
+    # TDengine 的 CPUQuota 由 systemd 设置，cgroup v1 同样支持
+    cgroup_kind = kind in _CGROUP2_KINDS and not (kind == "cpu_quota" and ctx.DB_TYPE == "TDengine")
+    if cgroup_kind and not get_node_facts(node_idx).get("has_cgroup2", True):
+        logging.error(f"节点 {node_idx} 未使用 cgroup v2，无法施加故障 {describe_fault(fault)}")
+        return False
+    if kind == "clock_skew" and fault.get("drift_ppm") and not get_node_facts(node_idx).get("has_adjtimex", True):
+        logging.error(f"节点 {node_idx} 未安装 adjtimex，无法施加故障 {describe_fault(fault)}")
+        return False
+    try:
+        script = build_fault_apply_script(node_idx, fault)
+        exit_status, _, error_output = run_remote_command(node_idx, f"sudo sh -c {shlex.quote(script)}")
+        if exit_status == 0:
+            logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 已施加节点故障: {describe_fault(fault)}")
+            return True
+        logging.error(f"节点 {node_idx} 施加节点故障 {describe_fault(fault)} 失败: {error_output}")
+        return False
+    except Exception as e:
+        logging.error(f"节点 {node_idx} 施加节点故障时出错: {e}")
+        return False
+
+
+def remove_node_fault(node_idx: int, fault: Dict[str, Any] = None) -> bool:
+    """
+    移除指定节点上的资源类故障，fault 为None时清理全部资源类故障
+
+    参数:
+        node_idx: 节点索引
+        fault: 需要移除的故障参数字典
+
+    返回:
+        bool: 操作是否成功
+    """
+    if fault is not None and fault["kind"] == "kill":
+        start_component(node_idx, fault.get("component", "datanode"))
+        return True
+    try:
+        if fault is None:
+            script = build_fault_cleanup_script(node_idx)
+        else:
+            script = build_fault_remove_script(node_idx, fault["kind"])
+        exit_status, _, error_output = run_remote_command(node_idx, f"sudo sh -c {shlex.quote(script)}")
+        if exit_status != 0:
+            logging.error(f"节点 {node_idx} 移除节点故障失败（返回码 {exit_status}）: {error_output.strip()}")
+            return False
+        logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 的节点故障已移除")
+        return True
+    except Exception as e:
+        logging.error(f"节点 {node_idx} 移除节点故障时出错: {e}")
+        return False
+
+
+@traced("fault")
+def apply_faults_to_nodes(node_indices: List[int], faults: List[Dict[str, Any]]) -> int:
+    """
+    并行为多个节点依次施加一组资源类故障
+
+    返回:
+        int: 全部故障都施加成功的节点数
+    """
+    logging.info(f"\n【开始施加节点故障】{', '.join(describe_fault(f) for f in faults)}，目标节点: {node_indices}")
+    record_event("fault_applied", nodes=list(node_indices), faults=faults)
+    results = run_on_nodes(lambda idx: all([apply_node_fault(idx, fault) for fault in faults]), node_indices)
+    # kill 由场景负责重新启动，其余故障在控制端异常退出时由看门狗自动移除
+    for kind in {fault["kind"] for fault in faults if fault["kind"] != "kill"}:
+        arm_watchdog([idx for idx, ok in results.items() if ok], f"fault:{kind}")
+    success_count = sum(1 for ok in results.values() if ok)
+    if success_count == len(node_indices):
+        logging.info(f"【节点故障施加完成】成功为 {success_count} 个节点施加节点故障")
+    else:
+        logging.warning(f"【节点故障施加部分完成】成功: {success_count}/{len(node_indices)} 个节点")
+    return success_count
+
+
+@traced("heal")
+def remove_faults_from_nodes(node_indices: List[int] = None, faults: List[Dict[str, Any]] = None) -> int:
+    """
+    并行移除多个节点的资源类故障，默认为全部节点；faults 为None时清理全部资源类故障
+
+    返回:
+        int: 成功的节点数
+    """
+    if node_indices is None:
+        node_indices = list(range(ctx.node_num))
+
+    def remove(idx):
+        if faults is None:
+            return remove_node_fault(idx)
+        return all([remove_node_fault(idx, fault) for fault in reversed(faults)])
+
+    logging.info(f"\n【开始移除节点故障】目标节点: {node_indices}")
+    record_event("fault_removed", nodes=list(node_indices), faults=faults)
+    results = run_on_nodes(remove, node_indices)
+    kinds = FAULT_KINDS if faults is None else [fault["kind"] for fault in faults]
+    disarm_watchdog([idx for idx, ok in results.items() if ok], [f"fault:{kind}" for kind in kinds])
+    success_count = sum(1 for ok in results.values() if ok)
+    if success_count == len(node_indices):
+        logging.info(f"【节点故障移除完成】成功移除 {success_count} 个节点的节点故障")
+    else:
+        logging.warning(f"【节点故障移除部分完成】成功: {success_count}/{len(node_indices)} 个节点")
+    return success_count
+
+
+# /proc/diskstats 中设备名之后各列的含义（flush 两列需要 5.5 及以上内核）
+_DISKSTATS_FIELDS = {
+    "reads": 0, "sectors_read": 2, "read_ms": 3,
+    "writes": 4, "sectors_written": 6, "write_ms": 7,
+    "flushes": 15, "flush_ms": 16,
+}
+
+
+def parse_diskstats_line(line: str) -> Dict[str, Any]:
+    """
+    解析 /proc/diskstats 的一行
+
+    返回:
+        dict: 设备名及 _DISKSTATS_FIELDS 中的计数器，缺失的列为None
+    """
+    parts = line.split()
+    values = parts[3:]
+    stats: Dict[str, Any] = {"device": parts[2]}
+    for key, pos in _DISKSTATS_FIELDS.items():
+        stats[key] = int(values[pos]) if pos < len(values) else None
+    return stats
+
+
+def collect_disk_stats(node_idx: int) -> Dict[str, Any]:
+    """
+    读取节点数据目录所在块设备的 /proc/diskstats 计数器
+
+    参数:
+        node_idx: 节点索引
+
+    返回:
+        dict: 计数器及采集时间 timestamp，读取失败时返回None
+    """
+    script = f"{_data_device_script(get_data_dir(node_idx))} && grep \" $name \" /proc/diskstats"
+    exit_status, output, error_output = run_remote_command(node_idx, f"sh -c {shlex.quote(script)}")
+    if exit_status != 0 or not output.strip():
+        logging.warning(f"节点 {node_idx} 读取磁盘统计失败: {error_output.strip()}")
+        return None
+    stats = parse_diskstats_line(output.strip().splitlines()[0])
+    stats["timestamp"] = time.time()
+    return stats
+
+
+def diff_disk_stats(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    计算两次采样之间的磁盘写入吞吐、IOPS 以及平均写入/刷盘延迟
+
+    返回:
+        dict: duration_s, read_mb_s, write_mb_s, write_iops, read_await_ms, write_await_ms,
+              flushes, flush_await_ms；任一采样缺失时返回None
+    """
+    if not before or not after:
+        return None
+    duration = max(after["timestamp"] - before["timestamp"], 1e-6)
+
+    def delta(key):
+        if before.get(key) is None or after.get(key) is None:
+            return None
+        return after[key] - before[key]
+
+    def await_ms(ms_key, count_key):
+        count = delta(count_key)
+        return round(delta(ms_key) / count, 3) if count else None
+
+    return {
+        "duration_s": round(duration, 1),
+        "read_mb_s": round(delta("sectors_read") * 512 / duration / 1024 / 1024, 3),
+        "write_mb_s": round(delta("sectors_written") * 512 / duration / 1024 / 1024, 3),
+        "write_iops": round(delta("writes") / duration, 1),
+        "read_await_ms": await_ms("read_ms", "reads"),
+        "write_await_ms": await_ms("write_ms", "writes"),
+        "flushes": delta("flushes"),
+        "flush_await_ms": await_ms("flush_ms", "flushes"),
+    }
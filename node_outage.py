@@ -1,24 +1,15 @@
 import json
 import time
-import threading
-import random
 import logging
-from config import node_num,server_ip,abnormal_scenario,OUTPUT_STORE_PATH
 import os
 from tools import startConfigNode, startDataNode,stopNode,run_bat_and_parse,start_monitoring_system, modify_db_switch
-
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
+from cluster_topology import probe_cluster_topology, select_fault_targets, config_leader_excluded
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_manifest import record_event
+from run_context import ctx, ContextThread, with_run_context
 
 
+@with_run_context
 def node_outage_scenario(bat_path: str = "test.bat", 
                                    test_result_file_path: str = "test_result.txt",
                                    storing_path: str = "single_run_results") -> None:
@@ -31,7 +22,7 @@ def node_outage_scenario(bat_path: str = "test.bat",
         storing_path: 结果输出路径
     """
     current_time = int(time.time())
-    output_store_path = f"{storing_path}\\result_{abnormal_scenario}_{current_time}\\single_run.json"
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
     
     logging.info(f"\n{'='*80}")
     logging.info(f"开始单次节点宕机场景实验")
@@ -67,8 +58,8 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
     all_test_results = {
         "scenario_name": "node_outage_scenario_single_run",  # 场景名称
         "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),  # 场景开始时间
-        "node_count": node_num,  # 节点数量
-        "server_ips": server_ip,  # 服务器IP列表
+        "node_count": ctx.node_num,  # 节点数量
+        "server_ips": ctx.server_ip,  # 服务器IP列表
         "test_results": [],  # 存储测试的具体结果
         "end_time": "",  # 场景结束时间（最后赋值）
         "status": "running"  # 场景整体状态：running/finished/failed
@@ -78,8 +69,8 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
         # -------------------------- 1. 清理所有节点 --------------------------
         logging.info("【步骤1/5】清理所有节点...")
         clean_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             clean_threads.append(t)
 
@@ -87,11 +78,14 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
 
         logging.info("【步骤1/5】所有节点清理完成")
 
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
         # -------------------------- 2. 启动所有ConfigNode --------------------------
         logging.info("\n【步骤2/5】启动所有ConfigNode...")
         config_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startConfigNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
             t.start()
             config_threads.append(t)
         time.sleep(60)
@@ -101,8 +95,8 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
         # -------------------------- 3. 启动所有DataNode --------------------------
         logging.info("\n【步骤3/5】启动所有DataNode...")
         data_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startDataNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
             t.start()
             data_threads.append(t)
         time.sleep(60)
@@ -115,11 +109,16 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
         logging.info("【步骤4/5】节点监控系统启动完成")
 
         # -------------------------- 5. 异常测试：等待20分钟后开始，期间进行DataNode操作 --------------------------
-        logging.info("\n【步骤5/5】等待20分钟后开始异常测试（期间进行DataNode停止和重启操作）...")
-        time.sleep(20 * 60)  # 等待20分钟
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间进行DataNode停止和重启操作）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
         
-        # 随机选择一个DataNode宕机(不停止作为测试启动的DataNode 0)
-        fail_idx = random.randint(1, node_num - 1)
+        # 按 FAULT_TARGET_STRATEGY 选择一个DataNode宕机(不停止作为测试启动的DataNode 0)
+        strategy = ctx.get("FAULT_TARGET_STRATEGY", "random")
+        topology = probe_cluster_topology() if strategy != "random" else None
+        fail_idx = select_fault_targets(1, strategy, topology=topology)[0]
+        all_test_results["target_strategy"] = strategy
+        all_test_results["cluster_topology"] = topology
+        all_test_results["leader_excluded"] = config_leader_excluded(strategy, topology)
         logging.info(f"选择DataNode {fail_idx}作为故障节点")
         
         # 创建异步执行DataNode操作的线程
@@ -127,20 +126,22 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
             logging.info(f"等待10分钟后停止DataNode {fail_idx}...")
             time.sleep(10 * 60)  # 等待10分钟
             logging.info(f"停止DataNode {fail_idx}...")
-            stop_thread = threading.Thread(target=stopNode, args=(fail_idx, True))  # 只停止DataNode
+            record_event("datanode_stopped", node=fail_idx)
+            stop_thread = ContextThread(target=stopNode, args=(fail_idx, True))  # 只停止DataNode
             stop_thread.start()
             stop_thread.join()  # 等待停止完成
             
             logging.info(f"等待15分钟后重启DataNode {fail_idx}...")
             time.sleep(15 * 60)  # 等待15分钟
             logging.info(f"重启DataNode {fail_idx}...")
-            restart_thread = threading.Thread(target=startDataNode, args=(fail_idx,))
+            record_event("datanode_started", node=fail_idx)
+            restart_thread = ContextThread(target=startDataNode, args=(fail_idx,))
             restart_thread.start()
             restart_thread.join()  # 等待重启完成
             logging.info(f"DataNode {fail_idx}重启完成")
         
         # 启动DataNode操作线程
-        operation_thread = threading.Thread(target=datanode_operation)
+        operation_thread = ContextThread(target=datanode_operation)
         operation_thread.start()
         
         # 同时开始异常测试
@@ -183,5 +184,9 @@ def node_outage_scenario_single_run(bat_path, test_result_file_path, output_stor
             json.dump(all_test_results, f, ensure_ascii=False, indent=2)
         logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
 
+    finally:
+        # 使用数据集快照时写回benchmark配置
+        restore_dataset_properties()
+
     # 返回完整的测试结果集合（便于后续程序调用）
     return all_test_results
@@ -1,23 +1,16 @@
 import json
 import time
-import threading
-import random
+import itertools
 import logging
 import os
-import shutil
-from config import node_num, server_ip, abnormal_scenario, OUTPUT_STORE_PATH, BENCHMARK_CONFIG_PATH
-from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
+from typing import Any, Dict, List
+from tools import (startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch,
+                   parse_result_matrix, parse_latency_matrix, modify_benchmark_properties, restore_benchmark_properties)
+from prometheus_metrics import collect_phase_metrics
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_manifest import record_event
+from run_context import ctx, ContextThread, with_run_context
 
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
 
 def modify_benchmark_config_for_write_only():
     """
@@ -25,104 +18,95 @@ def modify_benchmark_config_for_write_only():
     修改OPERATION_PROPORTION为1:0:0:0:0:0:0:0:0:0:0:0
     同时修改LOOP为1500
     """
-    try:
-        # 备份原始配置文件
-        backup_path = BENCHMARK_CONFIG_PATH + ".backup"
-        if not os.path.exists(backup_path):
-            shutil.copy2(BENCHMARK_CONFIG_PATH, backup_path)
-            logging.info(f"已备份原始配置文件到: {backup_path}")
-        
-        # 读取配置文件
-        with open(BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 修改配置参数
-        modified_lines = []
-        for line in lines:
-            if line.strip().startswith('OPERATION_PROPORTION'):
-                modified_lines.append("OPERATION_PROPORTION=1:0:0:0:0:0:0:0:0:0:0:0\n")
-                logging.info("修改OPERATION_PROPORTION: 设置为仅写入模式")
-            elif line.strip().startswith('LOOP'):
-                modified_lines.append("LOOP=1500\n")
-                logging.info("修改LOOP: 设置为1500")
-            else:
-                modified_lines.append(line)
-        
-        # 写入修改后的配置
-        with open(BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
-            f.writelines(modified_lines)
-        
-        logging.info("✅ 配置文件修改完成，已设置为仅写入模式，LOOP=1500")
-        return True
-        
-    except Exception as e:
-        logging.error(f"❌ 修改配置文件时出错: {e}")
+    if not modify_benchmark_properties({"OPERATION_PROPORTION": "1:0:0:0:0:0:0:0:0:0:0:0", "LOOP": 1500}):
         return False
+    logging.info("✅ 配置文件修改完成，已设置为仅写入模式，LOOP=1500")
+    return True
 
-def modify_benchmark_config_for_disorder():
+def expand_disorder_sweep() -> List[Dict[str, Any]]:
     """
-    修改benchmark配置文件，开启消息乱序
-    修改IS_OUT_OF_ORDER为TRUE
+    将 OUT_OF_ORDER_SWEEP 展开为每次实验使用的乱序参数（各扫描轴取笛卡尔积）
+
+    OUT_OF_ORDER_SWEEP 的键为benchmark参数名：OUT_OF_ORDER_RATIO（乱序比例）、
+    OUT_OF_ORDER_MODE（POISSON/BATCH）、LAMBDA 与 MAX_K（泊松模式下的迟到时间分布）
+
+    返回:
+        list: 每个元素为一次实验的 {参数名: 取值}，未配置扫描时为 [{}]（使用benchmark默认值）
     """
-    try:
-        # 读取配置文件
-        with open(BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 修改配置参数
-        modified_lines = []
-        for line in lines:
-            if line.strip().startswith('IS_OUT_OF_ORDER'):
-                modified_lines.append("IS_OUT_OF_ORDER=true\n")
-                logging.info("修改IS_OUT_OF_ORDER: 设置为TRUE，开启消息乱序")
-            else:
-                modified_lines.append(line)
-        
-        # 写入修改后的配置
-        with open(BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
-            f.writelines(modified_lines)
-        
-        logging.info("✅ 配置文件修改完成，已开启消息乱序")
-        return True
-        
-    except Exception as e:
-        logging.error(f"❌ 修改配置文件时出错: {e}")
-        return False
+    sweep = ctx.get("OUT_OF_ORDER_SWEEP", None) or {}
+    keys = list(sweep)
+    return [dict(zip(keys, values)) for values in itertools.product(*(sweep[k] for k in keys))]
 
-def restore_benchmark_config():
+
+def describe_disorder(params: Dict[str, Any]) -> str:
+    """生成乱序参数的简短描述，用于日志和阶段描述"""
+    return ",".join(f"{key}={value}" for key, value in params.items()) or "默认乱序参数"
+
+
+def summarize_disorder_sweep(points: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    恢复benchmark配置文件到原始状态
-    包括恢复LOOP=15000和OPERATION_PROPORTION的原始值
+    汇总乱序参数扫描：每组参数的各操作吞吐、平均/P99延迟，以及乱序阶段各合并指标在所有实例上的峰值
+
+    参数:
+        points: 每次实验的乱序参数
+        results: 对应的 out_of_order_scenario_single_run 返回值
+
+    返回:
+        list: 每组参数一条汇总记录，便于观察吞吐和查询延迟随乱序程度的变化
     """
-    try:
-        backup_path = BENCHMARK_CONFIG_PATH + ".backup"
-        if os.path.exists(backup_path):
-            shutil.copy2(backup_path, BENCHMARK_CONFIG_PATH)
-            logging.info("✅ 配置文件已恢复到原始状态（包括LOOP=15000）")
-            return True
-        else:
-            logging.warning("⚠️  未找到备份文件，无法恢复配置")
-            return False
-    except Exception as e:
-        logging.error(f"❌ 恢复配置文件时出错: {e}")
+    summary = []
+    for params, result in zip(points, results):
+        row = {"disorder_params": params, "status": (result or {}).get("status"),
+               "throughput": {}, "latency_avg_ms": {}, "latency_p99_ms": {}, "disorder_compaction_peak": {}}
+        test = ((result or {}).get("test_results") or [None])[0] or {}
+        if test.get("result_matrix"):
+            row["throughput"] = {op: v["throughput"] for op, v in parse_result_matrix(test["result_matrix"]).items()}
+        if test.get("latency_matrix"):
+            latency = parse_latency_matrix(test["latency_matrix"])
+            row["latency_avg_ms"] = {op: v["AVG"] for op, v in latency.items()}
+            row["latency_p99_ms"] = {op: v["P99"] for op, v in latency.items()}
+        for name, per_instance in ((result or {}).get("compaction_metrics") or {}).get("disorder", {}).items():
+            peaks = [stats["max"] for stats in per_instance.values() if isinstance(stats, dict) and "max" in stats]
+            row["disorder_compaction_peak"][name] = max(peaks) if peaks else None
+        summary.append(row)
+    return summary
+
+
+def modify_benchmark_config_for_disorder(params: Dict[str, Any] = None):
+    """
+    修改benchmark配置文件，开启消息乱序
+    修改IS_OUT_OF_ORDER为TRUE，并写入乱序比例、乱序模式、迟到分布等参数
+
+    参数:
+        params: {benchmark参数名: 取值}，配置文件中不存在的参数追加到末尾
+    """
+    if not modify_benchmark_properties({"IS_OUT_OF_ORDER": "true", **(params or {})}):
         return False
+    logging.info("✅ 配置文件修改完成，已开启消息乱序")
+    return True
 
+@with_run_context
 def out_of_order_scenario(bat_path: str = "test.bat", 
                              test_result_file_path: str = "test_result.txt",
                              storing_path: str = "single_run_results") -> None:
     """
-    运行单次消息乱序场景
+    运行消息乱序场景，配置了 OUT_OF_ORDER_SWEEP 时对每组乱序参数各运行一次
     
     参数:
         bat_path: 测试脚本路径
         test_result_file_path: 单次测试结果文件路径
         storing_path: 结果输出路径
+    
+    返回:
+        单组参数时返回该次实验结果，扫描多组参数时返回结果列表
     """
     current_time = int(time.time())
-    output_store_path = f"{storing_path}\\result_out_of_order_{current_time}\\single_run.json"
+    points = expand_disorder_sweep()
     
     logging.info(f"\n{'='*80}")
-    logging.info(f"开始单次消息乱序场景实验")
+    logging.info(f"开始消息乱序场景实验，共 {len(points)} 组乱序参数")
+    for params in points:
+        logging.info(f"  {describe_disorder(params)}")
     logging.info(f"{'='*80}")
     
     # 修改DB_SWITCH配置
@@ -131,23 +115,46 @@ def out_of_order_scenario(bat_path: str = "test.bat",
         logging.error("❌ 修改DB_SWITCH失败，实验终止")
         return None
     
-    # 调用消息乱序场景函数
-    exp_result = out_of_order_scenario_single_run(
-        bat_path=bat_path,
-        test_result_file_path=test_result_file_path,
-        output_store_path=output_store_path
-    )
+    sweep_results = []
+    for point_idx, params in enumerate(points):
+        if len(points) == 1:
+            output_store_path = f"{storing_path}\\result_out_of_order_{current_time}\\single_run.json"
+        else:
+            output_store_path = f"{storing_path}\\result_out_of_order_{current_time}_{point_idx}\\single_run.json"
+            logging.info(f"\n【参数扫描 {point_idx + 1}/{len(points)}】{describe_disorder(params)}")
+        
+        # 调用消息乱序场景函数
+        exp_result = out_of_order_scenario_single_run(
+            bat_path=bat_path,
+            test_result_file_path=test_result_file_path,
+            output_store_path=output_store_path,
+            disorder_params=params
+        )
+        sweep_results.append(exp_result)
+        logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+    
+    if len(points) > 1:
+        summary = summarize_disorder_sweep(points, sweep_results)
+        summary_path = f"{storing_path}\\result_out_of_order_{current_time}_summary\\sweep_summary.json"
+        os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        for row in summary:
+            logging.info(f"【乱序扫描汇总】{describe_disorder(row['disorder_params'])}: 吞吐 {row['throughput']}，"
+                         f"P99延迟 {row['latency_p99_ms']}，合并指标峰值 {row['disorder_compaction_peak']}")
+        logging.info(f"✅ 乱序扫描汇总已保存到 {summary_path}")
     
-    logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
-    return exp_result
+    return sweep_results[0] if len(sweep_results) == 1 else sweep_results
 
-def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_store_path):
+def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_store_path,
+                                     disorder_params: Dict[str, Any] = None):
     """
-    单次消息乱序场景主函数：清理→启动→等待20分钟→异常测试(乱序模式)→恢复配置→停止系统
+    单次消息乱序场景主函数：清理→启动→等待20分钟→异常测试(乱序模式)→恢复配置→采集合并指标→停止系统
     参数：
         bat_path: str - 测试用bat文件的完整路径
         test_result_file_path: str - 单次测试结果文件的完整路径
         output_store_path: str - 最终测试结果集合的存储路径
+        disorder_params: dict - 乱序参数（OUT_OF_ORDER_RATIO / OUT_OF_ORDER_MODE / LAMBDA / MAX_K 等）
     返回：
         dict - 异常测试的结果集合（含状态信息）
     """
@@ -155,8 +162,9 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
     all_test_results = {
         "scenario_name": "out_of_order_scenario_single_run",  # 场景名称
         "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),  # 场景开始时间
-        "node_count": node_num,  # 节点数量
-        "server_ips": server_ip,  # 服务器IP列表
+        "node_count": ctx.node_num,  # 节点数量
+        "server_ips": ctx.server_ip,  # 服务器IP列表
+        "disorder_params": disorder_params or {},  # 乱序参数
         "test_results": [],  # 存储测试的具体结果
         "end_time": "",  # 场景结束时间（最后赋值）
         "status": "running"  # 场景整体状态：running/finished/failed
@@ -166,19 +174,22 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
         # -------------------------- 1. 清理所有节点 --------------------------
         logging.info("【步骤1/5】清理所有节点...")
         clean_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             clean_threads.append(t)
 
         time.sleep(10)
         logging.info("【步骤1/5】所有节点清理完成")
 
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
         # -------------------------- 2. 启动所有ConfigNode --------------------------
         logging.info("\n【步骤2/5】启动所有ConfigNode...")
         config_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startConfigNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
             t.start()
             config_threads.append(t)
         time.sleep(60)
@@ -187,8 +198,8 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
         # -------------------------- 3. 启动所有DataNode --------------------------
         logging.info("\n【步骤3/5】启动所有DataNode...")
         data_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startDataNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
             t.start()
             data_threads.append(t)
         time.sleep(60)
@@ -200,8 +211,8 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
         logging.info("【步骤4/5】节点监控系统启动完成")
 
         # -------------------------- 5. 异常测试：等待20分钟后开始，期间进行配置修改 --------------------------
-        logging.info("\n【步骤5/5】等待20分钟后开始异常测试（期间进行配置修改操作）...")
-        time.sleep(20 * 60)  # 等待20分钟
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间进行配置修改操作）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
         
         # 修改配置为仅写入模式（为乱序测试做准备）
         logging.info("修改配置为仅写入模式...")
@@ -209,13 +220,18 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
             logging.error("修改配置文件失败")
             raise Exception("修改配置文件失败")
         
+        # 记录各阶段边界，测试结束后按阶段从Prometheus采集合并/乱序指标
+        phase_times = {"test_start": time.time()}
+        
         # 创建异步执行配置修改操作的线程
         def config_modification_operation():
             logging.info("等待10分钟后修改配置文件为乱序模式...")
             time.sleep(10 * 60)  # 等待10分钟
             
-            logging.info("开始修改配置文件为乱序模式...")
-            if not modify_benchmark_config_for_disorder():
+            logging.info(f"开始修改配置文件为乱序模式（{describe_disorder(disorder_params or {})}）...")
+            phase_times["disorder_on"] = time.time()
+            record_event("disorder_on", params=disorder_params or {})
+            if not modify_benchmark_config_for_disorder(disorder_params):
                 logging.error("修改配置文件失败")
                 return
             
@@ -223,12 +239,14 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
             time.sleep(15 * 60)  # 等待15分钟
             
             logging.info("开始恢复配置文件...")
-            if not restore_benchmark_config():
+            phase_times["disorder_off"] = time.time()
+            record_event("disorder_off")
+            if not restore_benchmark_properties():
                 logging.warning("配置文件恢复失败")
             logging.info("配置修改操作完成")
         
         # 启动配置修改操作线程
-        operation_thread = threading.Thread(target=config_modification_operation)
+        operation_thread = ContextThread(target=config_modification_operation)
         operation_thread.start()
         
         # 同时开始异常测试
@@ -239,11 +257,19 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
         )
         # 为异常测试添加状态标识（乱序状态）
         abnormal_test["test_phase"] = "disorder"
-        abnormal_test["phase_description"] = "消息乱序模式测试（乱序写入性能）"
+        abnormal_test["phase_description"] = f"消息乱序模式测试（乱序写入性能 - {describe_disorder(disorder_params or {})}）"
+        abnormal_test["disorder_params"] = disorder_params or {}
         all_test_results["test_results"].append(abnormal_test)
         
         # 等待配置修改操作完成
         operation_thread.join()
+        phase_times["test_end"] = time.time()
+        all_test_results["phase_times"] = phase_times
+        all_test_results["compaction_metrics"] = collect_phase_metrics([
+            ("baseline", phase_times["test_start"], phase_times.get("disorder_on")),
+            ("disorder", phase_times.get("disorder_on"), phase_times.get("disorder_off")),
+            ("recovery", phase_times.get("disorder_off"), phase_times["test_end"]),
+        ])
         logging.info("【步骤5/5】异常测试和配置修改操作均完成")
 
         # -------------------------- 6. 更新状态并存储结果 --------------------------
@@ -267,7 +293,7 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
         
         # 尝试恢复配置文件
         try:
-            restore_benchmark_config()
+            restore_benchmark_properties()
         except:
             logging.warning("⚠️  异常情况下配置文件恢复失败")
         
@@ -277,14 +303,19 @@ def out_of_order_scenario_single_run(bat_path, test_result_file_path, output_sto
             json.dump(all_test_results, f, ensure_ascii=False, indent=2)
         logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
 
+    finally:
+        # 使用数据集快照时写回benchmark配置
+        restore_dataset_properties()
+
     # 返回完整的测试结果集合（便于后续程序调用）
     return all_test_results
 
 if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
     # 测试消息乱序场景
-    from config import INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH
     out_of_order_scenario(
-        bat_path=INPUT_BAT_PATH,
-        test_result_file_path=INPUT_TEST_RESULT_PATH,
-        storing_path=OUTPUT_STORE_PATH
+        bat_path=ctx.INPUT_BAT_PATH,
+        test_result_file_path=ctx.INPUT_TEST_RESULT_PATH,
+        storing_path=ctx.OUTPUT_STORE_PATH
     )
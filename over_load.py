@@ -1,23 +1,13 @@
 import json
 import time
-import threading
-import random
 import logging
 import os
-import shutil
-from config import node_num, server_ip, abnormal_scenario, OUTPUT_STORE_PATH, BENCHMARK_CONFIG_PATH
-from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
+from tools import (startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch,
+                   modify_benchmark_properties, restore_benchmark_properties)
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_manifest import record_event, read_benchmark_config
+from run_context import ctx, ContextThread, with_run_context
 
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
 
 def modify_benchmark_config():
     """
@@ -25,65 +15,25 @@ def modify_benchmark_config():
     修改POINT_STEP为1/4原始数值，OP_MIN_INTERVAL为-1，QUERY_INTERVAL为1/4原始数值
     """
     try:
-        # 备份原始配置文件
-        backup_path = BENCHMARK_CONFIG_PATH + ".backup"
-        if not os.path.exists(backup_path):
-            shutil.copy2(BENCHMARK_CONFIG_PATH, backup_path)
-            logging.info(f"已备份原始配置文件到: {backup_path}")
-        
-        # 读取配置文件
-        with open(BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 修改配置参数
-        modified_lines = []
-        for line in lines:
-            if line.strip().startswith('POINT_STEP'):
-                # 获取原始值并计算1/4
-                original_value = int(line.split('=')[1].strip())
-                new_value = original_value // 4
-                modified_lines.append(f"POINT_STEP={new_value}\n")
-                logging.info(f"修改POINT_STEP: {original_value} -> {new_value}")
-            elif line.strip().startswith('OP_MIN_INTERVAL'):
-                modified_lines.append("OP_MIN_INTERVAL=-1\n")
-                logging.info("修改OP_MIN_INTERVAL: 0 -> -1")
-            elif line.strip().startswith('QUERY_INTERVAL'):
-                # 获取原始值并计算1/4
-                original_value = int(line.split('=')[1].strip())
-                new_value = original_value // 4
-                modified_lines.append(f"QUERY_INTERVAL={new_value}\n")
-                logging.info(f"修改QUERY_INTERVAL: {original_value} -> {new_value}")
-            else:
-                modified_lines.append(line)
-        
-        # 写入修改后的配置
-        with open(BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
-            f.writelines(modified_lines)
-        
-        logging.info("✅ 配置文件修改完成，已应用过载配置")
-        return True
-        
+        properties = read_benchmark_config()["properties"]
+        overrides = {}
+        for key in ("POINT_STEP", "QUERY_INTERVAL"):
+            if key in properties:
+                overrides[key] = int(properties[key]) // 4
+                logging.info(f"修改{key}: {properties[key]} -> {overrides[key]}")
+        if "OP_MIN_INTERVAL" in properties:
+            overrides["OP_MIN_INTERVAL"] = -1
+            logging.info(f"修改OP_MIN_INTERVAL: {properties['OP_MIN_INTERVAL']} -> -1")
     except Exception as e:
-        logging.error(f"❌ 修改配置文件时出错: {e}")
+        logging.error(f"❌ 读取配置文件时出错: {e}")
         return False
 
-def restore_benchmark_config():
-    """
-    恢复benchmark配置文件到原始状态
-    """
-    try:
-        backup_path = BENCHMARK_CONFIG_PATH + ".backup"
-        if os.path.exists(backup_path):
-            shutil.copy2(backup_path, BENCHMARK_CONFIG_PATH)
-            logging.info("✅ 配置文件已恢复到原始状态")
-            return True
-        else:
-            logging.warning("⚠️  未找到备份文件，无法恢复配置")
-            return False
-    except Exception as e:
-        logging.error(f"❌ 恢复配置文件时出错: {e}")
+    if not modify_benchmark_properties(overrides):
         return False
+    logging.info("✅ 配置文件修改完成，已应用过载配置")
+    return True
 
+@with_run_context
 def over_load_scenario(bat_path: str = "test.bat", 
                        test_result_file_path: str = "test_result.txt",
                        storing_path: str = "single_run_results") -> None:
@@ -96,7 +46,7 @@ def over_load_scenario(bat_path: str = "test.bat",
         storing_path: 结果输出路径
     """
     current_time = int(time.time())
-    output_store_path = f"{storing_path}\\result_{abnormal_scenario}_{current_time}\\single_run.json"
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
     
     logging.info(f"\n{'='*80}")
     logging.info(f"开始单次过载场景实验")
@@ -132,8 +82,8 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
     all_test_results = {
         "scenario_name": "over_load_scenario_single_run",  # 场景名称
         "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),  # 场景开始时间
-        "node_count": node_num,  # 节点数量
-        "server_ips": server_ip,  # 服务器IP列表
+        "node_count": ctx.node_num,  # 节点数量
+        "server_ips": ctx.server_ip,  # 服务器IP列表
         "test_results": [],  # 存储测试的具体结果
         "end_time": "",  # 场景结束时间（最后赋值）
         "status": "running"  # 场景整体状态：running/finished/failed
@@ -143,19 +93,22 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
         # -------------------------- 1. 清理所有节点 --------------------------
         logging.info("【步骤1/5】清理所有节点...")
         clean_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=stopNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
             t.start()
             clean_threads.append(t)
 
         time.sleep(10)
         logging.info("【步骤1/5】所有节点清理完成")
 
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
         # -------------------------- 2. 启动所有ConfigNode --------------------------
         logging.info("\n【步骤2/5】启动所有ConfigNode...")
         config_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startConfigNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
             t.start()
             config_threads.append(t)
         time.sleep(60)
@@ -164,8 +117,8 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
         # -------------------------- 3. 启动所有DataNode --------------------------
         logging.info("\n【步骤3/5】启动所有DataNode...")
         data_threads = []
-        for idx in range(node_num):
-            t = threading.Thread(target=startDataNode, args=(idx,))
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
             t.start()
             data_threads.append(t)
         time.sleep(60)
@@ -177,8 +130,8 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
         logging.info("【步骤4/5】节点监控系统启动完成")
 
         # -------------------------- 5. 异常测试：等待20分钟后开始，期间进行配置修改 --------------------------
-        logging.info("\n【步骤5/5】等待20分钟后开始异常测试（期间进行配置修改操作）...")
-        time.sleep(20 * 60)  # 等待20分钟
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间进行配置修改操作）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
         
         # 创建异步执行配置修改操作的线程
         def config_modification_operation():
@@ -186,6 +139,7 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
             time.sleep(10 * 60)  # 等待10分钟
             
             logging.info("开始修改配置文件为过载配置...")
+            record_event("overload_on")
             if not modify_benchmark_config():
                 logging.error("修改配置文件失败")
                 return
@@ -194,12 +148,13 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
             time.sleep(15 * 60)  # 等待15分钟
             
             logging.info("开始恢复配置文件...")
-            if not restore_benchmark_config():
+            record_event("overload_off")
+            if not restore_benchmark_properties():
                 logging.warning("配置文件恢复失败")
             logging.info("配置修改操作完成")
         
         # 启动配置修改操作线程
-        operation_thread = threading.Thread(target=config_modification_operation)
+        operation_thread = ContextThread(target=config_modification_operation)
         operation_thread.start()
         
         # 同时开始异常测试
@@ -238,7 +193,7 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
         
         # 尝试恢复配置文件
         try:
-            restore_benchmark_config()
+            restore_benchmark_properties()
         except:
             logging.warning("⚠️  异常情况下配置文件恢复失败")
         
@@ -248,14 +203,19 @@ def over_load_scenario_single_run(bat_path, test_result_file_path, output_store_
             json.dump(all_test_results, f, ensure_ascii=False, indent=2)
         logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
 
+    finally:
+        # 使用数据集快照时写回benchmark配置
+        restore_dataset_properties()
+
     # 返回完整的测试结果集合（便于后续程序调用）
     return all_test_results
 
 if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
     # 测试过载场景
-    from config import INPUT_BAT_PATH, INPUT_TEST_RESULT_PATH, OUTPUT_STORE_PATH
     over_load_scenario(
-        bat_path=INPUT_BAT_PATH,
-        test_result_file_path=INPUT_TEST_RESULT_PATH,
-        storing_path=OUTPUT_STORE_PATH
+        bat_path=ctx.INPUT_BAT_PATH,
+        test_result_file_path=ctx.INPUT_TEST_RESULT_PATH,
+        storing_path=ctx.OUTPUT_STORE_PATH
     )
\ No newline at end of file
@@ -0,0 +1,320 @@
+import time
+import shlex
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+from tools import open_ssh, run_remote_command, run_on_nodes
+from node_facts import get_node_facts
+from run_manifest import record_event
+from fault_watchdog import arm_watchdog, disarm_watchdog
+from harness_trace import traced
+from run_context import ctx
+
+# 网络分区规则全部放在专用链和专用ipset中，恢复时只删除它们，不影响节点上的其他iptables规则
+PARTITION_CHAINS = {"OUTPUT": "ABNORMAL_PARTITION_OUT", "INPUT": "ABNORMAL_PARTITION_IN"}
+PARTITION_IPSETS = {"OUTPUT": "abnormal_blocked_dst", "INPUT": "abnormal_blocked_src"}
+
+# 各数据库节点间内部通信端口与客户端端口
+# IoTDB: ConfigNode内部/共识 10710/10720，DataNode内部/数据交换/共识 10730-10760，客户端RPC 6667
+# TDengine: dnode间通信与原生客户端共用 serverPort 6030，无法按端口区分，client 预设只包含 taosAdapter
+#           REST/WebSocket 6041（原生连接器的流量只能与内部通信一起用 internal 阻断）；
+#           分区规则只匹配集群节点IP，阻断6030不会影响测试控制机到节点的客户端连接
+PARTITION_PORT_PRESETS = {
+    "IoTDB": {
+        "internal": [10710, 10720, 10730, 10740, 10750, 10760],
+        "client": [6667],
+    },
+    "TDengine": {
+        "internal": [6030],
+        "client": [6041],
+    },
+}
+
+
+def build_block_map(blocked_pairs: Iterable[Tuple[int, int]]) -> Dict[int, List[int]]:
+    """
+    将被阻断的(源节点, 目标节点)对整理为每个节点需要阻断的对端节点列表
+
+    参数:
+        blocked_pairs: 被阻断的有向节点对 (from_idx, to_idx)
+
+    返回:
+        dict: {源节点索引: [目标节点索引, ...]}
+    """
+    block_map: Dict[int, List[int]] = {}
+    for from_idx, to_idx in blocked_pairs:
+        if from_idx == to_idx:
+            continue
+        peers = block_map.setdefault(from_idx, [])
+        if to_idx not in peers:
+            peers.append(to_idx)
+    for peers in block_map.values():
+        peers.sort()
+    return block_map
+
+
+def resolve_partition_spec(directions: List[str] = None, protocol: str = None, ports=None) -> Dict[str, Any]:
+    """
+    解析分区规则的作用范围，未指定的字段取config中的配置
+
+    参数:
+        directions: 阻断方向，"INPUT" 和/或 "OUTPUT"
+        protocol: "all" / "tcp" / "udp"
+        ports: "all"、端口预设名（"internal"/"client"）或端口列表
+
+    返回:
+        dict: {"directions": [...], "protocol": str, "ports": [端口] 或 None(全部端口)}
+    """
+    directions = directions or ctx.get("PARTITION_DIRECTIONS", ["INPUT", "OUTPUT"])
+    protocol = protocol or ctx.get("PARTITION_PROTOCOL", "all")
+    if ports is None:
+        ports = ctx.get("PARTITION_PORTS", "all")
+
+    directions = [d.upper() for d in directions]
+    for direction in directions:
+        if direction not in PARTITION_CHAINS:
+            raise ValueError(f"未知的阻断方向: {direction}")
+    if protocol not in ("all", "tcp", "udp"):
+        raise ValueError(f"未知的协议: {protocol}")
+
+    if ports == "all":
+        resolved_ports = None
+    elif isinstance(ports, str):
+        presets = PARTITION_PORT_PRESETS.get(ctx.DB_TYPE, {})
+        if ports not in presets:
+            raise ValueError(f"{ctx.DB_TYPE} 没有名为 {ports} 的端口预设")
+        resolved_ports = list(presets[ports])
+    else:
+        resolved_ports = sorted({int(p) for p in ports})
+
+    return {"directions": directions, "protocol": protocol, "ports": resolved_ports}
+
+
+def _build_chain_rules(chain: str, ipset_name: str, match_dir: str, spec: Dict[str, Any]) -> List[str]:
+    """生成单条专用链中的iptables-restore规则行"""
+    ports = spec["ports"]
+    if ports is None and spec["protocol"] == "all":
+        return [f"-A {chain} -m set --match-set {ipset_name} {match_dir} -j DROP"]
+
+    protocols = ["tcp", "udp"] if spec["protocol"] == "all" else [spec["protocol"]]
+    rules = []
+    for proto in protocols:
+        if ports is None:
+            rules.append(f"-A {chain} -p {proto} -m set --match-set {ipset_name} {match_dir} -j DROP")
+            continue
+        # multiport 每条规则最多15个端口；--ports 同时匹配源端口和目的端口，覆盖连接的两个方向
+        for i in range(0, len(ports), 15):
+            port_list = ",".join(str(p) for p in ports[i:i + 15])
+            rules.append(f"-A {chain} -p {proto} -m set --match-set {ipset_name} {match_dir} "
+                         f"-m multiport --ports {port_list} -j DROP")
+    return rules
+
+
+def split_block_map(block_map: Dict[int, List[int]], spec: Dict[str, Any]) -> Tuple[Dict[int, List[int]], Dict[int, List[int]]]:
+    """
+    按阻断方向把 block_map 拆分为每个节点上的规则
+
+    有向节点对 (a, b) 被阻断时：OUTPUT方向在a上丢弃发往b的包，INPUT方向在b上丢弃来自a的包
+
+    返回:
+        tuple: ({节点索引: OUTPUT方向阻断的对端}, {节点索引: INPUT方向阻断的对端})
+    """
+    dst_peers: Dict[int, List[int]] = {}
+    src_peers: Dict[int, List[int]] = {}
+    for from_idx, to_list in block_map.items():
+        for to_idx in to_list:
+            if "OUTPUT" in spec["directions"]:
+                dst_peers.setdefault(from_idx, []).append(to_idx)
+            if "INPUT" in spec["directions"]:
+                src_peers.setdefault(to_idx, []).append(from_idx)
+    return dst_peers, src_peers
+
+
+def build_partition_script(dst_peers: List[int], src_peers: List[int], spec: Dict[str, Any]) -> str:
+    """
+    生成在单个节点上一次性应用分区规则的shell脚本
+
+    先用 ipset restore 批量写入被阻断的对端IP，再用 iptables-restore --noflush
+    原子地重建专用链，最后把专用链挂到INPUT/OUTPUT链上（已挂载则跳过）
+
+    参数:
+        dst_peers: 本节点不能发往的对端节点索引（OUTPUT方向）
+        src_peers: 本节点不能接收其流量的对端节点索引（INPUT方向）
+        spec: resolve_partition_spec 返回的规则作用范围
+
+    返回:
+        str: 以root身份执行的shell脚本
+    """
+    ipset_lines = []
+    for ipset_name, peers in ((PARTITION_IPSETS["OUTPUT"], dst_peers), (PARTITION_IPSETS["INPUT"], src_peers)):
+        ipset_lines += [f"create {ipset_name} hash:ip", f"flush {ipset_name}"]
+        ipset_lines += [f"add {ipset_name} {ctx.server_ip[peer]}" for peer in peers]
+
+    iptables_lines = ["*filter"]
+    hook_lines = []
+    for direction in spec["directions"]:
+        chain = PARTITION_CHAINS[direction]
+        match_dir = "dst" if direction == "OUTPUT" else "src"
+        iptables_lines.append(f":{chain} - [0:0]")
+        iptables_lines += _build_chain_rules(chain, PARTITION_IPSETS[direction], match_dir, spec)
+        hook_lines.append(f"iptables -C {direction} -j {chain} 2>/dev/null || iptables -I {direction} 1 -j {chain}")
+    iptables_lines.append("COMMIT")
+
+    return "\n".join([
+        "set -e",
+        "ipset restore -exist <<'EOF'",
+        *ipset_lines,
+        "EOF",
+        "iptables-restore --noflush <<'EOF'",
+        *iptables_lines,
+        "EOF",
+        *hook_lines,
+    ])
+
+
+def build_cleanup_script() -> str:
+    """生成删除专用链和ipset的shell脚本，规则不存在时同样成功返回"""
+    lines = []
+    for direction, chain in PARTITION_CHAINS.items():
+        lines += [
+            f"while iptables -D {direction} -j {chain} 2>/dev/null; do :; done",
+            f"iptables -F {chain} 2>/dev/null",
+            f"iptables -X {chain} 2>/dev/null",
+        ]
+    lines += [f"ipset destroy {ipset_name} 2>/dev/null" for ipset_name in PARTITION_IPSETS.values()]
+    lines.append("true")
+    return "\n".join(lines)
+
+
+def build_partition_probe_script() -> str:
+    """生成读取节点上专用链与ipset现状的shell脚本，每条已存在的专用链输出一行 chain 链名，随后是 ipset save 的输出"""
+    lines = [f"iptables -S {chain} >/dev/null 2>&1 && echo chain {chain}" for chain in PARTITION_CHAINS.values()]
+    lines += [f"ipset save {ipset_name} 2>/dev/null" for ipset_name in PARTITION_IPSETS.values()]
+    lines.append("true")
+    return "; ".join(lines)
+
+
+def parse_partition_probe(output: str) -> Dict[str, Any]:
+    """
+    解析 build_partition_probe_script 的输出
+
+    返回:
+        dict: {"OUTPUT": [对端], "INPUT": [对端]}，对端为节点索引（不在集群中的IP原样保留）；
+              没有任何专用链时返回 None
+    """
+    directions = {chain: direction for direction, chain in PARTITION_CHAINS.items()}
+    sets = {ipset_name: direction for direction, ipset_name in PARTITION_IPSETS.items()}
+    chains, peers = set(), {"OUTPUT": [], "INPUT": []}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "chain" and parts[1] in directions:
+            chains.add(directions[parts[1]])
+        elif len(parts) >= 3 and parts[0] == "add" and parts[1] in sets:
+            ip = parts[2]
+            peers[sets[parts[1]]].append(ctx.server_ip.index(ip) if ip in ctx.server_ip else ip)
+    if not chains:
+        return None
+    return {direction: sorted(values, key=str) for direction, values in peers.items()}
+
+
+@traced("fault")
+def apply_partition_rules(block_map: Dict[int, List[int]], spec: Dict[str, Any] = None) -> Dict[int, float]:
+    """
+    并行在所有涉及的节点上应用分区规则，每个节点只建立一次SSH连接、执行一次脚本
+
+    有向节点对 (a, b) 被阻断时：OUTPUT方向在a上丢弃发往b的包，INPUT方向在b上丢弃来自a的包。
+    所有节点先完成SSH握手，再通过屏障同时下发规则，使各节点几乎在同一时刻完成切换
+
+    参数:
+        block_map: {源节点索引: [需要阻断的目标节点索引, ...]}
+        spec: resolve_partition_spec 返回的规则作用范围，默认取config配置
+
+    返回:
+        dict: {节点索引: 规则生效时间戳}，失败的节点不出现在结果中
+    """
+    if spec is None:
+        spec = resolve_partition_spec()
+
+    dst_peers, src_peers = split_block_map(block_map, spec)
+    nodes = sorted(set(dst_peers) | set(src_peers))
+    if not nodes:
+        logging.warning("没有需要阻断的节点对，跳过网络分区")
+        return {}
+    logging.info(f"分区规则范围: 方向={spec['directions']} 协议={spec['protocol']} "
+                 f"端口={spec['ports'] if spec['ports'] else '全部'}")
+
+    for node_idx in nodes:
+        facts = get_node_facts(node_idx)
+        if facts and not (facts.get("has_ipset") and facts.get("has_iptables_restore")):
+            logging.error(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 缺少 ipset 或 iptables-restore，分区规则将无法生效")
+
+    barrier = threading.Barrier(len(nodes))
+    applied_at: Dict[int, float] = {}
+
+    def apply_on_node(node_idx: int):
+        ssh = None
+        try:
+            ssh = open_ssh(node_idx)
+        except Exception as e:
+            logging.error(f"节点 {node_idx} 建立SSH连接失败: {e}")
+        try:
+            barrier.wait(timeout=60)
+        except threading.BrokenBarrierError:
+            logging.warning(f"节点 {node_idx} 等待其他节点就绪超时，直接下发规则")
+        if ssh is None:
+            return
+        try:
+            out_peers = sorted(dst_peers.get(node_idx, []))
+            in_peers = sorted(src_peers.get(node_idx, []))
+            script = build_partition_script(out_peers, in_peers, spec)
+            exit_status, output, error_output = run_remote_command(
+                node_idx, f"sudo sh -c {shlex.quote(script)}", get_pty=True, ssh=ssh)
+            if exit_status == 0:
+                applied_at[node_idx] = time.time()
+                logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 已阻断 "
+                             f"发往 {[ctx.server_ip[p] for p in out_peers]} / 来自 {[ctx.server_ip[p] for p in in_peers]} 的通信")
+            else:
+                logging.error(f"节点 {node_idx} 应用分区规则失败: {error_output or output}")
+        finally:
+            ssh.close()
+
+    run_on_nodes(apply_on_node, nodes)
+
+    record_event("partition_applied", blocked={str(k): v for k, v in block_map.items()},
+                 applied_at={str(k): round(v, 3) for k, v in applied_at.items()})
+    if applied_at:
+        skew_ms = (max(applied_at.values()) - min(applied_at.values())) * 1000
+        logging.info(f"分区规则已在 {len(applied_at)}/{len(nodes)} 个节点生效，切换时间差 {skew_ms:.1f}ms")
+    # 控制端异常退出时由节点上的看门狗自动删除分区规则
+    arm_watchdog(applied_at, "partition")
+    return applied_at
+
+
+@traced("heal")
+def remove_partition_rules(node_indices: List[int] = None) -> Dict[int, bool]:
+    """
+    并行删除各节点上的专用链和ipset，只移除本工具添加的规则
+
+    参数:
+        node_indices: 需要清理的节点索引，默认为全部节点
+
+    返回:
+        dict: {节点索引: 是否清理成功}
+    """
+    if node_indices is None:
+        node_indices = list(range(ctx.node_num))
+    script = build_cleanup_script()
+    record_event("partition_removed", nodes=list(node_indices))
+
+    def cleanup_on_node(node_idx: int) -> bool:
+        exit_status, output, error_output = run_remote_command(
+            node_idx, f"sudo sh -c {shlex.quote(script)}", get_pty=True)
+        if exit_status != 0:
+            logging.error(f"节点 {node_idx} 清理分区规则失败: {error_output or output}")
+            return False
+        logging.info(f"节点 {node_idx} ({ctx.server_ip[node_idx]}) 的分区规则已清除")
+        return True
+
+    results = run_on_nodes(cleanup_on_node, node_indices)
+    disarm_watchdog([idx for idx, ok in results.items() if ok], ["partition"])
+    return results
@@ -0,0 +1,249 @@
+import hashlib
+import itertools
+import logging
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# 支持的分区拓扑类型
+#   single_isolation   单节点与其余所有节点双向隔离
+#   leader_isolation   当前持有最多写入region/vnode leader的节点（0号节点除外）被隔离；leader在每次施加时才确定（重启后会变化），
+#                      枚举时为占位拓扑，由 resolve_leader_isolation 展开
+#   majority_minority  多数派/少数派双向隔离，枚举所有少数派规模
+#   bridge             两组互相隔离，桥节点与两组均保持连通（非传递分区）
+#   ring               每个节点只与环上相邻节点连通，各节点看到的多数派各不相同
+#   one_way_link       单条有向链路被阻断，其余链路正常（逐链路阻断矩阵）
+TOPOLOGY_KINDS = ("single_isolation", "leader_isolation", "majority_minority", "bridge", "ring", "one_way_link")
+
+
+def _make_topology(kind: str, name: str, blocked_pairs: Iterable[Tuple[int, int]], **extra) -> Dict[str, Any]:
+    """构造拓扑字典，被阻断的有向节点对去重排序"""
+    topology = {"kind": kind, "name": name, "blocked_pairs": sorted({(a, b) for a, b in blocked_pairs if a != b})}
+    topology.update(extra)
+    return topology
+
+
+def _cut_between(group1: Sequence[int], group2: Sequence[int]) -> List[Tuple[int, int]]:
+    """两组节点之间的双向阻断节点对"""
+    return [(a, b) for a in group1 for b in group2] + [(b, a) for a in group1 for b in group2]
+
+
+def single_node_isolation(node_count: int, node: int, kind: str = "single_isolation") -> Dict[str, Any]:
+    """
+    单节点隔离：node 与其余所有节点之间双向阻断
+
+    参数:
+        node_count: 节点总数
+        node: 被隔离的节点索引
+        kind: 拓扑类型名，隔离leader时传 "leader_isolation"
+    """
+    others = [i for i in range(node_count) if i != node]
+    return _make_topology(kind, f"{kind}_{node}", _cut_between([node], others),
+                          groups=[others, [node]])
+
+
+def majority_minority(node_count: int, minority: Sequence[int]) -> Dict[str, Any]:
+    """
+    多数派/少数派分区：minority 与其余节点双向阻断
+
+    参数:
+        node_count: 节点总数
+        minority: 少数派节点索引
+    """
+    majority = [i for i in range(node_count) if i not in minority]
+    return _make_topology("majority_minority", f"majority_minority_{'-'.join(map(str, minority))}",
+                          _cut_between(majority, minority), groups=[majority, sorted(minority)])
+
+
+def bridge_partition(node_count: int, group1: Sequence[int], group2: Sequence[int], bridge: int) -> Dict[str, Any]:
+    """
+    桥接分区（非传递分区）：group1 与 group2 双向隔离，bridge 节点与两组都保持连通
+
+    参数:
+        node_count: 节点总数
+        group1: 第一组节点（不含bridge）
+        group2: 第二组节点（不含bridge）
+        bridge: 桥节点索引
+    """
+    name = f"bridge_{bridge}_{'-'.join(map(str, sorted(group1)))}_{'-'.join(map(str, sorted(group2)))}"
+    return _make_topology("bridge", name, _cut_between(group1, group2),
+                          groups=[sorted(group1), sorted(group2)], bridge=bridge)
+
+
+def ring_partition(node_count: int, order: Sequence[int] = None) -> Dict[str, Any]:
+    """
+    环形分区：节点按 order 排成环，每个节点只与环上左右相邻节点连通
+
+    参数:
+        node_count: 节点总数
+        order: 环上节点顺序，默认 0..node_count-1
+    """
+    order = list(order) if order is not None else list(range(node_count))
+    neighbours = {n: set() for n in order}
+    for i, n in enumerate(order):
+        neighbours[n].add(order[i - 1])
+        neighbours[n].add(order[(i + 1) % len(order)])
+    blocked = [(a, b) for a in order for b in order if a != b and b not in neighbours[a]]
+    return _make_topology("ring", f"ring_{'-'.join(map(str, order))}", blocked, ring=order)
+
+
+def one_way_link(node_count: int, from_idx: int, to_idx: int) -> Dict[str, Any]:
+    """单向链路阻断：只阻断 from_idx -> to_idx 方向"""
+    return _make_topology("one_way_link", f"one_way_{from_idx}_to_{to_idx}", [(from_idx, to_idx)])
+
+
+def block_matrix_topology(matrix: Sequence[Sequence[int]], name: str = "block_matrix") -> Dict[str, Any]:
+    """
+    由阻断矩阵构造拓扑：matrix[a][b] 为真表示阻断 a -> b
+
+    参数:
+        matrix: node_count x node_count 的0/1矩阵
+        name: 拓扑名称
+    """
+    blocked = [(a, b) for a, row in enumerate(matrix) for b, cell in enumerate(row) if cell]
+    return _make_topology("block_matrix", name, blocked)
+
+
+def _color_digest(value) -> str:
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()[:16]
+
+
+def canonical_key(blocked_pairs: Iterable[Tuple[int, int]], node_count: int,
+                  fixed_nodes: Sequence[int] = (0,)) -> Tuple[Any, ...]:
+    """
+    计算拓扑在节点重编号下的不变量，同构的拓扑得到相同的key
+
+    对有向阻断图做颜色细化（Weisfeiler-Leman）：节点初始颜色相同（fixed_nodes 各自保留编号，
+    默认0号节点为benchmark入口，与其他节点不对称），每轮以「自身颜色 + 阻断的对端颜色 + 阻断本节点的对端颜色」
+    细化，直到颜色类不再增加；key 为最终节点颜色与每条阻断边两端颜色的多重集。
+    复杂度为多项式，对枚举生成的各类拓扑（分组切分、桥接、环、单向链路）能区分所有不同构的情形
+
+    参数:
+        blocked_pairs: 被阻断的有向节点对
+        node_count: 节点总数
+        fixed_nodes: 位置固定的节点
+    """
+    pairs = sorted(set(blocked_pairs))
+    out_peers = {i: [] for i in range(node_count)}
+    in_peers = {i: [] for i in range(node_count)}
+    for a, b in pairs:
+        out_peers[a].append(b)
+        in_peers[b].append(a)
+    colors = {i: _color_digest(("fixed", i) if i in fixed_nodes else "movable") for i in range(node_count)}
+    for _ in range(node_count):
+        refined = {i: _color_digest((colors[i], sorted(colors[j] for j in out_peers[i]),
+                                     sorted(colors[j] for j in in_peers[i])))
+                   for i in range(node_count)}
+        if len(set(refined.values())) == len(set(colors.values())):
+            colors = refined
+            break
+        colors = refined
+    return (tuple(sorted(colors.values())), tuple(sorted((colors[a], colors[b]) for a, b in pairs)))
+
+
+def _representatives(nodes: Sequence[int], size: int, fixed_nodes: Sequence[int]) -> List[List[int]]:
+    """
+    从 nodes 中选 size 个节点的各种选法中，每个同构类只取一个代表：非固定节点可互换，
+    所以只需区分选中了哪些固定节点，其余名额取编号最小的非固定节点
+    """
+    fixed = [n for n in nodes if n in fixed_nodes]
+    movable = [n for n in nodes if n not in fixed_nodes]
+    groups = []
+    for fixed_count in range(min(size, len(fixed)) + 1):
+        if size - fixed_count > len(movable):
+            continue
+        for chosen in itertools.combinations(fixed, fixed_count):
+            groups.append(sorted(list(chosen) + movable[:size - fixed_count]))
+    return groups
+
+
+def _candidates(node_count: int, kind: str, fixed_nodes: Sequence[int] = (0,)) -> List[Dict[str, Any]]:
+    """生成某一类型的候选拓扑：每个同构类至少一个代表（可能仍有少量重复，由 canonical_key 去除）"""
+    nodes = list(range(node_count))
+    candidates = []
+    if kind == "single_isolation":
+        candidates = [single_node_isolation(node_count, group[0]) for group in _representatives(nodes, 1, fixed_nodes)]
+    elif kind == "majority_minority":
+        for size in range(1, (node_count - 1) // 2 + 1):
+            candidates += [majority_minority(node_count, group) for group in _representatives(nodes, size, fixed_nodes)]
+        if node_count % 2 == 0:
+            # 偶数节点时额外枚举对半分区（两侧都不构成多数派）
+            candidates += [majority_minority(node_count, group)
+                           for group in _representatives(nodes, node_count // 2, fixed_nodes)]
+    elif kind == "bridge":
+        for (bridge,) in _representatives(nodes, 1, fixed_nodes):
+            rest = [n for n in nodes if n != bridge]
+            for size in range(1, len(rest) // 2 + 1):
+                for group1 in _representatives(rest, size, fixed_nodes):
+                    group2 = [n for n in rest if n not in group1]
+                    candidates.append(bridge_partition(node_count, group1, group2, bridge))
+    elif kind == "leader_isolation":
+        # 占位拓扑，施加时查询leader后展开，不参与同构去重
+        candidates = [_make_topology("leader_isolation", "leader_isolation", [], leader=None)]
+    elif kind == "ring":
+        # n个节点的环（0号节点位置固定）彼此同构，只生成一个
+        if node_count >= 4:
+            candidates.append(ring_partition(node_count))
+    elif kind == "one_way_link":
+        pair_nodes = sorted(set(n for group in _representatives(nodes, 2, fixed_nodes) for n in group))
+        candidates = [one_way_link(node_count, a, b) for a in pair_nodes for b in pair_nodes if a != b]
+    else:
+        raise ValueError(f"未知的分区拓扑类型: {kind}")
+    return candidates
+
+
+def enumerate_partition_topologies(node_count: int, kinds: Sequence[str] = None,
+                                   fixed_nodes: Sequence[int] = (0,),
+                                   extra_topologies: Sequence[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+    """
+    枚举所有有意义的分区拓扑，按节点重编号去除同构重复（跨类型同样去重，
+    如单节点隔离与规模为1的少数派只保留先出现的一个）
+
+    参数:
+        node_count: 节点总数
+        kinds: 需要枚举的拓扑类型，默认全部 TOPOLOGY_KINDS
+        fixed_nodes: 位置固定、不参与同构判断的节点
+        extra_topologies: 额外加入的拓扑（如自定义阻断矩阵），排在最前面
+
+    返回:
+        list: 互不同构的拓扑字典，每个包含 kind / name / blocked_pairs 及分组信息
+    """
+    kinds = list(kinds) if kinds else list(TOPOLOGY_KINDS)
+    seen = set()
+    topologies = []
+    candidates = list(extra_topologies)
+    for kind in kinds:
+        candidates += _candidates(node_count, kind, fixed_nodes)
+
+    skipped = 0
+    for topology in candidates:
+        if topology["kind"] == "leader_isolation" and topology.get("leader") is None:
+            topologies.append(topology)
+            continue
+        if not topology["blocked_pairs"]:
+            continue
+        key = canonical_key(topology["blocked_pairs"], node_count, fixed_nodes)
+        if key in seen:
+            skipped += 1
+            continue
+        seen.add(key)
+        topologies.append(topology)
+
+    logging.info(f"分区拓扑枚举完成：{node_count} 个节点，类型 {kinds}，"
+                 f"共 {len(topologies)} 种互不同构的拓扑（跳过 {skipped} 个同构重复）")
+    return topologies
+
+
+def resolve_leader_isolation(topology: Dict[str, Any], node_count: int) -> Dict[str, Any]:
+    """
+    展开 leader_isolation 占位拓扑：通过 cluster_topology 查询当前持有最多写入region/vnode leader的节点，
+    返回隔离该节点的拓扑；已展开或其他类型的拓扑原样返回
+
+    在集群启动、预热完成后、施加分区前调用
+    """
+    from cluster_topology import select_fault_targets  # 延迟导入：枚举拓扑本身不需要连接节点
+
+    if topology["kind"] != "leader_isolation" or topology.get("leader") is not None:
+        return topology
+    leader = select_fault_targets(1, strategy="leader")[0]
+    resolved = single_node_isolation(node_count, leader, kind="leader_isolation")
+    resolved["leader"] = leader
+    return resolved
@@ -0,0 +1,125 @@
+import json
+import logging
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, Sequence, Tuple
+from run_context import ctx
+
+# 合并/乱序相关的默认PromQL，可用config中的 COMPACTION_METRICS 覆盖或补充（{名称: PromQL}）
+DEFAULT_COMPACTION_METRICS = {
+    "IoTDB": {
+        "seq_file_count": 'sum by (instance) (file_count{name="seq"})',
+        "unseq_file_count": 'sum by (instance) (file_count{name="unseq"})',
+        "unseq_file_size_bytes": 'sum by (instance) (file_size{name="unseq"})',
+        "compaction_task_rate": 'sum by (instance) (rate(compaction_task_count_total[1m]))',
+        "compaction_data_rate_bytes": 'sum by (instance) (rate(compaction_data_size_total[1m]))',
+    },
+    "TDengine": {
+        "vnodes_num": 'sum by (instance) (taosd_dnodes_info_vnodes_num)',
+        "disk_engine_bytes": 'sum by (instance) (taosd_dnodes_info_disk_engine)',
+        "io_write_disk_rate_bytes": 'sum by (instance) (rate(taosd_dnodes_info_io_write_disk[1m]))',
+    },
+}
+
+
+def get_prometheus_url() -> str:
+    """Prometheus地址，默认为0号节点的9090端口，可用config中的 PROMETHEUS_URL 覆盖"""
+    return ctx.get("PROMETHEUS_URL", None) or f"http://{ctx.server_ip[0]}:9090"
+
+
+def get_compaction_metrics() -> Dict[str, str]:
+    """返回当前数据库类型需要采集的合并/乱序指标 {名称: PromQL}"""
+    metrics = dict(DEFAULT_COMPACTION_METRICS.get(ctx.DB_TYPE, {}))
+    metrics.update(ctx.get("COMPACTION_METRICS", None) or {})
+    return metrics
+
+
+def query_range(expr: str, start: float, end: float, step: int = 15) -> List[Dict[str, Any]]:
+    """
+    调用 Prometheus /api/v1/query_range
+
+    参数:
+        expr: PromQL表达式
+        start: 起始时间戳（秒）
+        end: 结束时间戳（秒）
+        step: 采样步长（秒）
+
+    返回:
+        list: Prometheus 返回的 result 列表，每项含 metric 与 values
+    """
+    params = urllib.parse.urlencode({"query": expr, "start": start, "end": end, "step": step})
+    with urllib.request.urlopen(f"{get_prometheus_url()}/api/v1/query_range?{params}", timeout=30) as response:
+        body = json.loads(response.read().decode("utf-8"))
+    if body.get("status") != "success":
+        raise RuntimeError(body.get("error", "Prometheus查询失败"))
+    return body["data"]["result"]
+
+
+def summarize_values(values: Sequence[Sequence[Any]]) -> Dict[str, float]:
+    """
+    汇总一条时间序列的采样值
+
+    返回:
+        dict: avg / max / first / last / delta（last - first），无有效采样时为空字典
+    """
+    points = []
+    for _, value in values:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            continue
+        if number == number:  # 跳过NaN
+            points.append(number)
+    if not points:
+        return {}
+    return {
+        "avg": round(sum(points) / len(points), 3),
+        "max": round(max(points), 3),
+        "first": round(points[0], 3),
+        "last": round(points[-1], 3),
+        "delta": round(points[-1] - points[0], 3),
+    }
+
+
+def collect_window_metrics(start: float, end: float, metrics: Dict[str, str] = None,
+                           step: int = 15) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    采集一个时间窗口内各指标的汇总值
+
+    参数:
+        start: 窗口起始时间戳
+        end: 窗口结束时间戳
+        metrics: {名称: PromQL}，默认为 get_compaction_metrics()
+        step: 采样步长（秒）
+
+    返回:
+        dict: {指标名称: {instance: 汇总值}}，查询失败的指标记录 error
+    """
+    if metrics is None:
+        metrics = get_compaction_metrics()
+    window = {}
+    for name, expr in metrics.items():
+        try:
+            series = query_range(expr, start, end, step)
+            window[name] = {s["metric"].get("instance", "all"): summarize_values(s["values"]) for s in series}
+        except Exception as e:
+            logging.warning(f"⚠️ 采集Prometheus指标 {name} 失败: {e}")
+            window[name] = {"error": str(e)}
+    return window
+
+
+def collect_phase_metrics(phase_bounds: Sequence[Tuple[str, float, float]],
+                          metrics: Dict[str, str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    按阶段采集指标
+
+    参数:
+        phase_bounds: [(阶段名, 起始时间戳, 结束时间戳), ...]，时间戳缺失的阶段跳过
+        metrics: {名称: PromQL}，默认为 get_compaction_metrics()
+
+    返回:
+        dict: {阶段名: {指标名称: {instance: 汇总值}}}
+    """
+    logging.info(f"【Prometheus】采集 {len(phase_bounds)} 个阶段的合并/乱序指标...")
+    return {phase: collect_window_metrics(start, end, metrics)
+            for phase, start, end in phase_bounds if start and end and end > start}
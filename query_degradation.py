@@ -0,0 +1,323 @@
+import json
+import time
+import logging
+from typing import Any, Dict
+import os
+from tools import (startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system,
+                   modify_db_switch, modify_benchmark_properties, restore_benchmark_properties,
+                   parse_result_matrix, parse_latency_matrix, BENCHMARK_OPERATIONS, build_operation_proportion)
+from cluster_topology import probe_cluster_topology, select_fault_targets, config_leader_excluded
+from fault_control import validate_fault, describe_fault_spec, apply_fault, remove_fault
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties
+from run_context import ctx, ContextThread, with_run_context
+
+
+# 三个查询阶段：基线、故障期间、故障移除后
+QUERY_PHASES = ("baseline", "fault", "recovery")
+
+
+def get_query_operations() -> Dict[str, int]:
+    """
+    返回查询阶段各操作的权重 {操作名: 权重}
+
+    QUERY_OPERATIONS 可以是操作名列表（等权重）或 {操作名: 权重}，默认为除INGESTION外的全部查询类型
+    """
+    operations = ctx.get("QUERY_OPERATIONS", None) or BENCHMARK_OPERATIONS[1:]
+    if not isinstance(operations, dict):
+        operations = {op: 1 for op in operations}
+    unknown = [op for op in operations if op not in BENCHMARK_OPERATIONS]
+    if unknown:
+        raise ValueError(f"未知的benchmark操作: {unknown}，可选值: {BENCHMARK_OPERATIONS}")
+    return dict(operations)
+
+
+def get_query_fault() -> Dict[str, Any]:
+    """
+    返回config中配置的查询降级故障（QUERY_DEGRADATION_FAULT），默认隔离目标节点
+
+    故障描述的格式见 fault_control：partition、network 或 node_faults 的故障类型
+    """
+    return validate_fault(dict(ctx.get("QUERY_DEGRADATION_FAULT", None) or {"kind": "partition"}))
+
+
+def summarize_query_phases(phase_results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    按操作类型对比各阶段的查询表现
+
+    参数:
+        phase_results: {阶段名: run_bat_and_parse 结果}
+
+    返回:
+        dict: {操作名: {阶段名: {throughput, fail_operation, avg_ms, p99_ms}, "p99_ratio": 故障/基线, "fail_ratio": 故障阶段失败率}}
+    """
+    per_phase = {}
+    for phase, result in phase_results.items():
+        if not result:
+            continue
+        throughput = parse_result_matrix(result["result_matrix"]) if result.get("result_matrix") else {}
+        latency = parse_latency_matrix(result["latency_matrix"]) if result.get("latency_matrix") else {}
+        per_phase[phase] = (throughput, latency)
+
+    summary = {}
+    for op in BENCHMARK_OPERATIONS:
+        row = {}
+        for phase, (throughput, latency) in per_phase.items():
+            if op not in throughput and op not in latency:
+                continue
+            counts = throughput.get(op, {})
+            row[phase] = {
+                "throughput": counts.get("throughput"),
+                "ok_operation": counts.get("okOperation"),
+                "fail_operation": counts.get("failOperation"),
+                "avg_ms": latency.get(op, {}).get("AVG"),
+                "p99_ms": latency.get(op, {}).get("P99"),
+            }
+        if not row:
+            continue
+        baseline_p99 = (row.get("baseline") or {}).get("p99_ms")
+        fault_p99 = (row.get("fault") or {}).get("p99_ms")
+        if baseline_p99 and fault_p99 is not None:
+            row["p99_ratio"] = round(fault_p99 / baseline_p99, 2)
+        fault_row = row.get("fault") or {}
+        total = (fault_row.get("ok_operation") or 0) + (fault_row.get("fail_operation") or 0)
+        if total:
+            row["fail_ratio"] = round(fault_row["fail_operation"] / total, 4)
+        summary[op] = row
+    return summary
+
+
+@with_run_context
+def query_degradation_scenario(bat_path: str = "test.bat",
+                               test_result_file_path: str = "test_result.txt",
+                               storing_path: str = "single_run_results") -> Dict[str, Any]:
+    """
+    运行查询降级场景
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        storing_path: 结果输出路径
+    """
+    current_time = int(time.time())
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始查询降级场景实验：{describe_fault_spec(get_query_fault())}，"
+                 f"查询操作 {list(get_query_operations())}")
+    logging.info(f"{'='*80}")
+
+    # 修改DB_SWITCH配置
+    logging.info("\n【配置数据库】修改benchmark配置中的DB_SWITCH...")
+    if not modify_db_switch():
+        logging.error("❌ 修改DB_SWITCH失败，实验终止")
+        return None
+
+    exp_result = query_degradation_scenario_single_run(
+        bat_path=bat_path,
+        test_result_file_path=test_result_file_path,
+        output_store_path=output_store_path
+    )
+
+    logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+    return exp_result
+
+
+def query_degradation_scenario_single_run(bat_path, test_result_file_path, output_store_path):
+    """
+    单次查询降级场景主函数：清理→启动→写入固定数据集→基线查询→故障期间查询→故障移除后查询→结果存储→停止系统
+
+    与其他场景在一次benchmark运行中同时读写不同，本场景先只写入一份固定数据集，
+    之后每个阶段单独运行一次只查询的benchmark，因此各阶段的Latency Matrix可以直接按操作类型对比
+
+    参数：
+        bat_path: str - 测试用bat文件的完整路径
+        test_result_file_path: str - 单次测试结果文件的完整路径
+        output_store_path: str - 最终测试结果集合的存储路径
+
+    返回：
+        dict - 测试结果集合（含各阶段结果及按操作类型的降级汇总）
+    """
+    fault = get_query_fault()
+    fault_desc = describe_fault_spec(fault)
+    operations = get_query_operations()
+    strategy = ctx.get("FAULT_TARGET_STRATEGY", "random")
+    target_count = ctx.get("QUERY_DEGRADATION_NODES", 1)
+    settle_s = ctx.get("QUERY_FAULT_SETTLE_S", 60)
+    target_nodes = []
+
+    # 写入阶段只写入；查询阶段不删除、不重建schema，只按权重执行查询
+    preload_overrides = {"OPERATION_PROPORTION": build_operation_proportion({"INGESTION": 1}),
+                         "IS_DELETE_DATA": "true", "CREATE_SCHEMA": "true"}
+    if ctx.get("QUERY_PRELOAD_LOOP", None):
+        preload_overrides["LOOP"] = ctx.QUERY_PRELOAD_LOOP
+    query_overrides = {"OPERATION_PROPORTION": build_operation_proportion(operations),
+                       "IS_DELETE_DATA": "false", "CREATE_SCHEMA": "false",
+                       "LOOP": ctx.get("QUERY_PHASE_LOOP", 1000)}
+
+    # 初始化测试结果集合
+    all_test_results = {
+        "scenario_name": "query_degradation_scenario_single_run",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "fault": fault,
+        "query_operations": operations,
+        "benchmark_overrides": {"preload": preload_overrides, "query": query_overrides},
+        "target_strategy": strategy,
+        "target_nodes": target_nodes,
+        "test_results": [],
+        "end_time": "",
+        "status": "running"
+    }
+    fault_applied = False
+
+    try:
+        # -------------------------- 1. 清理所有节点 --------------------------
+        logging.info("【步骤1/6】清理所有节点...")
+        clean_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            clean_threads.append(t)
+
+        time.sleep(10)
+        logging.info("【步骤1/6】所有节点清理完成")
+
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # 同时移除所有节点上遗留的分区、网络损伤和节点故障（预防性清理）
+        logging.info("【步骤1/6】预防性移除遗留故障...")
+        remove_fault(None)
+
+        # -------------------------- 2. 启动所有ConfigNode --------------------------
+        logging.info("\n【步骤2/6】启动所有ConfigNode...")
+        config_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
+            t.start()
+            config_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤2/6】所有ConfigNode启动完成")
+
+        # -------------------------- 3. 启动所有DataNode --------------------------
+        logging.info("\n【步骤3/6】启动所有DataNode...")
+        data_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
+            t.start()
+            data_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤3/6】所有DataNode启动完成")
+
+        # -------------------------- 4. 启动节点监控系统 --------------------------
+        logging.info("\n【步骤4/6】启动节点监控系统（Prometheus + Grafana）...")
+        start_monitoring_system()
+        logging.info("【步骤4/6】节点监控系统启动完成")
+
+        # -------------------------- 5. 写入固定数据集（已从快照恢复时跳过） --------------------------
+        if all_test_results["dataset_snapshot"]:
+            logging.info(f"\n【步骤5/6】已从快照 {all_test_results['dataset_snapshot']['name']} 恢复数据集，跳过写入")
+        else:
+            logging.info("\n【步骤5/6】写入固定数据集（只写入）...")
+            if not modify_benchmark_properties(preload_overrides):
+                raise Exception("修改配置文件失败")
+            preload_test = run_bat_and_parse(bat_path=bat_path, result_file_path=test_result_file_path)
+            if not preload_test:
+                raise Exception("数据集写入失败，未解析到benchmark结果")
+            preload_test["test_phase"] = "preload"
+            preload_test["phase_description"] = "写入固定数据集"
+            all_test_results["test_results"].append(preload_test)
+            logging.info("【步骤5/6】固定数据集写入完成")
+
+        # -------------------------- 6. 各阶段只查询 --------------------------
+        if not modify_benchmark_properties(query_overrides):
+            raise Exception("修改配置文件失败")
+
+        topology = probe_cluster_topology() if strategy != "random" else None
+        target_nodes.extend(select_fault_targets(target_count, strategy, topology=topology))
+        all_test_results["cluster_topology"] = topology
+        all_test_results["leader_excluded"] = config_leader_excluded(strategy, topology)
+
+        phase_results = {}
+        for step, phase in enumerate(QUERY_PHASES, 1):
+            if phase == "fault":
+                logging.info(f"对节点 {target_nodes} 施加故障：{fault_desc}，等待 {settle_s} 秒生效...")
+                all_test_results["fault_scope"] = apply_fault(fault, target_nodes)
+                fault_applied = True
+                time.sleep(settle_s)
+            elif phase == "recovery":
+                logging.info(f"移除故障，等待 {settle_s} 秒恢复...")
+                remove_fault(fault, target_nodes)
+                fault_applied = False
+                time.sleep(settle_s)
+
+            logging.info(f"\n【步骤6/6】查询阶段 {step}/{len(QUERY_PHASES)}：{phase}")
+            phase_test = run_bat_and_parse(bat_path=bat_path, result_file_path=test_result_file_path)
+            phase_results[phase] = phase_test
+            if phase_test:
+                phase_test["test_phase"] = phase
+                phase_test["phase_description"] = f"只查询测试（{phase}，故障: {fault_desc}，影响节点: {target_nodes}）"
+                phase_test["affected_nodes"] = target_nodes if phase == "fault" else []
+                all_test_results["test_results"].append(phase_test)
+            else:
+                logging.warning(f"⚠️ 查询阶段 {phase} 未解析到有效结果")
+
+        all_test_results["query_degradation"] = summarize_query_phases(phase_results)
+        for op, row in all_test_results["query_degradation"].items():
+            logging.info(f"【查询降级】{op}: 基线P99 {(row.get('baseline') or {}).get('p99_ms')} ms，"
+                         f"故障P99 {(row.get('fault') or {}).get('p99_ms')} ms（{row.get('p99_ratio')}倍），"
+                         f"故障期间失败率 {row.get('fail_ratio')}")
+        logging.info("【步骤6/6】各阶段查询测试完成")
+
+        # -------------------------- 7. 更新场景状态，存储结果 --------------------------
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "finished"
+        logging.info(f"\n{'='*60}")
+        logging.info(f"场景执行完成！开始将结果写入存储文件：{output_store_path}")
+
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.info(f"✅ 结果已成功存储到 {output_store_path}")
+
+    except Exception as e:
+        error_msg = f"场景执行异常：{str(e)}"
+        logging.error(f"\n❌ {error_msg}")
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "failed"
+        all_test_results["error_msg"] = error_msg
+
+        # 存储异常状态下的结果
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
+
+    finally:
+        # 最终清理：移除故障、恢复benchmark配置并停止所有节点
+        if fault_applied:
+            try:
+                logging.info("\n【最终步骤】移除故障...")
+                remove_fault(fault, target_nodes)
+            except Exception as e:
+                logging.warning(f"⚠️ 最终移除故障时出错: {e}")
+        restore_benchmark_properties()
+        restore_dataset_properties()
+
+        logging.info("【最终步骤】停止所有节点...")
+        stop_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            stop_threads.append(t)
+        time.sleep(10)
+        logging.info("【最终步骤】所有节点停止完成")
+
+    return all_test_results
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    query_degradation_scenario()
@@ -0,0 +1,159 @@
+import glob
+import json
+import os
+from typing import Any, Dict, List, Optional
+from tools import parse_result_matrix, parse_latency_matrix
+
+# 报告与对比：只读取结果文件，不连接节点、不写结果目录
+# 报告中每个操作展示的指标：(名称, Result/Latency Matrix 中的字段)
+REPORT_FIELDS = (("throughput", "throughput"), ("fail_ops", "failOperation"), ("avg_ms", "AVG"), ("p99_ms", "P99"))
+# 对比时判断变好/变差的方向：吞吐越大越好，其余越小越好
+_HIGHER_IS_BETTER = {"throughput"}
+
+
+def find_result_files(paths: List[str]) -> List[str]:
+    """
+    展开命令行给出的路径：文件原样返回，目录下递归查找 single_run.json 与实验活动状态文件 campaign_*.json
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "**", "single_run.json"), recursive=True))
+            files += sorted(glob.glob(os.path.join(path, "**", "campaign_*.json"), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+
+def load_result(path: str) -> Dict[str, Any]:
+    """读取结果文件（单次运行结果或实验活动状态）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def summarize_test(test: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    提取一次benchmark结果中每个操作的吞吐、失败次数、平均与P99延迟
+
+    返回:
+        dict: {操作名: {throughput, fail_ops, avg_ms, p99_ms}}，缺失的字段为 None
+    """
+    throughput = parse_result_matrix(test["result_matrix"]) if test.get("result_matrix") else {}
+    latency = parse_latency_matrix(test["latency_matrix"]) if test.get("latency_matrix") else {}
+    summary = {}
+    for op in list(throughput) + [op for op in latency if op not in throughput]:
+        source = {**latency.get(op, {}), **throughput.get(op, {})}
+        summary[op] = {name: source.get(field) for name, field in REPORT_FIELDS}
+    return summary
+
+
+def summarize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    单次运行结果的摘要：场景、状态、起止时间与各测试阶段的操作指标
+
+    阶段名取 test_phase，没有时按顺序编号
+    """
+    phases = {}
+    for idx, test in enumerate(t for t in (result.get("test_results") or []) if t):
+        phases[test.get("test_phase") or f"test_{idx}"] = summarize_test(test)
+    return {
+        "scenario": result.get("scenario_name"),
+        "status": result.get("status"),
+        "start_time": result.get("start_time"),
+        "end_time": result.get("end_time"),
+        "phases": phases,
+    }
+
+
+def _format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def format_result_report(path: str, result: Dict[str, Any]) -> List[str]:
+    """单次运行结果的文本报告"""
+    summary = summarize_result(result)
+    lines = [f"== {path}",
+             f"   场景 {summary['scenario']} | 状态 {summary['status']} | {summary['start_time']} ~ {summary['end_time']}"]
+    if result.get("error_msg"):
+        lines.append(f"   错误: {result['error_msg']}")
+    for phase, ops in summary["phases"].items():
+        lines.append(f"   [{phase}]")
+        lines.append("   " + f"{'operation':<24}" + "".join(f"{name:>14}" for name, _ in REPORT_FIELDS))
+        for op, values in ops.items():
+            lines.append("   " + f"{op:<24}" + "".join(f"{_format_value(values[name]):>14}" for name, _ in REPORT_FIELDS))
+    return lines
+
+
+def format_campaign_report(path: str, state: Dict[str, Any]) -> List[str]:
+    """实验活动状态文件的文本报告：每个单元的次数、是否收敛与各指标的置信区间"""
+    settings = state.get("settings", {})
+    lines = [f"== {path}",
+             f"   实验活动 {state.get('start_time')} ~ {state.get('end_time') or '进行中'} | "
+             f"置信度 {settings.get('confidence')} | 目标相对半宽 {settings.get('target_rel_half_width')}"]
+    for name, cell in state.get("cells", {}).items():
+        lines.append(f"   {name} ({cell.get('scenario')}): {len(cell.get('runs', []))} 次，"
+                     f"{'已收敛' if cell.get('converged') else '未收敛'}")
+        for metric, stats in (cell.get("stats") or {}).items():
+            lines.append(f"      {metric:<28} {stats['mean']} ± {stats['half_width']} (n={stats['n']})")
+    return lines
+
+
+def build_report(paths: List[str]) -> List[str]:
+    """为给定路径下的所有结果文件生成报告"""
+    lines = []
+    for path in find_result_files(paths):
+        try:
+            data = load_result(path)
+        except (OSError, ValueError) as e:
+            lines.append(f"== {path}\n   无法读取: {e}")
+            continue
+        lines += format_campaign_report(path, data) if "cells" in data else format_result_report(path, data)
+    return lines or ["未找到结果文件"]
+
+
+def compare_results(base: Dict[str, Any], candidate: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    按阶段、操作对比两次运行的指标
+
+    返回:
+        dict: {阶段: {操作: {指标: {"base", "candidate", "change_pct", "regressed"}}}}，只包含两边都有的阶段和操作
+    """
+    base_phases = summarize_result(base)["phases"]
+    candidate_phases = summarize_result(candidate)["phases"]
+    comparison = {}
+    for phase in base_phases:
+        if phase not in candidate_phases:
+            continue
+        for op, base_values in base_phases[phase].items():
+            candidate_values = candidate_phases[phase].get(op)
+            if candidate_values is None:
+                continue
+            for name, _ in REPORT_FIELDS:
+                b, c = base_values[name], candidate_values[name]
+                change = round((c - b) / b * 100, 1) if b not in (None, 0) and c is not None else None
+                regressed = None
+                if change is not None:
+                    regressed = change < 0 if name in _HIGHER_IS_BETTER else change > 0
+                comparison.setdefault(phase, {}).setdefault(op, {})[name] = {
+                    "base": b, "candidate": c, "change_pct": change, "regressed": regressed}
+    return comparison
+
+
+def format_comparison(base_path: str, candidate_path: str, comparison: Dict[str, Any]) -> List[str]:
+    """对比结果的文本报告，变差超过 5% 的指标标记 !"""
+    lines = [f"== 基线 {base_path}", f"== 对比 {candidate_path}"]
+    if not comparison:
+        lines.append("   两次运行没有可对比的阶段或操作")
+    for phase, ops in comparison.items():
+        lines.append(f"   [{phase}]")
+        for op, metrics in ops.items():
+            cells = []
+            for name, values in metrics.items():
+                change = values["change_pct"]
+                flag = "!" if values["regressed"] and abs(change) > 5 else " "
+                cells.append(f"{name} {_format_value(values['base'])}→{_format_value(values['candidate'])}"
+                             f" ({'-' if change is None else f'{change:+.1f}%'}){flag}")
+            lines.append(f"   {op:<24} " + "  ".join(cells))
+    return lines
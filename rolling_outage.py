@@ -0,0 +1,440 @@
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import os
+from tools import startConfigNode, startDataNode, stopNode, run_bat_and_parse, start_monitoring_system, modify_db_switch
+from cluster_topology import probe_cluster_topology, probe_node_status, is_component_healthy, select_fault_targets
+from node_faults import STOP_MODES, stop_component, start_component
+from dataset_snapshot import restore_dataset_snapshot, restore_dataset_properties, wait_warm_up
+from run_context import ctx, ContextThread, with_run_context
+
+
+# 滚动故障的目标组件：confignode_leader 在每一波开始时重新查询当前的 ConfigNode/mnode leader
+ROLLING_COMPONENTS = ("datanode", "confignode", "confignode_leader")
+
+
+def replication_safe_limit(replication_factor: int) -> int:
+    """
+    多数派共识下可同时停止的副本数上限：(副本数 - 1) // 2，至少为1
+
+    参数:
+        replication_factor: 副本数
+    """
+    return max(1, (replication_factor - 1) // 2)
+
+
+def plan_rolling_waves(targets: Sequence[Optional[int]], interval_s: float, down_s: float,
+                       max_concurrent: int = 1, start_offset_s: float = 0) -> List[Dict[str, Any]]:
+    """
+    生成滚动故障的计划时间表：第 i 波在 start_offset_s + i * interval_s 停止目标，down_s 秒后重启；
+    interval_s < down_s 时各波相互重叠，计划中任一时刻处于停止状态的目标不超过 max_concurrent 个，
+    超出时推迟到最早结束的一波重启之后
+
+    计划只按重启时刻估算，节点重启后到恢复之前仍不可用，运行时由 RollingOutageGate 按实际恢复时刻限制并发
+
+    参数:
+        targets: 每一波的目标节点索引，None 表示运行时再确定（如 ConfigNode leader）
+        interval_s: 相邻两波的停止间隔（秒）
+        down_s: 每个目标的停止时长（秒）
+        max_concurrent: 同时处于停止状态的目标数上限
+        start_offset_s: 第一波相对操作开始的偏移（秒）
+
+    返回:
+        list: [{"wave": 序号, "node": 节点索引, "stop_at": 秒, "restart_at": 秒}, ...]
+    """
+    waves = []
+    for i, node in enumerate(targets):
+        stop_at = start_offset_s + i * interval_s
+        while True:
+            active = [w for w in waves if w["stop_at"] <= stop_at < w["restart_at"]]
+            # 同一节点不能在上一次停止尚未恢复时再次停止
+            conflict = [w for w in active if node is not None and w["node"] == node]
+            if len(active) < max_concurrent and not conflict:
+                break
+            stop_at = min(w["restart_at"] for w in (conflict or active))
+        waves.append({"wave": i + 1, "node": node, "stop_at": stop_at, "restart_at": stop_at + down_s})
+    return waves
+
+
+def get_rolling_outage_plan() -> Dict[str, Any]:
+    """
+    按config生成滚动故障计划
+
+    ROLLING_OUTAGE_COMPONENT: datanode / confignode / confignode_leader
+    ROLLING_OUTAGE_STOP_MODE: graceful（停止脚本）/ kill（SIGKILL）
+    ROLLING_OUTAGE_TARGETS: 目标节点顺序，None 表示按 FAULT_TARGET_STRATEGY 排列的全部非0号节点
+    ROLLING_OUTAGE_WAVES: confignode_leader 模式下的波数，默认 ctx.node_num
+    ROLLING_OUTAGE_INTERVAL_SECONDS / ROLLING_OUTAGE_DOWN_SECONDS: 波间隔 / 每波停止时长
+    ROLLING_OUTAGE_MAX_CONCURRENT: 允许同时停止的目标数，不超过 REPLICATION_FACTOR 决定的安全上限
+
+    返回:
+        dict: 计划参数及 waves 时间表（非 confignode_leader 模式的目标在预热结束后才确定）
+    """
+    component = ctx.get("ROLLING_OUTAGE_COMPONENT", "datanode")
+    stop_mode = ctx.get("ROLLING_OUTAGE_STOP_MODE", "graceful")
+    if component not in ROLLING_COMPONENTS:
+        raise ValueError(f"未知的滚动故障组件: {component}")
+    if stop_mode not in STOP_MODES:
+        raise ValueError(f"未知的停止方式: {stop_mode}")
+
+    replication_factor = ctx.get("REPLICATION_FACTOR", 3)
+    safe_limit = replication_safe_limit(replication_factor)
+    max_concurrent = ctx.get("ROLLING_OUTAGE_MAX_CONCURRENT", 1)
+    if max_concurrent > safe_limit:
+        logging.warning(f"⚠️ ROLLING_OUTAGE_MAX_CONCURRENT={max_concurrent} 超过副本数 {replication_factor} "
+                        f"下的安全上限 {safe_limit}，已按 {safe_limit} 执行")
+        max_concurrent = safe_limit
+
+    return {
+        "component": component,
+        "stop_mode": stop_mode,
+        "targets": ctx.get("ROLLING_OUTAGE_TARGETS", None),
+        "waves_count": ctx.get("ROLLING_OUTAGE_WAVES", None) or ctx.node_num,
+        "start_delay_s": ctx.get("ROLLING_OUTAGE_START_DELAY_SECONDS", 10 * 60),
+        "interval_s": ctx.get("ROLLING_OUTAGE_INTERVAL_SECONDS", 5 * 60),
+        "down_s": ctx.get("ROLLING_OUTAGE_DOWN_SECONDS", 3 * 60),
+        "max_concurrent": max_concurrent,
+        "replication_factor": replication_factor,
+        "recovery_timeout_s": ctx.get("ROLLING_OUTAGE_RECOVERY_TIMEOUT_SECONDS", 10 * 60),
+    }
+
+
+def resolve_rolling_targets(plan: Dict[str, Any]) -> List[Optional[int]]:
+    """确定每一波的目标节点，confignode_leader 模式返回占位的 None"""
+    if plan["component"] == "confignode_leader":
+        return [None] * plan["waves_count"]
+    if plan["targets"]:
+        return list(plan["targets"])
+    return select_fault_targets(ctx.node_num - 1)
+
+
+def wait_component_recovered(node_idx: int, component: str, timeout_s: float, poll_s: float = 10,
+                             cancelled: Optional[threading.Event] = None) -> Optional[float]:
+    """
+    轮询集群状态直到组件恢复运行
+
+    参数:
+        cancelled: 设置后立即停止等待（场景提前结束）
+
+    返回:
+        float: 恢复时刻的时间戳，超时或被取消返回None
+    """
+    cancelled = cancelled or threading.Event()
+    deadline = time.time() + timeout_s
+    while time.time() < deadline and not cancelled.is_set():
+        if is_component_healthy(probe_node_status(), node_idx, component):
+            return time.time()
+        cancelled.wait(poll_s)
+    return None
+
+
+class RollingOutageGate:
+    """
+    滚动故障的运行时并发限制：目标从停止起直到恢复（或恢复超时）都计为停止状态，
+    同时处于停止状态的目标不超过 max_concurrent 个，同一节点恢复前不会再次停止；各波按序号依次停止
+
+    场景提前结束（异常）时调用 cancel，尚未执行的停止与重启都不再执行，等待中的波立即返回
+    """
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._down: Dict[int, Optional[int]] = {}  # {波序号: 节点索引}
+        self._next_wave = 1
+
+    def acquire(self, wave: Dict[str, Any]) -> bool:
+        """
+        等待轮到该波且停止状态的目标数低于上限，占用一个名额
+
+        返回:
+            bool: 是否占用了名额，已取消时返回False
+        """
+        node = wave["node"]
+        with self._condition:
+            self._condition.wait_for(lambda: self.cancelled.is_set() or (
+                self._next_wave == wave["wave"] and len(self._down) < self.max_concurrent
+                and (node is None or node not in self._down.values())))
+            if self.cancelled.is_set():
+                return False
+            self._down[wave["wave"]] = node
+            self._next_wave += 1
+            self._condition.notify_all()
+            return True
+
+    def cancel(self):
+        with self._condition:
+            self.cancelled.set()
+            self._condition.notify_all()
+
+    def release(self, wave: Dict[str, Any]):
+        """目标已恢复（或恢复超时、该波被跳过），释放名额"""
+        with self._condition:
+            self._down.pop(wave["wave"], None)
+            self._condition.notify_all()
+
+
+def run_rolling_wave(wave: Dict[str, Any], plan: Dict[str, Any], operation_start: float, gate: RollingOutageGate):
+    """
+    执行一波故障：到点后等待并发名额→停止→停止 down_s 秒→重启→等待恢复，结果写回 wave 字典
+
+    前面的波尚未恢复时该波推迟停止，重启时刻随之顺延，保证停止时长仍为 down_s
+
+    参数:
+        wave: plan_rolling_waves 生成的单波计划
+        plan: get_rolling_outage_plan 的返回值
+        operation_start: 时间表的零点（时间戳）
+        gate: 各波共用的 RollingOutageGate
+    """
+    gate.cancelled.wait(max(0, operation_start + wave["stop_at"] - time.time()))
+    if not gate.acquire(wave):
+        wave["status"] = "cancelled"
+        return
+    try:
+        _run_acquired_wave(wave, plan, operation_start, gate.cancelled)
+    finally:
+        gate.release(wave)
+
+
+def _run_acquired_wave(wave: Dict[str, Any], plan: Dict[str, Any], operation_start: float,
+                       cancelled: threading.Event):
+    delay = round(time.time() - (operation_start + wave["stop_at"]), 1)
+    if delay >= 1:
+        logging.info(f"【滚动故障 第 {wave['wave']} 波】等待前面的目标恢复，推迟 {delay} 秒停止")
+        wave["delayed_seconds"] = delay
+
+    component = plan["component"]
+    if component == "confignode_leader":
+        topology = probe_cluster_topology()
+        wave["node"] = topology.get("config_leader") if topology else None
+        component = "confignode"
+        if wave["node"] is None:
+            logging.error(f"第 {wave['wave']} 波：未能确定 ConfigNode/mnode leader，跳过该波")
+            wave["status"] = "skipped"
+            return
+    wave["component"] = component
+    node_idx = wave["node"]
+    if cancelled.is_set():
+        wave["status"] = "cancelled"
+        return
+
+    logging.info(f"【滚动故障 第 {wave['wave']} 波】{plan['stop_mode']} 停止节点 {node_idx} 的 {component}")
+    wave["stopped_at"] = time.time()
+    stop_component(node_idx, component, plan["stop_mode"])
+
+    if cancelled.wait(max(0, wave["stopped_at"] + plan["down_s"] - time.time())):
+        # 场景已结束，节点由场景的最终步骤统一停止，不再重启
+        wave["status"] = "cancelled"
+        return
+    logging.info(f"【滚动故障 第 {wave['wave']} 波】重启节点 {node_idx} 的 {component}")
+    wave["restarted_at"] = time.time()
+    start_component(node_idx, component)
+
+    wave["recovered_at"] = wait_component_recovered(node_idx, component, plan["recovery_timeout_s"],
+                                                    cancelled=cancelled)
+    if wave["recovered_at"] is None and cancelled.is_set():
+        wave["status"] = "cancelled"
+        return
+    if wave["recovered_at"] is None:
+        logging.warning(f"⚠️ 第 {wave['wave']} 波：节点 {node_idx} 的 {component} "
+                        f"在 {plan['recovery_timeout_s']} 秒内未恢复")
+        wave["status"] = "not_recovered"
+        return
+    wave["recovery_seconds"] = round(wave["recovered_at"] - wave["restarted_at"], 1)
+    wave["downtime_seconds"] = round(wave["recovered_at"] - wave["stopped_at"], 1)
+    wave["status"] = "recovered"
+    logging.info(f"【滚动故障 第 {wave['wave']} 波】节点 {node_idx} 的 {component} 已恢复，"
+                 f"重启后 {wave['recovery_seconds']} 秒恢复，累计不可用 {wave['downtime_seconds']} 秒")
+
+
+@with_run_context
+def rolling_outage_scenario(bat_path: str = "test.bat",
+                            test_result_file_path: str = "test_result.txt",
+                            storing_path: str = "single_run_results") -> Dict[str, Any]:
+    """
+    运行滚动/级联节点故障场景
+
+    参数:
+        bat_path: 测试脚本路径
+        test_result_file_path: 单次测试结果文件路径
+        storing_path: 结果输出路径
+    """
+    current_time = int(time.time())
+    output_store_path = f"{storing_path}\\result_{ctx.abnormal_scenario}_{current_time}\\single_run.json"
+
+    logging.info(f"\n{'='*80}")
+    logging.info(f"开始滚动节点故障场景实验")
+    logging.info(f"{'='*80}")
+
+    # 修改DB_SWITCH配置
+    logging.info("\n【配置数据库】修改benchmark配置中的DB_SWITCH...")
+    if not modify_db_switch():
+        logging.error("❌ 修改DB_SWITCH失败，实验终止")
+        return None
+
+    exp_result = rolling_outage_scenario_single_run(
+        bat_path=bat_path,
+        test_result_file_path=test_result_file_path,
+        output_store_path=output_store_path
+    )
+
+    logging.info(f"\n实验完成！结果已保存到 {output_store_path}")
+    return exp_result
+
+
+def rolling_outage_scenario_single_run(bat_path, test_result_file_path, output_store_path):
+    """
+    单次滚动故障场景主函数：清理→启动→等待20分钟→异常测试(期间按时间表逐波停止/重启节点)→结果存储→停止系统
+
+    参数：
+        bat_path: str - 测试用bat文件的完整路径
+        test_result_file_path: str - 单次测试结果文件的完整路径
+        output_store_path: str - 最终测试结果集合的存储路径
+
+    返回：
+        dict - 异常测试的结果集合（含状态信息及每一波的恢复情况）
+    """
+    plan = get_rolling_outage_plan()
+
+    # 初始化测试结果集合
+    all_test_results = {
+        "scenario_name": "rolling_outage_scenario_single_run",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "node_count": ctx.node_num,
+        "server_ips": ctx.server_ip,
+        "rolling_plan": plan,
+        "waves": [],
+        "test_results": [],
+        "end_time": "",
+        "status": "running"
+    }
+
+    gate = None
+    wave_threads = []
+    try:
+        # -------------------------- 1. 清理所有节点 --------------------------
+        logging.info("【步骤1/5】清理所有节点...")
+        clean_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            clean_threads.append(t)
+
+        time.sleep(10)
+        logging.info("【步骤1/5】所有节点清理完成")
+
+        # 使用数据集快照时，在启动节点前用快照替换各节点的数据目录
+        all_test_results["dataset_snapshot"] = restore_dataset_snapshot()
+
+        # -------------------------- 2. 启动所有ConfigNode --------------------------
+        logging.info("\n【步骤2/5】启动所有ConfigNode...")
+        config_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startConfigNode, args=(idx,))
+            t.start()
+            config_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤2/5】所有ConfigNode启动完成")
+
+        # -------------------------- 3. 启动所有DataNode --------------------------
+        logging.info("\n【步骤3/5】启动所有DataNode...")
+        data_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=startDataNode, args=(idx,))
+            t.start()
+            data_threads.append(t)
+        time.sleep(60)
+        logging.info("【步骤3/5】所有DataNode启动完成")
+
+        # -------------------------- 4. 启动节点监控系统 --------------------------
+        logging.info("\n【步骤4/5】启动节点监控系统（Prometheus + Grafana）...")
+        start_monitoring_system()
+        logging.info("【步骤4/5】节点监控系统启动完成")
+
+        # -------------------------- 5. 异常测试：等待20分钟后开始，期间逐波停止/重启节点 --------------------------
+        logging.info("\n【步骤5/5】预热等待后开始异常测试（期间按时间表逐波停止和重启节点）...")
+        wait_warm_up()  # 默认等待20分钟，使用数据集快照时缩短为 DATASET_WARMUP_S
+
+        # 集群运行后才能按拓扑确定目标，随后生成时间表
+        waves = plan_rolling_waves(resolve_rolling_targets(plan), plan["interval_s"], plan["down_s"],
+                                   plan["max_concurrent"], plan["start_delay_s"])
+        all_test_results["waves"] = waves
+        for wave in waves:
+            logging.info(f"  第 {wave['wave']} 波: 节点 {wave['node'] if wave['node'] is not None else 'leader'} "
+                         f"在 +{wave['stop_at']}s 停止，+{wave['restart_at']}s 重启")
+
+        # 每一波一个线程，按共同的时间零点调度，单波的停止/恢复耗时不会推迟后续波次
+        operation_start = time.time()
+        gate = RollingOutageGate(plan["max_concurrent"])
+        for wave in waves:
+            t = ContextThread(target=run_rolling_wave, args=(wave, plan, operation_start, gate))
+            t.start()
+            wave_threads.append(t)
+
+        # 同时开始异常测试
+        logging.info("开始异常测试...")
+        abnormal_test = run_bat_and_parse(
+            bat_path=bat_path,
+            result_file_path=test_result_file_path
+        )
+        abnormal_test["test_phase"] = "abnormal"
+        abnormal_test["phase_description"] = (f"滚动故障测试（异常状态 - {plan['stop_mode']} "
+                                              f"{plan['component']}，共 {len(waves)} 波）")
+        abnormal_test["waves"] = waves
+        all_test_results["test_results"].append(abnormal_test)
+
+        # 等待所有波次完成
+        for t in wave_threads:
+            t.join()
+        logging.info("【步骤5/5】异常测试和滚动故障操作均完成")
+
+        # -------------------------- 6. 更新场景状态，存储结果 --------------------------
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "finished"
+        logging.info(f"\n{'='*60}")
+        logging.info(f"场景执行完成！开始将结果写入存储文件：{output_store_path}")
+
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.info(f"✅ 结果已成功存储到 {output_store_path}")
+
+    except Exception as e:
+        error_msg = f"场景执行异常：{str(e)}"
+        logging.error(f"\n❌ {error_msg}")
+        all_test_results["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        all_test_results["status"] = "failed"
+        all_test_results["error_msg"] = error_msg
+
+        # 存储异常状态下的结果
+        os.makedirs(os.path.dirname(output_store_path), exist_ok=True)
+        with open(output_store_path, 'w', encoding='utf-8') as f:
+            json.dump(all_test_results, f, ensure_ascii=False, indent=2)
+        logging.warning(f"⚠️  已将异常状态下的结果存储到 {output_store_path}")
+
+    finally:
+        # 异常结束时取消尚未执行的波次，并在停止所有节点前等待各波线程退出，避免之后再重启节点
+        if gate is not None:
+            gate.cancel()
+        for t in wave_threads:
+            t.join()
+        restore_dataset_properties()
+
+        logging.info("【最终步骤】停止所有节点...")
+        stop_threads = []
+        for idx in range(ctx.node_num):
+            t = ContextThread(target=stopNode, args=(idx,))
+            t.start()
+            stop_threads.append(t)
+        time.sleep(10)
+        logging.info("【最终步骤】所有节点停止完成")
+
+    return all_test_results
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging()
+    rolling_outage_scenario()
@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import json
+import logging
+import random
+import threading
+import types
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+import config
+
+# 运行上下文：一次运行使用的全部配置项（config.py 加覆盖项）及该次运行的可变状态（运行清单、随机数发生器）
+# 各模块通过 ctx 读取当前上下文，不再在导入时绑定 config 中的值，
+# 因此同一进程内可以先后或并行运行不同参数、不同集群、不同数据库类型的测试
+DB_TYPES = ("IoTDB", "TDengine")
+_REQUIRED_KEYS = ("node_num", "server_ip", "abnormal_scenario", "DB_TYPE", "OUTPUT_STORE_PATH",
+                  "INPUT_BAT_PATH", "INPUT_TEST_RESULT_PATH", "BENCHMARK_CONFIG_PATH")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("run_context", default=None)
+_default_lock = threading.Lock()
+_default: Optional["RunContext"] = None
+
+
+def _config_values() -> Dict[str, Any]:
+    """返回config模块中所有可JSON序列化的配置项"""
+    values = {}
+    for key, value in vars(config).items():
+        if key.startswith("_") or isinstance(value, (types.ModuleType, types.FunctionType, type)):
+            continue
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        values[key] = value
+    return values
+
+
+def _merge_overrides(values: Dict[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并覆盖项；覆盖了 server_ip 但没有覆盖 node_num 时，node_num 随 server_ip 的长度变化"""
+    merged = dict(values)
+    overrides = dict(overrides or {})
+    if "server_ip" in overrides and "node_num" not in overrides:
+        overrides["node_num"] = len(overrides["server_ip"])
+    merged.update(overrides)
+    return merged
+
+
+class RunContext:
+    """
+    一次运行的上下文
+
+    配置项通过属性（ctx.node_num）或 get（ctx.get("NETWORK_IMPAIRMENT", None)）读取；
+    state 保存该次运行的可变状态，random 为该次运行专用的随机数发生器（并行运行互不影响种子）
+    """
+
+    def __init__(self, values: Dict[str, Any], name: str = None):
+        self._values = dict(values)
+        if "node_num" not in self._values and "server_ip" in self._values:
+            self._values["node_num"] = len(self._values["server_ip"])
+        self.name = name
+        self.state: Dict[str, Any] = {}
+        self.random = random.Random()
+        self.validate()
+
+    @classmethod
+    def from_config(cls, overrides: Dict[str, Any] = None, name: str = None) -> "RunContext":
+        """用 config.py 中的配置项加上覆盖项创建上下文（node_num 的处理同 derive）"""
+        return cls(_merge_overrides(_config_values(), overrides), name)
+
+    def derive(self, overrides: Dict[str, Any] = None, name: str = None,
+               share_state: bool = True) -> "RunContext":
+        """
+        返回用覆盖项修改后的新上下文，配置项为副本
+
+        覆盖了 server_ip 但没有覆盖 node_num 时，node_num 随 server_ip 的长度变化
+
+        参数:
+            overrides: 覆盖的配置项
+            name: 新上下文的名称，默认沿用
+            share_state: True 表示同一次运行内的临时覆盖，与原上下文共用 state 和随机数发生器；
+                         False 表示独立的新运行（例如并行运行在另一个集群上）
+        """
+        context = RunContext(_merge_overrides(self._values, overrides), name or self.name)
+        if share_state:
+            context.state = self.state
+            context.random = self.random
+        return context
+
+    def validate(self):
+        """
+        检查配置项是否完整、一致
+
+        异常:
+            ValueError: 缺少必需的配置项、节点数与IP数量不一致或数据库类型未知
+        """
+        missing = [key for key in _REQUIRED_KEYS if key not in self._values]
+        if missing:
+            raise ValueError(f"运行上下文缺少配置项: {missing}")
+        if len(self._values["server_ip"]) < self._values["node_num"]:
+            raise ValueError(f"node_num={self._values['node_num']}，但 server_ip 只有 "
+                             f"{len(self._values['server_ip'])} 个地址")
+        if self._values["DB_TYPE"] not in DB_TYPES:
+            raise ValueError(f"未知的数据库类型: {self._values['DB_TYPE']}，可选值: {DB_TYPES}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取配置项，不存在时返回 default"""
+        return self._values.get(key, default)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """返回全部配置项的副本"""
+        return dict(self._values)
+
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self.__dict__["_values"][key]
+        except KeyError:
+            raise AttributeError(f"配置项 {key} 不存在") from None
+
+    def __repr__(self):
+        return (f"RunContext(name={self.name!r}, DB_TYPE={self._values['DB_TYPE']!r}, "
+                f"server_ip={self._values['server_ip']!r})")
+
+
+def current_context() -> RunContext:
+    """返回当前上下文；没有进入任何上下文时返回由 config.py 创建的进程默认上下文"""
+    context = _current.get()
+    if context is not None:
+        return context
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = RunContext.from_config()
+        return _default
+
+
+def set_default_context(context: RunContext):
+    """替换进程默认上下文（例如按运行清单重放时）"""
+    global _default
+    with _default_lock:
+        _default = context
+
+
+@contextmanager
+def use_context(context: Optional[RunContext]):
+    """在 with 块内使用指定上下文，context 为 None 时不改变当前上下文"""
+    if context is None:
+        yield current_context()
+        return
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def override_context(overrides: Dict[str, Any], name: str = None):
+    """在 with 块内使用由当前上下文加覆盖项派生的新上下文"""
+    with use_context(current_context().derive(overrides, name)) as context:
+        yield context
+
+
+def with_run_context(func):
+    """
+    场景入口装饰器：允许调用方通过关键字参数 context 传入运行上下文，函数体在该上下文中执行
+    """
+    @functools.wraps(func)
+    def wrapper(*args, context: RunContext = None, **kwargs):
+        with use_context(context):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ContextThread(threading.Thread):
+    """在创建时的上下文中运行的线程（threading.Thread 不会继承 contextvars）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._run_context = contextvars.copy_context()
+
+    def run(self):
+        self._run_context.run(super().run)
+
+
+class ContextLogFilter(logging.Filter):
+    """在日志前加上当前上下文的名称（多集群并行时区分日志来源）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = current_context().name
+        if name and not getattr(record, "_run_context_tagged", False):
+            record.msg = f"[{name}] {record.msg}"
+            record._run_context_tagged = True
+        return True
+
+
+def install_context_log_filter():
+    """给根日志记录器的所有处理器加上 ContextLogFilter（重复调用不会重复添加）"""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, ContextLogFilter) for f in handler.filters):
+            handler.addFilter(ContextLogFilter())
+
+
+class _CurrentContextProxy:
+    """ctx.X 等价于 current_context().X，供各模块在调用时读取配置"""
+
+    def __getattr__(self, key: str) -> Any:
+        return getattr(current_context(), key)
+
+    def __repr__(self):
+        return repr(current_context())
+
+
+ctx = _CurrentContextProxy()
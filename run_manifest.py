@@ -0,0 +1,269 @@
+import json
+import os
+import posixpath
+import random
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+import run_progress
+import grafana_annotations
+from harness_trace import traced
+from run_context import ctx, current_context, set_default_context
+
+# 运行清单：一次 main.py 运行的随机种子、完整配置、benchmark配置、各节点版本与实际故障时间点，
+# 设置 REPLAY_MANIFEST 后可按清单重放同一次运行
+MANIFEST_VERSION = 1
+# 重放时不从清单恢复的配置项（本机路径与重放开关本身）
+_REPLAY_EXCLUDE = ("OUTPUT_STORE_PATH", "INPUT_BAT_PATH", "INPUT_TEST_RESULT_PATH", "BENCHMARK_CONFIG_PATH",
+                   "REPLAY_MANIFEST", "RUN_SEED")
+
+# 清单与重放队列保存在运行上下文的 state 中（"manifest" / "manifest_path" / "replay_targets"），
+# 同一进程内并行的多个运行各自记录
+_manifest_lock = threading.Lock()
+
+
+def snapshot_config() -> Dict[str, Any]:
+    """返回当前运行上下文中的全部配置项"""
+    return current_context().as_dict()
+
+
+def read_benchmark_config() -> Dict[str, Any]:
+    """读取benchmark配置文件的原文及解析后的 {参数名: 取值}"""
+    with open(ctx.BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        text = f.read()
+    properties = {}
+    for line in text.splitlines():
+        if '=' in line and not line.strip().startswith('#'):
+            key, value = line.split('=', 1)
+            properties[key.strip()] = value.strip()
+    return {"path": ctx.BENCHMARK_CONFIG_PATH, "text": text, "properties": properties}
+
+
+def collect_node_version(node_idx: int) -> Optional[str]:
+    """查询节点上的数据库版本：IoTDB 取 lib 下 iotdb-server jar 的版本号，TDengine 取 taosd -V 的第一行"""
+    from tools import run_remote_command
+    from node_faults import get_data_dir
+
+    if ctx.DB_TYPE == "IoTDB":
+        lib_dir = posixpath.join(posixpath.dirname(get_data_dir(node_idx)), "lib")
+        command = f"for j in {lib_dir}/iotdb-server-*.jar; do basename $j .jar; done | head -1"
+    else:
+        command = "taosd -V 2>/dev/null | head -1"
+    _, output, _ = run_remote_command(node_idx, command)
+    return output.strip() or None
+
+
+def collect_node_inventory() -> Dict[int, Dict[str, Any]]:
+    """并行收集各节点的数据库版本，附带节点信息缓存中的内核、操作系统、CPU与内存"""
+    from tools import run_on_nodes
+    from node_facts import get_node_facts
+
+    versions = run_on_nodes(collect_node_version, list(range(ctx.node_num)))
+    inventory = {}
+    for idx in range(ctx.node_num):
+        facts = get_node_facts(idx) or {}
+        inventory[idx] = {
+            "ip": ctx.server_ip[idx],
+            "db_version": versions.get(idx),
+            **{key: facts.get(key) for key in ("hostname", "kernel", "os", "cpu_count", "mem_total_kb")},
+        }
+    return inventory
+
+
+@traced("write")
+def _save_manifest(state: Dict[str, Any]):
+    """将上下文中的清单写入磁盘（调用方持有 _manifest_lock）"""
+    os.makedirs(os.path.dirname(state["manifest_path"]), exist_ok=True)
+    with open(state["manifest_path"], 'w', encoding='utf-8') as f:
+        json.dump(state["manifest"], f, ensure_ascii=False, indent=2)
+
+
+def start_run_manifest(seed: int = None) -> Dict[str, Any]:
+    """
+    开始在当前运行上下文中记录运行清单：设置上下文的随机种子并记录配置、benchmark配置和各节点版本；
+    场景修改后的benchmark配置在每次benchmark启动时另外记录为 benchmark_config 事件
+
+    在 modify_db_switch 之后、运行场景之前调用。故障目标的随机选择只使用上下文的随机数发生器 ctx.random，
+    因此相同的种子与相同的配置会选出相同的节点，并行运行之间互不影响
+
+    参数:
+        seed: 随机种子，默认为 RUN_SEED，未配置时随机生成并记录
+
+    返回:
+        dict: 清单内容
+    """
+    context = current_context()
+    if seed is None:
+        seed = context.get("RUN_SEED", None)
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    context.random.seed(seed)
+
+    started = time.time()
+    manifest = {
+        "manifest_version": MANIFEST_VERSION,
+        "scenario": context.abnormal_scenario,
+        "context": context.name,
+        "db_type": context.DB_TYPE,
+        "seed": seed,
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+        "replayed_from": context.get("REPLAY_MANIFEST", None),
+        "config": snapshot_config(),
+        "benchmark_config": None,
+        "nodes": {},
+        "events": [],
+        "end_time": "",
+    }
+    try:
+        manifest["benchmark_config"] = read_benchmark_config()
+    except Exception as e:
+        logging.warning(f"⚠️ 读取benchmark配置失败，清单中不包含benchmark配置: {e}")
+    try:
+        manifest["nodes"] = collect_node_inventory()
+    except Exception as e:
+        logging.warning(f"⚠️ 收集节点版本失败: {e}")
+
+    with _manifest_lock:
+        context.state["manifest"] = manifest
+        context.state["manifest_path"] = os.path.join(
+            context.OUTPUT_STORE_PATH, f"manifest_{context.abnormal_scenario}_{int(started)}.json")
+        _save_manifest(context.state)
+    run_progress.start_run(context.abnormal_scenario, seed)
+    logging.info(f"【运行清单】随机种子 {seed}，清单写入 {context.state['manifest_path']}")
+    return manifest
+
+
+def record_event(kind: str, **details):
+    """
+    在当前运行上下文的清单中记录一个带时间戳的事件（故障目标选择、故障施加/移除等），每次记录后立即落盘
+
+    未调用 start_run_manifest 时（例如直接运行单个场景模块）不做任何事
+    """
+    now = time.time()
+    # 运行进度与 Grafana 故障标注在未启动清单时同样不做任何事
+    grafana_annotations.annotate_transitions(run_progress.note_event(kind, details), now)
+    state = current_context().state
+    with _manifest_lock:
+        if state.get("manifest") is None:
+            return
+        state["manifest"]["events"].append({"time": round(now, 3),
+                                            "time_str": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                                            "kind": kind, **details})
+        _save_manifest(state)
+
+
+def result_status(result: Any) -> str:
+    """
+    场景返回值对应的运行状态：单次结果取其 status，参数扫描等返回的结果列表全部完成时为 finished，
+    否则（含场景未返回结果）为 failed
+    """
+    if isinstance(result, list):
+        statuses = [result_status(item) for item in result]
+        return "finished" if statuses and all(status == "finished" for status in statuses) else "failed"
+    if isinstance(result, dict):
+        return result.get("status") or "failed"
+    return "failed"
+
+
+def finish_run_manifest(status: str = "finished"):
+    """记录结束时间与状态并保存清单"""
+    run_progress.finish_run(status)
+    grafana_annotations.flush_annotations()
+    state = current_context().state
+    with _manifest_lock:
+        if state.get("manifest") is None:
+            return
+        state["manifest"]["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        state["manifest"]["status"] = status
+        _save_manifest(state)
+    logging.info(f"【运行清单】已保存到 {state['manifest_path']}")
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """读取运行清单文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def apply_replay_manifest(path: str = None) -> Optional[Dict[str, Any]]:
+    """
+    按运行清单重放：用清单中的配置覆盖进程默认运行上下文、写回当时的benchmark配置文件、固定随机种子，
+    并让故障目标选择依次返回清单中记录的节点（非random策略依赖实时拓扑，直接复用记录的结果）
+
+    在运行场景之前调用
+
+    参数:
+        path: 清单路径，默认为 REPLAY_MANIFEST
+
+    返回:
+        dict: 被重放的清单，未设置重放时返回 None
+    """
+    path = path or ctx.get("REPLAY_MANIFEST", None)
+    if not path:
+        return None
+    manifest = load_manifest(path)
+    if manifest.get("manifest_version") != MANIFEST_VERSION:
+        raise ValueError(f"不支持的清单版本: {manifest.get('manifest_version')}")
+
+    overrides = {key: value for key, value in manifest["config"].items() if key not in _REPLAY_EXCLUDE}
+    overrides["RUN_SEED"] = manifest["seed"]
+    context = current_context().derive(overrides)
+    set_default_context(context)
+
+    benchmark = manifest.get("benchmark_config")
+    if benchmark:
+        # 保留本机原有的benchmark配置，重放结束后由 restore_replay_benchmark_config 写回
+        with open(context.BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            context.state["replay_original_benchmark"] = f.read()
+        with open(context.BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
+            f.write(benchmark["text"])
+
+    replay_targets = [event["targets"] for event in manifest.get("events", []) if event["kind"] == "fault_targets"]
+    context.state["replay_targets"] = replay_targets
+    logging.info(f"【运行清单】重放 {path}：场景 {manifest['scenario']}，种子 {manifest['seed']}，"
+                 f"{len(replay_targets)} 次故障目标选择")
+    return manifest
+
+
+def restore_replay_benchmark_config() -> bool:
+    """
+    将 apply_replay_manifest 覆盖前的benchmark配置文件写回，未重放或已写回时不做任何事
+
+    返回:
+        bool: 是否写回了配置
+    """
+    state = current_context().state
+    original = state.pop("replay_original_benchmark", None)
+    if original is None:
+        return False
+    with open(ctx.BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
+        f.write(original)
+    logging.info("【运行清单】重放结束，benchmark配置文件已恢复为重放前的内容")
+    return True
+
+
+def record_benchmark_config():
+    """
+    在benchmark启动时记录实际生效的benchmark配置（场景会在清单开始记录后修改配置，如乱序、过载、数据集快照），
+    作为 benchmark_config 事件写入清单
+    """
+    try:
+        properties = read_benchmark_config()["properties"]
+    except Exception as e:
+        logging.warning(f"⚠️ 读取benchmark配置失败，清单中不记录本次生效的配置: {e}")
+        return
+    record_event("benchmark_config", path=ctx.BENCHMARK_CONFIG_PATH, properties=properties)
+
+
+def next_replay_targets(count: int) -> Optional[List[int]]:
+    """重放时返回清单中记录的下一次故障目标选择，节点数不一致或记录已用完时返回 None"""
+    state = current_context().state
+    with _manifest_lock:
+        if not state.get("replay_targets"):
+            return None
+        targets = state["replay_targets"].pop(0)
+    if len(targets) != count:
+        logging.warning(f"⚠️ 清单记录的故障目标 {targets} 与需要的节点数 {count} 不一致，改为按策略重新选择")
+        return None
+    return targets
@@ -0,0 +1,437 @@
+import re
+import hmac
+import json
+import time
+import socket
+import logging
+import threading
+import urllib.parse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from run_context import ctx, current_context, ContextThread
+
+# 运行进度：每个运行上下文的当前步骤、正在生效的故障、已运行/剩余时间、benchmark实时输出解析出的吞吐与延迟，
+# 由 PROGRESS_HTTP_PORT 上的本地HTTP服务发布：
+#   GET  /progress   JSON（全部并行运行与节点健康状况）
+#   GET  /metrics    Prometheus 文本格式，可加入 Prometheus 抓取目标与服务端指标叠加显示
+#   POST /abort      终止正在运行的benchmark（?context=名称 只终止该上下文），场景随后继续执行后续步骤（移除故障等）；
+#                    只有配置了 PROGRESS_ABORT_TOKEN 且请求带 Authorization: Bearer <令牌> 时才执行，否则返回403
+# 默认只监听 127.0.0.1，需要从其他机器访问（如 Prometheus 抓取）时再把 PROGRESS_HTTP_ADDRESS 改为 0.0.0.0
+# 进度按上下文名称登记（多集群并行时每个集群一条），未命名的上下文登记为 "default"
+_progress_lock = threading.Lock()
+_runs: Dict[str, Dict[str, Any]] = {}
+_server = None
+
+# 场景日志中的步骤标记，例如 "【步骤5/5】预热等待后开始异常测试" / "【最终步骤】停止所有节点..."
+_STEP_PATTERN = re.compile(r"【(步骤(\d+)/(\d+)|最终步骤)】\s*(.*)")
+# benchmark 进度输出，例如 "... 45.00% workload is done."
+_PERCENT_PATTERN = re.compile(r"(\d+(?:\.\d+)?)%\s+workload is done")
+# 故障事件与其在 faults 中的类别：施加时登记，移除时注销
+_FAULT_EVENTS = {
+    "partition_applied": ("partition", True), "partition_removed": ("partition", False),
+    "impairment_applied": ("network", True), "impairment_removed": ("network", False),
+    "overload_on": ("overload", True), "overload_off": ("overload", False),
+    "disorder_on": ("disorder", True), "disorder_off": ("disorder", False),
+}
+# 以节点区分的停止/启动事件：(停止事件, 类别前缀, 是否为停止)
+_NODE_EVENTS = {
+    "datanode_stopped": ("datanode", True), "datanode_started": ("datanode", False),
+    "component_stopped": ("component", True), "component_started": ("component", False),
+}
+_MAX_EVENTS = 20
+# 节点健康检查连接的客户端端口（TDengine 原生客户端与 dnode 共用 6030）
+_CLIENT_PORTS = {"IoTDB": 6667, "TDengine": 6030}
+_HEALTH_CACHE_SECONDS = 5
+
+
+def _run_key() -> str:
+    return current_context().name or "default"
+
+
+def _get_run() -> Optional[Dict[str, Any]]:
+    with _progress_lock:
+        return _runs.get(_run_key())
+
+
+def start_run(scenario: str, seed: int = None):
+    """登记当前上下文的一次运行（由 start_run_manifest 调用）"""
+    run = {
+        "context": _run_key(), "scenario": scenario, "db_type": ctx.DB_TYPE, "seed": seed,
+        "status": "running", "started_at": time.time(), "finished_at": None,
+        "cell": None, "step": None, "steps": [], "faults": {}, "events": deque(maxlen=_MAX_EVENTS),
+        "benchmark": None, "nodes": {"ips": list(ctx.server_ip), "port": _CLIENT_PORTS.get(ctx.DB_TYPE), "checked_at": 0, "up": {}},
+    }
+    with _progress_lock:
+        _runs[run["context"]] = run
+
+
+def finish_run(status: str):
+    """标记当前上下文的运行结束（由 finish_run_manifest 调用）"""
+    run = _get_run()
+    if run is None:
+        return
+    with _progress_lock:
+        run["status"] = status
+        run["finished_at"] = time.time()
+        if run["step"] is not None:
+            run["step"]["ended_at"] = run["finished_at"]
+
+
+def note_step(message: str):
+    """根据场景日志中的步骤标记更新当前步骤，同一步骤的开始与完成日志只记录一次"""
+    match = _STEP_PATTERN.search(message)
+    run = _get_run()
+    if match is None or run is None:
+        return
+    label = match.group(1)
+    now = time.time()
+    with _progress_lock:
+        if run["step"] is not None and run["step"]["label"] == label:
+            return
+        if run["step"] is not None:
+            run["step"]["ended_at"] = now
+        run["step"] = {"label": label,
+                       "index": int(match.group(2)) if match.group(2) else None,
+                       "total": int(match.group(3)) if match.group(3) else None,
+                       "description": match.group(4).strip().rstrip("."), "started_at": now, "ended_at": None}
+        run["steps"].append(run["step"])
+
+
+def note_event(kind: str, details: Dict[str, Any]) -> List[tuple]:
+    """
+    记录故障事件（由 record_event 调用），并维护正在生效的故障
+
+    返回:
+        list: 本次事件引起的故障开始/结束 [(类别, 是否为开始, 详情)]；同一类别重复施加时先结束原有的再开始新的
+    """
+    run = _get_run()
+    if run is None:
+        return []
+    now = time.time()
+    started, ended = {}, []
+    if kind in _FAULT_EVENTS:
+        category, applied = _FAULT_EVENTS[kind]
+        if applied:
+            started[category] = details
+        else:
+            ended.append(category)
+    elif kind in _NODE_EVENTS:
+        prefix, stopped = _NODE_EVENTS[kind]
+        category = f"{prefix}:{details.get('component', 'datanode')}@{details.get('node')}"
+        if stopped:
+            started[category] = details
+        else:
+            ended.append(category)
+    elif kind == "fault_applied":
+        for fault in details.get("faults") or []:
+            started[f"fault:{fault['kind']}"] = {"nodes": details.get("nodes"), **fault}
+
+    with _progress_lock:
+        run["events"].append({"time": round(now, 3), "kind": kind, **details})
+        faults = run["faults"]
+        if kind == "campaign_run":
+            run["cell"] = {"cell": details.get("cell"), "rep": details.get("rep")}
+        elif kind == "fault_removed":
+            kinds = [f["kind"] for f in details["faults"]] if details.get("faults") else None
+            ended = [c for c in faults if c.startswith("fault:") and (kinds is None or c[len("fault:"):] in kinds)]
+        transitions = []
+        for category in ended + [c for c in started if c in faults]:
+            if faults.pop(category, None) is not None:
+                transitions.append((category, False, {}))
+        for category, fault_details in started.items():
+            faults[category] = {"since": round(now, 3), **fault_details}
+            transitions.append((category, True, fault_details))
+    return transitions
+
+
+def benchmark_started(process):
+    """登记一次benchmark进程（由 run_bat_and_parse 调用），之后的输出行交给 note_benchmark_line"""
+    run = _get_run()
+    if run is None:
+        return
+    with _progress_lock:
+        run["benchmark"] = {"index": (run["benchmark"] or {}).get("index", 0) + 1, "process": process,
+                            "started_at": time.time(), "finished_at": None, "return_code": None,
+                            "percent": None, "lines": 0, "aborted": False,
+                            "result": {}, "latency": {}, "window": {}, "matrix_at": None,
+                            "_buffer": None, "_buffer_kind": None}
+
+
+def note_benchmark_line(line: str):
+    """
+    解析benchmark的一行输出：进度百分比，以及周期性输出（RESULT_PRINT_INTERVAL）的 Result / Latency Matrix
+
+    Result Matrix 为累计值，相邻两次之间的 okPoint 增量除以间隔即为该窗口内的写入/查询速率
+    """
+    from tools import parse_result_matrix, parse_latency_matrix
+
+    run = _get_run()
+    if run is None or run["benchmark"] is None:
+        return
+    bench = run["benchmark"]
+    text = line.rstrip("\n")
+    stripped = text.strip()
+    with _progress_lock:
+        bench["lines"] += 1
+        percent = _PERCENT_PATTERN.search(text)
+        if percent:
+            bench["percent"] = float(percent.group(1))
+        if "Result Matrix" in stripped and stripped.startswith("---"):
+            bench["_buffer"], bench["_buffer_kind"] = [text], "result"
+            return
+        if "Latency (ms) Matrix" in stripped and stripped.startswith("---"):
+            bench["_buffer"], bench["_buffer_kind"] = [text], "latency"
+            return
+        if bench["_buffer"] is None:
+            return
+        bench["_buffer"].append(text)
+        # 矩阵以一整行短横线结束
+        if len(bench["_buffer"]) <= 2 or not stripped or stripped.strip("-"):
+            return
+        lines, kind = bench["_buffer"], bench["_buffer_kind"]
+        bench["_buffer"] = bench["_buffer_kind"] = None
+        now = time.time()
+        if kind == "latency":
+            bench["latency"] = parse_latency_matrix(lines)
+            return
+        result = parse_result_matrix(lines)
+        if bench["matrix_at"] is not None and now > bench["matrix_at"]:
+            elapsed = now - bench["matrix_at"]
+            bench["window"] = {op: round((values["okPoint"] - bench["result"].get(op, {}).get("okPoint", 0)) / elapsed, 2)
+                               for op, values in result.items()}
+        bench["result"], bench["matrix_at"] = result, now
+
+
+def benchmark_finished(return_code: int):
+    """记录benchmark进程结束"""
+    run = _get_run()
+    if run is None or run["benchmark"] is None:
+        return
+    with _progress_lock:
+        run["benchmark"]["finished_at"] = time.time()
+        run["benchmark"]["return_code"] = return_code
+        run["benchmark"]["process"] = None
+
+
+def abort_benchmarks(context: str = None) -> List[str]:
+    """
+    终止正在运行的benchmark进程
+
+    参数:
+        context: 上下文名称，None 表示全部
+
+    返回:
+        list: 被终止的上下文名称
+    """
+    aborted = []
+    with _progress_lock:
+        for name, run in _runs.items():
+            bench = run["benchmark"]
+            if (context is None or name == context) and bench and bench["process"] is not None:
+                bench["aborted"] = True
+                bench["process"].terminate()
+                aborted.append(name)
+    if aborted:
+        logging.warning(f"【运行进度】已按请求终止 {aborted} 的benchmark")
+    return aborted
+
+
+def _check_nodes(nodes: Dict[str, Any]) -> Dict[str, bool]:
+    """检查各节点客户端端口能否连接，结果缓存 _HEALTH_CACHE_SECONDS 秒"""
+    if nodes["port"] is None or time.time() - nodes["checked_at"] < _HEALTH_CACHE_SECONDS:
+        return nodes["up"]
+    up = {}
+    for ip in nodes["ips"]:
+        try:
+            with socket.create_connection((ip, nodes["port"]), timeout=0.5):
+                up[ip] = True
+        except OSError:
+            up[ip] = False
+    nodes["up"], nodes["checked_at"] = up, time.time()
+    return up
+
+
+def _snapshot_run(run: Dict[str, Any], now: float) -> Dict[str, Any]:
+    """生成一次运行的进度快照（调用方持有 _progress_lock）"""
+    end = run["finished_at"] or now
+    step = run["step"]
+    bench = run["benchmark"]
+    benchmark = None
+    if bench is not None:
+        elapsed = (bench["finished_at"] or now) - bench["started_at"]
+        percent = bench["percent"]
+        benchmark = {
+            "index": bench["index"], "running": bench["process"] is not None, "aborted": bench["aborted"],
+            "return_code": bench["return_code"], "elapsed_seconds": round(elapsed, 1), "percent": percent,
+            "remaining_seconds": round(elapsed * (100 - percent) / percent, 1) if percent else None,
+            "output_lines": bench["lines"],
+            "operations": {op: {"throughput": values.get("throughput"), "ok_points": values.get("okPoint"),
+                                "fail_operations": values.get("failOperation"),
+                                "window_points_per_second": bench["window"].get(op),
+                                "avg_ms": bench["latency"].get(op, {}).get("AVG"),
+                                "p99_ms": bench["latency"].get(op, {}).get("P99")}
+                           for op, values in bench["result"].items()},
+            "matrix_age_seconds": round(now - bench["matrix_at"], 1) if bench["matrix_at"] else None,
+        }
+    return {
+        "context": run["context"], "scenario": run["scenario"], "db_type": run["db_type"], "seed": run["seed"],
+        "cell": run["cell"], "status": run["status"], "elapsed_seconds": round(end - run["started_at"], 1),
+        "step": None if step is None else {
+            "label": step["label"], "index": step["index"], "total": step["total"],
+            "description": step["description"], "elapsed_seconds": round((step["ended_at"] or now) - step["started_at"], 1)},
+        "steps_done": [s["label"] for s in run["steps"] if s["ended_at"] is not None],
+        "faults": {category: dict(details) for category, details in run["faults"].items()},
+        "recent_events": list(run["events"]),
+        "benchmark": benchmark,
+        "nodes": {ip: {"client_port_open": up} for ip, up in run["nodes"]["up"].items()},
+    }
+
+
+def get_progress() -> Dict[str, Any]:
+    """所有已登记运行的进度快照"""
+    with _progress_lock:
+        runs = list(_runs.values())
+    for run in runs:
+        if run["status"] == "running":
+            _check_nodes(run["nodes"])
+    now = time.time()
+    with _progress_lock:
+        return {"time": round(now, 3), "runs": [_snapshot_run(run, now) for run in runs]}
+
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def format_prometheus(progress: Dict[str, Any]) -> str:
+    """把进度快照转换为 Prometheus 文本格式"""
+    lines = [
+        "# HELP abnormal_run_running 运行是否进行中", "# TYPE abnormal_run_running gauge",
+        "# HELP abnormal_run_elapsed_seconds 运行已进行的时间", "# TYPE abnormal_run_elapsed_seconds gauge",
+        "# HELP abnormal_step 当前步骤（值为步骤序号，最终步骤为0）", "# TYPE abnormal_step gauge",
+        "# HELP abnormal_phase 正在生效的故障阶段（phase 为故障类别）", "# TYPE abnormal_phase gauge",
+        "# HELP abnormal_benchmark_percent benchmark进度百分比", "# TYPE abnormal_benchmark_percent gauge",
+        "# HELP abnormal_benchmark_throughput benchmark累计吞吐（Result Matrix）", "# TYPE abnormal_benchmark_throughput gauge",
+        "# HELP abnormal_benchmark_window_points_per_second 最近两次矩阵输出之间的点速率",
+        "# TYPE abnormal_benchmark_window_points_per_second gauge",
+        "# HELP abnormal_benchmark_latency_ms benchmark累计延迟（Latency Matrix）", "# TYPE abnormal_benchmark_latency_ms gauge",
+        "# HELP abnormal_node_up 节点客户端端口能否连接", "# TYPE abnormal_node_up gauge",
+    ]
+    for run in progress["runs"]:
+        base = f'context="{_label(run["context"])}",scenario="{_label(run["scenario"])}"'
+        lines.append(f'abnormal_run_running{{{base}}} {int(run["status"] == "running")}')
+        lines.append(f'abnormal_run_elapsed_seconds{{{base}}} {run["elapsed_seconds"]}')
+        if run["step"]:
+            lines.append(f'abnormal_step{{{base},step="{_label(run["step"]["label"])}",'
+                         f'description="{_label(run["step"]["description"])}"}} {run["step"]["index"] or 0}')
+        for category in run["faults"]:
+            lines.append(f'abnormal_phase{{{base},phase="{_label(category)}"}} 1')
+        bench = run["benchmark"]
+        if bench and bench["running"]:
+            if bench["percent"] is not None:
+                lines.append(f'abnormal_benchmark_percent{{{base}}} {bench["percent"]}')
+            for op, values in bench["operations"].items():
+                labels = f'{base},operation="{_label(op)}"'
+                if values["throughput"] is not None:
+                    lines.append(f'abnormal_benchmark_throughput{{{labels}}} {values["throughput"]}')
+                if values["window_points_per_second"] is not None:
+                    lines.append(f'abnormal_benchmark_window_points_per_second{{{labels}}} {values["window_points_per_second"]}')
+                for name in ("avg_ms", "p99_ms"):
+                    if values[name] is not None:
+                        lines.append(f'abnormal_benchmark_latency_ms{{{labels},stat="{name[:-3]}"}} {values[name]}')
+        for ip, node in run["nodes"].items():
+            lines.append(f'abnormal_node_up{{{base},node="{_label(ip)}"}} {int(bool(node["client_port_open"]))}')
+    return "\n".join(lines) + "\n"
+
+
+class _ProgressHandler(BaseHTTPRequestHandler):
+    def _send(self, status: int, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path in ("/", "/progress"):
+            self._send(200, json.dumps(get_progress(), ensure_ascii=False, default=str), "application/json; charset=utf-8")
+        elif path == "/metrics":
+            self._send(200, format_prometheus(get_progress()), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/abort":
+            self._send(404, json.dumps({"error": "not found"}), "application/json")
+            return
+        token = self.server.abort_token
+        supplied = self.headers.get("Authorization", "")
+        if not token or not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            self._send(403, json.dumps({"error": "abort disabled or token mismatch"}), "application/json")
+            return
+        context = urllib.parse.parse_qs(url.query).get("context", [None])[0]
+        self._send(200, json.dumps({"aborted": abort_benchmarks(context)}, ensure_ascii=False), "application/json")
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不写入 info.log
+        pass
+
+
+class ProgressLogHandler(logging.Handler):
+    """从场景日志中识别步骤标记，更新当前上下文的步骤"""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return
+        if "步骤" in message:
+            note_step(message)
+
+
+def start_progress_server() -> Optional[int]:
+    """
+    按 PROGRESS_HTTP_PORT 启动进度HTTP服务（进程内只启动一次），None 表示不启动；端口被占用时只记录警告
+
+    返回:
+        int: 实际监听的端口，未启动时为None
+    """
+    global _server
+    port = ctx.get("PROGRESS_HTTP_PORT", 9108)
+    address = ctx.get("PROGRESS_HTTP_ADDRESS", "127.0.0.1")
+    if port is None:
+        return None
+    with _progress_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        try:
+            _server = ThreadingHTTPServer((address, int(port)), _ProgressHandler)
+        except OSError as e:
+            logging.warning(f"⚠️ 【运行进度】无法在端口 {port} 启动进度服务: {e}")
+            return None
+        _server.daemon_threads = True
+        # 请求在服务线程中处理，令牌在启动时取出
+        _server.abort_token = ctx.get("PROGRESS_ABORT_TOKEN", None)
+    logging.getLogger().addHandler(ProgressLogHandler())
+    ContextThread(target=_server.serve_forever, daemon=True).start()
+    port = _server.server_address[1]
+    abort_note = "POST /abort 需携带令牌" if _server.abort_token else "POST /abort 未开启（未配置 PROGRESS_ABORT_TOKEN）"
+    logging.info(f"【运行进度】进度服务已启动: http://{address}:{port}/progress"
+                 f"（/metrics 为 Prometheus 格式，{abort_note}）")
+    return port
+
+
+def stop_progress_server():
+    """停止进度HTTP服务"""
+    global _server
+    with _progress_lock:
+        server, _server = _server, None
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        for handler in [h for h in logging.getLogger().handlers if isinstance(h, ProgressLogHandler)]:
+            logging.getLogger().removeHandler(handler)
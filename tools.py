@@ -1,30 +1,19 @@
 import os
 import subprocess
-import paramiko
-import threading
 import time
 import logging
-from config import server_ip, OUTPUT_STORE_PATH, DB_TYPE
 from typing import List, Dict, Any
+import run_progress
+from run_manifest import record_benchmark_config
+from harness_trace import span, traced, preview_command
+from run_context import ctx, current_context, ContextThread
 
-# 配置日志
-os.makedirs(OUTPUT_STORE_PATH, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(OUTPUT_STORE_PATH, 'info.log'), encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
 
 def startConfigNode(index):
     """启动指定索引的ConfigNode（仅IoTDB使用）"""
-    if DB_TYPE == "IoTDB":
+    if ctx.DB_TYPE == "IoTDB":
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[index], username="ubuntu", password="Dwf12345")
+            ssh = open_ssh(index)
             
             # 根据index确定路径前缀
             path_prefix = "/mnt/data/" if index == 0 else "./"
@@ -37,11 +26,11 @@ def startConfigNode(index):
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
                 if result:
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     remaining = stdout.readlines()
                     for line in remaining:
-                        logging.info(f"{server_ip[index]} {line.strip()}")
+                        logging.info(f"{ctx.server_ip[index]} {line.strip()}")
                     break
                     
             time.sleep(5)  # 给予ConfigNode启动时间
@@ -51,19 +40,17 @@ def startConfigNode(index):
         finally:
             if 'ssh' in locals():
                 ssh.close()
-    elif DB_TYPE == "TDengine":
+    elif ctx.DB_TYPE == "TDengine":
         # TDengine 不使用 ConfigNode，启动逻辑在 startDataNode 中
         logging.info(f"TDengine 不使用 ConfigNode，跳过启动 ConfigNode {index}")
     else:
-        logging.error(f"未知的数据库类型: {DB_TYPE}")
+        logging.error(f"未知的数据库类型: {ctx.DB_TYPE}")
 
 def startDataNode(index):
     """启动指定索引的DataNode/TDengine节点"""
-    if DB_TYPE == "IoTDB":
+    if ctx.DB_TYPE == "IoTDB":
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[index], username="ubuntu", password="Dwf12345")
+            ssh = open_ssh(index)
             
             # 根据index确定路径前缀
             path_prefix = "/mnt/data/" if index == 0 else "./"
@@ -76,11 +63,11 @@ def startDataNode(index):
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
                 if result:
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     remaining = stdout.readlines()
                     for line in remaining:
-                        logging.info(f"{server_ip[index]} {line.strip()}")
+                        logging.info(f"{ctx.server_ip[index]} {line.strip()}")
                     break
                     
         except Exception as e:
@@ -88,12 +75,10 @@ def startDataNode(index):
         finally:
             if 'ssh' in locals():
                 ssh.close()
-    elif DB_TYPE == "TDengine":
+    elif ctx.DB_TYPE == "TDengine":
         # TDengine每个节点都需要启动
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[index], username="ubuntu", password="Dwf12345")
+            ssh = open_ssh(index)
             
             # 根据index确定路径前缀
             path_prefix = "/mnt/data/" if index == 0 else "./"
@@ -107,11 +92,11 @@ def startDataNode(index):
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
                 if result:
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     remaining = stdout.readlines()
                     for line in remaining:
-                        logging.info(f"{server_ip[index]} {line.strip()}")
+                        logging.info(f"{ctx.server_ip[index]} {line.strip()}")
                     break
             
             # 启动taoskeeper
@@ -123,11 +108,11 @@ def startDataNode(index):
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
                 if result:
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     remaining = stdout.readlines()
                     for line in remaining:
-                        logging.info(f"{server_ip[index]} {line.strip()}")
+                        logging.info(f"{ctx.server_ip[index]} {line.strip()}")
                     break
             
             # 启动taosadapter
@@ -139,11 +124,11 @@ def startDataNode(index):
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
                 if result:
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     remaining = stdout.readlines()
                     for line in remaining:
-                        logging.info(f"{server_ip[index]} {line.strip()}")
+                        logging.info(f"{ctx.server_ip[index]} {line.strip()}")
                     break
                     
             time.sleep(5)  # 给予TDengine启动时间
@@ -154,15 +139,13 @@ def startDataNode(index):
             if 'ssh' in locals():
                 ssh.close()
     else:
-        logging.error(f"未知的数据库类型: {DB_TYPE}")
+        logging.error(f"未知的数据库类型: {ctx.DB_TYPE}")
 
 def stopNode(index, only_datanode=False):
     """停止指定索引的节点"""
-    if DB_TYPE == "IoTDB":
+    if ctx.DB_TYPE == "IoTDB":
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[index], username="ubuntu", password="Dwf12345")
+            ssh = open_ssh(index)
             
             # 根据index确定路径前缀
             path_prefix = "/mnt/data/" if index == 0 else "./"
@@ -172,7 +155,7 @@ def stopNode(index, only_datanode=False):
                     f"sudo {path_prefix}apache-iotdb-2.0.4-all-bin/sbin/stop-confignode.sh", get_pty=True)
                 while not stdout.channel.exit_status_ready():
                     result = stdout.readline()
-                    logging.info(f"{server_ip[index]} {result.strip()}")
+                    logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                     if stdout.channel.exit_status_ready():
                         a = stdout.readlines()
                         break
@@ -181,20 +164,19 @@ def stopNode(index, only_datanode=False):
                 f"sudo {path_prefix}apache-iotdb-2.0.4-all-bin/sbin/stop-datanode.sh", get_pty=True)
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
-                logging.info(f"{server_ip[index]} {result.strip()}")
+                logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     a = stdout.readlines()
                     break
         except Exception as e:
             logging.error(f"停止IoTDB节点 {index} 时出错: {str(e)}")
         finally:
-            ssh.close()
-    elif DB_TYPE == "TDengine":
+            if 'ssh' in locals():
+                ssh.close()
+    elif ctx.DB_TYPE == "TDengine":
         # TDengine每个节点都需要停止
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(server_ip[index], username="ubuntu", password="Dwf12345")
+            ssh = open_ssh(index)
             
             # 根据index确定路径前缀
             path_prefix = "/mnt/data/" if index == 0 else "./"
@@ -206,7 +188,7 @@ def stopNode(index, only_datanode=False):
             
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
-                logging.info(f"{server_ip[index]} {result.strip()}")
+                logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     a = stdout.readlines()
                     break
@@ -218,7 +200,7 @@ def stopNode(index, only_datanode=False):
             
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
-                logging.info(f"{server_ip[index]} {result.strip()}")
+                logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     a = stdout.readlines()
                     break
@@ -230,16 +212,85 @@ def stopNode(index, only_datanode=False):
             
             while not stdout.channel.exit_status_ready():
                 result = stdout.readline()
-                logging.info(f"{server_ip[index]} {result.strip()}")
+                logging.info(f"{ctx.server_ip[index]} {result.strip()}")
                 if stdout.channel.exit_status_ready():
                     a = stdout.readlines()
                     break
         except Exception as e:
             logging.error(f"停止TDengine节点 {index} 时出错: {str(e)}")
         finally:
-            ssh.close()
+            if 'ssh' in locals():
+                ssh.close()
     else:
-        logging.error(f"未知的数据库类型: {DB_TYPE}")
+        logging.error(f"未知的数据库类型: {ctx.DB_TYPE}")
+
+
+def open_ssh(index):
+    """建立到指定索引节点的SSH连接，调用方负责关闭"""
+    import paramiko  # 延迟导入：报告、对比等不连接节点的命令无需加载
+    with span("ssh_connect", "ssh", node=index):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(ctx.server_ip[index], username="ubuntu", password="Dwf12345")
+    return ssh
+
+
+def run_remote_command(index, command, get_pty=False, ssh=None):
+    """
+    在指定节点上执行一条命令并等待其结束
+
+    参数:
+        index: 节点索引
+        command: 要执行的shell命令
+        get_pty: 是否分配伪终端（sudo需要tty时使用）
+        ssh: 已建立的SSH连接，为None时临时建立并在结束后关闭
+
+    返回:
+        tuple: (退出码, 标准输出, 标准错误)
+    """
+    own_ssh = ssh is None
+    with span("ssh_exec", "ssh", node=index, command=preview_command(command)) as info:
+        if own_ssh:
+            ssh = open_ssh(index)
+        try:
+            stdin, stdout, stderr = ssh.exec_command(command, get_pty=get_pty)
+            exit_status = stdout.channel.recv_exit_status()
+            info["exit_status"] = exit_status
+            return exit_status, stdout.read().decode(errors="replace"), stderr.read().decode(errors="replace")
+        finally:
+            if own_ssh:
+                ssh.close()
+
+
+def run_on_nodes(func, node_indices, *args):
+    """
+    为每个节点启动一个线程并行执行 func(node_idx, *args)
+
+    返回:
+        dict: {节点索引: func的返回值}，抛出异常的节点对应None
+    """
+    results = {}
+    name = getattr(func, '__name__', str(func))
+    spawned = time.perf_counter()
+
+    def worker(node_idx):
+        # start_delay_ms 为从开始派发线程到该线程真正开始执行的时间，即并行操作之间的起始偏差
+        with span(name, "thread", node=node_idx, start_delay_ms=round((time.perf_counter() - spawned) * 1000, 3)):
+            try:
+                results[node_idx] = func(node_idx, *args)
+            except Exception as e:
+                logging.error(f"节点 {node_idx} 执行 {name} 时出错: {e}")
+                results[node_idx] = None
+
+    with span("run_on_nodes", "thread", func=name, nodes=len(node_indices)):
+        threads = []
+        for node_idx in node_indices:
+            t = ContextThread(target=worker, args=(node_idx,))
+            threads.append(t)
+            t.start()
+        for t in threads:
+            t.join()
+    return results
 
 
 def modify_db_switch():
@@ -249,19 +300,18 @@ def modify_db_switch():
     TDengine: DB_SWITCH=TDengine-3
     """
     try:
-        from config import BENCHMARK_CONFIG_PATH
         
         # 读取配置文件
-        with open(BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        with open(ctx.BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
             lines = f.readlines()
         
         # 根据数据库类型设置DB_SWITCH
-        if DB_TYPE == "IoTDB":
+        if ctx.DB_TYPE == "IoTDB":
             target_value = "IoTDB-200-SESSION_BY_TABLET"
-        elif DB_TYPE == "TDengine":
+        elif ctx.DB_TYPE == "TDengine":
             target_value = "TDengine-3"
         else:
-            logging.error(f"未知的数据库类型: {DB_TYPE}")
+            logging.error(f"未知的数据库类型: {ctx.DB_TYPE}")
             return False
         
         # 修改配置参数
@@ -280,7 +330,7 @@ def modify_db_switch():
             return False
         
         # 写入修改后的配置
-        with open(BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
+        with open(ctx.BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
             f.writelines(modified_lines)
         
         logging.info(f"✅ 配置文件修改完成，DB_SWITCH已设置为 {target_value}")
@@ -291,88 +341,109 @@ def modify_db_switch():
         return False
 
 
-def start_monitoring_system():
+# benchmark OPERATION_PROPORTION 中各操作的顺序
+BENCHMARK_OPERATIONS = ("INGESTION", "PRECISE_POINT", "TIME_RANGE", "VALUE_RANGE", "AGG_RANGE", "AGG_VALUE",
+                        "AGG_RANGE_VALUE", "GROUP_BY", "LATEST_POINT", "RANGE_QUERY_DESC",
+                        "VALUE_RANGE_QUERY_DESC", "GROUP_BY_DESC")
+
+def build_operation_proportion(weights: Dict[str, int]) -> str:
+    """按 BENCHMARK_OPERATIONS 的顺序生成 OPERATION_PROPORTION，例如 {"INGESTION": 1} -> 1:0:0:..."""
+    return ":".join(str(weights.get(op, 0)) for op in BENCHMARK_OPERATIONS)
+
+
+def write_benchmark_properties(overrides: Dict[str, Any]):
     """
-    启动节点监控系统：在index=0的机器上启动Prometheus和Grafana服务
+    直接修改benchmark配置文件中的参数（不备份），配置文件中不存在的参数追加到末尾
+
+    参数:
+        overrides: {参数名: 取值}
+    """
+    with open(ctx.BENCHMARK_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    values = {key: str(value) for key, value in overrides.items()}
+    modified_lines = []
+    written = set()
+    for line in lines:
+        key = line.split('=', 1)[0].strip()
+        if '=' in line and not line.strip().startswith('#') and key in values:
+            modified_lines.append(f"{key}={values[key]}\n")
+            written.add(key)
+        else:
+            modified_lines.append(line)
+    appended = [f"{key}={value}\n" for key, value in values.items() if key not in written]
+    if appended and modified_lines and not modified_lines[-1].endswith("\n"):
+        # 文件末行没有换行符时先补上，否则追加的参数会接在末行之后
+        modified_lines[-1] += "\n"
+    modified_lines += appended
+
+    with open(ctx.BENCHMARK_CONFIG_PATH, 'w', encoding='utf-8') as f:
+        f.writelines(modified_lines)
+    logging.info(f"修改benchmark配置: {values}")
+
+
+def modify_benchmark_properties(overrides: Dict[str, Any]) -> bool:
+    """
+    批量修改benchmark配置文件中的参数
+
+    本次运行中第一次修改前将当前配置备份到 BENCHMARK_CONFIG_PATH.backup（覆盖之前运行遗留的备份），
+    之后的修改不再备份，restore_benchmark_properties 恢复到第一次修改前的内容
+
+    参数:
+        overrides: {参数名: 取值}，配置文件中不存在的参数追加到末尾
+
+    返回:
+        bool: 是否修改成功
     """
-    logging.info("\n【启动监控系统】开始启动Prometheus和Grafana...")
-    
     try:
-        # 启动Prometheus服务
-        def start_prometheus():
-            try:
-                ssh_prometheus = paramiko.SSHClient()
-                ssh_prometheus.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh_prometheus.connect(server_ip[0], username="ubuntu", password="Dwf12345")
-                
-                logging.info("启动Prometheus服务...")
-                stdin, stdout, stderr = ssh_prometheus.exec_command(
-                    "/mnt/data/prometheus-3.5.0.linux-amd64/prometheus --config.file=/mnt/data/prometheus-3.5.0.linux-amd64/prometheus.yml --storage.tsdb.retention.time=180d",
-                    get_pty=True
-                )
-                
-                # 读取初始启动输出
-                logging.info("Prometheus启动输出:")
-                time.sleep(3)  # 等待服务启动
-                
-                # 检查输出是否有错误
-                if stdout.channel.recv_ready():
-                    initial_output = stdout.read(1024).decode('utf-8')
-                    logging.info(f"Prometheus: {initial_output}")
-                
-                logging.info("✅ Prometheus服务已启动并保持运行")
-                
-                # 保持SSH连接不关闭，让Prometheus持续运行
-                # 注意：这个SSH连接将持续保持开启状态
-                return ssh_prometheus
-                
-            except Exception as e:
-                logging.error(f"❌ 启动Prometheus时出错: {e}")
-                return None
-        
-        # 启动Grafana服务
-        def start_grafana():
-            try:
-                ssh_grafana = paramiko.SSHClient()
-                ssh_grafana.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh_grafana.connect(server_ip[0], username="ubuntu", password="Dwf12345")
-                
-                logging.info("启动Grafana服务...")
-                stdin, stdout, stderr = ssh_grafana.exec_command(
-                    "sudo /bin/systemctl start grafana-server",
-                    get_pty=True
-                )
-                
-                # 等待命令执行完成
-                stdout.channel.recv_exit_status()
-                
-                logging.info("✅ Grafana服务已启动")
-                
-                # 关闭SSH连接
-                ssh_grafana.close()
-                
-            except Exception as e:
-                logging.error(f"❌ 启动Grafana时出错: {e}")
-                if 'ssh_grafana' in locals():
-                    ssh_grafana.close()
-        
-        # 启动Prometheus线程
-        prometheus_thread = threading.Thread(target=lambda: globals().update({'prometheus_ssh': start_prometheus()}))
-        prometheus_thread.daemon = True  # 设为守护线程
-        prometheus_thread.start()
-        
-        # 等待Prometheus启动
-        time.sleep(5)
-        
-        # 直接启动Grafana（不使用线程）
-        start_grafana()
-        
-        logging.info("【监控系统】Prometheus和Grafana已启动完成")
-        logging.info(f"Prometheus Web界面: http://{server_ip[0]}:9090")
-        logging.info(f"Grafana Web界面: http://{server_ip[0]}:3000")
-        
+        import shutil
+
+        state = current_context().state
+        backup_path = ctx.BENCHMARK_CONFIG_PATH + ".backup"
+        if state.get("benchmark_backup") != backup_path:
+            shutil.copy2(ctx.BENCHMARK_CONFIG_PATH, backup_path)
+            state["benchmark_backup"] = backup_path
+            logging.info(f"已备份原始配置文件到: {backup_path}")
+
+        write_benchmark_properties(overrides)
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ 修改benchmark配置时出错: {e}")
+        return False
+
+
+def restore_benchmark_properties() -> bool:
+    """将benchmark配置文件恢复为 modify_benchmark_properties 备份的配置，并删除备份文件"""
+    try:
+        import shutil
+
+        state = current_context().state
+        backup_path = ctx.BENCHMARK_CONFIG_PATH + ".backup"
+        if state.get("benchmark_backup") != backup_path or not os.path.exists(backup_path):
+            logging.warning("⚠️  本次运行未备份配置文件，无法恢复配置")
+            return False
+        shutil.copy2(backup_path, ctx.BENCHMARK_CONFIG_PATH)
+        os.remove(backup_path)
+        state.pop("benchmark_backup", None)
+        logging.info("✅ 配置文件已恢复到原始状态")
         return True
-        
+    except Exception as e:
+        logging.error(f"❌ 恢复配置文件时出错: {e}")
+        return False
+
+
+def start_monitoring_system():
+    """
+    启动节点监控系统：确保index=0的机器上的Prometheus和Grafana已运行并就绪，已在运行时直接复用
+
+    返回:
+        bool: 两者是否都已就绪
+    """
+    from monitoring_stack import ensure_monitoring
+
+    try:
+        return ensure_monitoring()
     except Exception as e:
         logging.error(f"❌ 启动监控系统时出现异常: {e}")
         return False
@@ -399,7 +470,7 @@ def monitor_and_restart(config_threads, data_threads, restart_count):
                 else:
                     logging.info(f"ConfigNode {i+1} 已停止，正在重启...")
                     # 重启ConfigNode
-                    new_thread = threading.Thread(target=startConfigNode, args=(i,))
+                    new_thread = ContextThread(target=startConfigNode, args=(i,))
                     new_thread.start()
                     config_threads[i] = new_thread
                     restart_count[i] += 1
@@ -411,7 +482,7 @@ def monitor_and_restart(config_threads, data_threads, restart_count):
                 else:
                     logging.info(f"DataNode {i+1} 已停止，正在重启...")
                     # 重启DataNode
-                    new_thread = threading.Thread(target=startDataNode, args=(i,))
+                    new_thread = ContextThread(target=startDataNode, args=(i,))
                     new_thread.start()
                     data_threads[i] = new_thread
                     restart_count[i] += 1
@@ -427,6 +498,7 @@ def monitor_and_restart(config_threads, data_threads, restart_count):
             t.join()
         logging.info("所有节点线程已结束")
 
+@traced("parse")
 def parse_test_matrices(source_filename):
     """
     从源测试结果文件中读取最后一个Result Matrix和Latency (ms) Matrix的完整内容，
@@ -512,6 +584,7 @@ def parse_test_matrices(source_filename):
         logging.error(f"解析文件时发生未知错误：{str(e)}")
         return None
     
+@traced("benchmark")
 def run_bat_and_parse(bat_path, result_file_path):
     """
     先执行bat文件，再解析结果文件并输出结果
@@ -530,6 +603,7 @@ def run_bat_and_parse(bat_path, result_file_path):
         # 获取bat文件的文件名
         bat_filename = os.path.basename(bat_path)
         logging.info(f"开始执行bat文件: {bat_path}")
+        record_benchmark_config()
         
         # 执行bat文件
         logging.info(f"将进入目录: {bat_directory}")
@@ -545,6 +619,7 @@ def run_bat_and_parse(bat_path, result_file_path):
         )
         
         logging.info(f"bat文件 '{bat_path}' 已启动，等待最多 {timeout_seconds} 秒...")
+        run_progress.benchmark_started(process)
 
         # 监控子进程输出并处理交互
         def monitor_and_interact():
@@ -553,25 +628,31 @@ def run_bat_and_parse(bat_path, result_file_path):
                 last_space_time = time.time()
                 space_interval = 600  # 10分钟 = 600秒
                 
-                while process.poll() is None:  # 进程还在运行
-                    output = process.stdout.readline()
-                    if output:
-                        # 不再将输出记录到日志中
-                        pass
-                    
-                    # 检查是否到了发送空格的时间
-                    current_time = time.time()
-                    if current_time - last_space_time >= space_interval:
-                        logging.info(f"每隔10分钟自动发送空格...")
-                        process.stdin.write(" \n")
-                        process.stdin.flush()
-                        last_space_time = current_time
+                with span("benchmark_output", "parse") as info:
+                    info["lines"] = 0
+                    info["parse_ms"] = 0.0
+                    while process.poll() is None:  # 进程还在运行
+                        output = process.stdout.readline()
+                        if output:
+                            # 不再将输出记录到日志中，只用于更新运行进度；parse_ms 为解析输出本身占用的时间
+                            parse_start = time.perf_counter()
+                            run_progress.note_benchmark_line(output)
+                            info["parse_ms"] += (time.perf_counter() - parse_start) * 1000
+                            info["lines"] += 1
+
+                        # 检查是否到了发送空格的时间
+                        current_time = time.time()
+                        if current_time - last_space_time >= space_interval:
+                            logging.info(f"每隔10分钟自动发送空格...")
+                            process.stdin.write(" \n")
+                            process.stdin.flush()
+                            last_space_time = current_time
                             
             except Exception as e:
                 logging.error(f"监控子进程输出时出错: {e}")
         
         # 在后台线程中监控输出
-        monitor_thread = threading.Thread(target=monitor_and_interact)
+        monitor_thread = ContextThread(target=monitor_and_interact)
         monitor_thread.daemon = True
         monitor_thread.start()
 
@@ -591,6 +672,7 @@ def run_bat_and_parse(bat_path, result_file_path):
         # 确保stdin被关闭
         if process.stdin:
             process.stdin.close()
+        run_progress.benchmark_finished(return_code)
 
     except Exception as e:
         logging.error(f"执行bat文件时发生未知错误: {e}")
@@ -649,6 +731,7 @@ def parse_latency_matrix(matrix_lines: List[str]) -> Dict[str, Dict[str, float]]
             }
     return result
 
+@traced("aggregate")
 def calculate_phase_averages(phase_results: List[Dict[str, Any]]) -> Dict[str, Any]:
     """计算同一测试阶段多次实验的平均值"""
     if not phase_results or len(phase_results) == 0: